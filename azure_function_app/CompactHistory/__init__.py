@@ -0,0 +1,22 @@
+import os
+import json
+import logging
+import datetime
+
+import azure.functions as func
+from Shared.function_util import get_snapshot_history
+
+def main(timer: func.TimerRequest) -> None:
+    history = get_snapshot_history()
+    if history is None:
+        logging.info('HistoryFolder is not set, nothing to compact.')
+        return
+
+    # deltas older than HistoryMergeAfterDays are merged into daily ones, history older than HistoryRetentionDays is removed
+    now = datetime.datetime.utcnow()
+    merge_before = (now - datetime.timedelta(days=int(os.environ.get('HistoryMergeAfterDays', 30)))).isoformat()
+    retention = os.environ.get('HistoryRetentionDays')
+    drop_before = (now - datetime.timedelta(days=int(retention))).isoformat() if retention else None
+
+    counts = history.compact(merge_before, drop_before)
+    logging.info(f'History compacted: {json.dumps(counts)}')
@@ -1,33 +1,52 @@
 import logging
 import os
-import io
 import json
-import pandas as pd
-from csv_diff import load_csv, compare
+import tempfile
 
 import azure.functions as func
-from Shared.data_lake_util import list_and_sort_files, save_data, read_file
+from Shared.data_lake_util import list_and_sort_files, download_to_file, save_data, DataLakeFileWriter
+from Shared.snapshot_diff import diff_snapshots, write_diff_json, graph_diff
+from Shared.function_util import get_snapshot_catalog
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request.')
 
-    files = list_and_sort_files(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], os.environ['CSVDataFolder'])
+    # two latest snapshots are taken from the catalog, folder is listed only when snapshots were saved without catalog
+    entries = get_snapshot_catalog().latest(2)
+    if len(entries) == 2:
+        if entries[0]['sha256'] == entries[1]['sha256']:
+            return func.HttpResponse(json.dumps({"message": "Latest snapshots are identical, nothing to compare."}), status_code=200)
+        snapshots = [(entry['folder'], entry['file']) for entry in entries]
+    else:
+        files = list_and_sort_files(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], os.environ['CSVDataFolder'])
+        snapshots = [(os.environ['CSVDataFolder'], file_name) for file_name in files[:2]]
 
-    if len(files) <= 1:
+    if len(snapshots) <= 1:
         return func.HttpResponse(json.dumps({"message": "Not enough data to compare, nothing returned."}), status_code=200)
+    files = [os.path.splitext(file_name)[0] for _, file_name in snapshots]
     
-    # read two latest files
-    latest = read_file(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], os.environ['CSVDataFolder'], files[0]+'.csv')
-    previous = read_file(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], os.environ['CSVDataFolder'], files[1]+'.csv')
-    
-    # compare them
-    diff = compare(
-        load_csv(io.StringIO(pd.read_csv(latest, encoding = 'CP1250').to_csv(encoding = 'CP1250')), key='id'),
-        load_csv(io.StringIO(pd.read_csv(previous, encoding = 'CP1250').to_csv(encoding = 'CP1250')), key='id')
-    )
-    # save as json
-    diff_json = json.dumps(diff).encode('CP1250')
-    save_data(diff_json, os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], os.environ['ChangesDataFolder'],
-              files[0]+' VS ' + files[1] + '.json')
-
-    return func.HttpResponse(json.dumps({"message": "Data comparison successful, check ADLS."}), status_code=200)
\ No newline at end of file
+    # download two latest files range by range into temporary files, so neither is kept in memory
+    with tempfile.TemporaryDirectory() as directory:
+        latest, previous = os.path.join(directory, 'latest'), os.path.join(directory, 'previous')
+        download_to_file(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], *snapshots[0], latest)
+        download_to_file(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], *snapshots[1], previous)
+
+        # 'graph' mode reports only added and removed nodes and edges, 'rows' mode every changed value
+        mode = req.params.get('mode', os.environ.get('ChangesMode', 'rows'))
+        if mode == 'graph':
+            max_items = req.params.get('max_items', os.environ.get('ChangesMaxItems'))
+            diff = graph_diff(lambda: open(latest, 'rb'), lambda: open(previous, 'rb'), int(max_items) if max_items else None)
+            save_data(json.dumps(diff).encode(), os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'],
+                      os.environ['ChangesDataFolder'], files[0]+' VS ' + files[1] + ' graph.json')
+            return func.HttpResponse(json.dumps({"message": "Data comparison successful, check ADLS.", **diff['summary']}), status_code=200)
+
+        # compare them with streaming merge-join on (type, id), snapshots are not parsed into memory
+        columns, changes = diff_snapshots(lambda: open(latest, 'rb'), lambda: open(previous, 'rb'))
+
+        # save as json, written record by record
+        with DataLakeFileWriter(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], os.environ['ChangesDataFolder'],
+                                files[0]+' VS ' + files[1] + '.json') as output:
+            counts = write_diff_json(columns, changes, output)
+    logging.info(f'Changes: {json.dumps(counts)}')
+
+    return func.HttpResponse(json.dumps({"message": "Data comparison successful, check ADLS.", **counts}), status_code=200)
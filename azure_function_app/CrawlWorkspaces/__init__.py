@@ -0,0 +1,59 @@
+import os
+import json
+import logging
+
+from Shared.data_load_transform import download_workspaces, MAX_WORKERS
+from Shared.incremental_crawl import serialize_workspace_data, read_crawl_state, crawl_changed_workspaces
+from Shared.function_util import get_request_policy, get_function_client, log_run_metrics, get_partial_store, get_crawl_categories, \
+    get_workspace_state_store
+from Shared.run_metrics import RunMetrics
+
+
+
+def main(name: dict) -> list:
+    '''
+    Download data of a batch of workspaces and save it in the partial results folder of the orchestration run.
+    In incremental runs only workspaces changed since the previous run are downloaded, data of all workspaces is kept
+    in WorkspaceStateFolder and the partial results folder gets just "<workspace id>.state" (fingerprint, crawled or reused).
+
+    Parameters:
+        name (dict): {"run_id": orchestration instance id, "workspaces": list of workspace ids, "incremental": bool,
+                      "modified": ids of the workspaces changed since the previous incremental run, null when unknown}
+
+    Returns:
+        workspace_ids (list): ids of the saved workspaces
+    '''
+    store = get_partial_store(name['run_id'])
+    incremental = name.get('incremental', False)
+    # workspaces saved by previous attempt of this activity are not downloaded again
+    saved_file = '{}.state' if incremental else '{}.json'
+    workspace_ids = [workspace_id for workspace_id in name['workspaces'] if store.read(saved_file.format(workspace_id)) is None]
+    logging.info(f"Crawling {len(workspace_ids)} of {len(name['workspaces'])} workspaces")
+
+    max_workers = int(os.environ.get('MaxConcurrentRequests', MAX_WORKERS))
+    backend = os.environ.get('CrawlBackend', 'rest')
+    categories = get_crawl_categories()
+    policy = get_request_policy()
+    metrics = RunMetrics()
+    with get_function_client(policy, metrics) as pbi_client, metrics.stage('download'):
+        if incremental:
+            state_store = get_workspace_state_store()
+            state, _ = read_crawl_state(state_store, categories)
+            modified = set(name['modified']) if name.get('modified') is not None else None
+            fresh, _, fingerprints = crawl_changed_workspaces(pbi_client, workspace_ids, state_store, state, modified, max_workers, backend,
+                                                              categories)
+            metrics.count('workspaces_crawled', len(fresh))
+            metrics.count('workspaces_reused', len(workspace_ids) - len(fresh))
+        else:
+            workspaces_data = download_workspaces(pbi_client, workspace_ids, max_workers, backend, categories)
+    log_run_metrics(metrics, policy, pbi_client.scheduler)
+
+    if incremental:
+        # crawl state is saved by MergeDiagram from these files, after the diagram is saved
+        for workspace_id in workspace_ids:
+            store.write(f'{workspace_id}.state', json.dumps({'fingerprint': fingerprints[workspace_id],
+                                                             'crawled': workspace_id in fresh}).encode())
+    else:
+        for workspace_id, (data_dict, missing_cat) in zip(workspace_ids, workspaces_data):
+            store.write(f'{workspace_id}.json', serialize_workspace_data(data_dict, missing_cat))
+    return name['workspaces']
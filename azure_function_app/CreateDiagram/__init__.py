@@ -1,41 +1,38 @@
 import os
-import pandas as pd
 import json
-import logging
-import datetime
-
-from Shared.data_load_transform import get_app_token, execute_load_transform
-from Shared.drawio_spec import html_spec, drawio_spec
-from Shared.key_vault_util import get_secret_value
-from Shared.data_lake_util import get_directory_client, save_data, dataframe_to_csv_content
-
-
-
-def main(name: list) -> str:
-    user = get_secret_value('username')
-    pwd = get_secret_value('password')
-    client = get_secret_value('client-id')
-    tenant = get_secret_value('tenant-id')
-    ws_names = name
-
-    token = get_app_token(username=user, password=pwd, client_id=client, tenant_id=tenant)
-    
-    # create diagram df 
-    diagram_csv = execute_load_transform(token, ws_names)
-    
-    # add html variables
-    diagram_csv = pd.merge(diagram_csv, html_spec, on = 'type', how = 'left')
-
-    # convert df to bytes and save in ADLS
-    diagram_csv_bytes = dataframe_to_csv_content(diagram_csv, None)
-    save_data(diagram_csv_bytes, os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], os.environ['CSVDataFolder'],
-              datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M.csv"))
-
-    # convert text to bytes and save in ADLS
-    diagram_drawio = (drawio_spec + diagram_csv.to_csv(index = False, sep = ',', encoding = 'CP1250').replace('"""', '"')).encode()
-    save_data(diagram_drawio, os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], os.environ['DiagramDataFolder'],
-              datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M.txt"))
-
-    return 'OK'
-
 
+from Shared.data_load_transform import execute_load_graph, MAX_WORKERS
+from Shared.incremental_crawl import execute_incremental_load_graph
+from Shared.focused_crawl import execute_focused_load_graph, DEFAULT_HOPS
+from Shared.function_util import get_request_policy, get_function_client, log_run_metrics, save_diagram, get_crawl_categories, \
+    get_workspace_state_store
+from Shared.run_metrics import RunMetrics
+
+
+
+def main(name) -> str:
+    # list of workspace names, or {"workspaces": [...], "focus": [seed item ids], "hops": k} for diagram of the seeds' neighbourhood
+    config = name if isinstance(name, dict) else {'workspaces': name}
+    ws_names = config.get('workspaces') or []
+    focus = config.get('focus')
+    max_workers = int(os.environ.get('MaxConcurrentRequests', MAX_WORKERS))
+    backend = os.environ.get('CrawlBackend', 'rest')
+    categories = get_crawl_categories()
+    policy = get_request_policy()
+    metrics = RunMetrics()
+
+    # create diagram graph
+    with get_function_client(policy, metrics) as pbi_client:
+        if focus:
+            graph = execute_focused_load_graph(pbi_client, focus, int(config.get('hops', DEFAULT_HOPS)), ws_names, max_workers, categories)
+        elif os.environ.get('IncrementalCrawl', '').lower() == 'true':
+            graph = execute_incremental_load_graph(pbi_client, ws_names, get_workspace_state_store(), max_workers, backend, categories)
+        else:
+            graph = execute_load_graph(pbi_client, ws_names, max_workers, backend, categories)
+
+    # save CSV, TXT and .drawio outputs in ADLS
+    # focused diagram is not a snapshot of the tenant, it is saved without CSV, catalog and history
+    save_diagram(graph, metrics, snapshot = not focus)
+
+    # stage timings, per-endpoint request metrics and peak memory of the run, also written to the log
+    return json.dumps(log_run_metrics(metrics, policy, pbi_client.scheduler))
@@ -3,6 +3,8 @@ import logging
 import azure.functions as func
 import azure.durable_functions as df
 
+from Shared.function_util import get_orchestration_input
+
 
 async def main(req: func.HttpRequest, starter: str) -> func.HttpResponse:
     client = df.DurableOrchestrationClient(starter)
@@ -12,6 +14,11 @@ async def main(req: func.HttpRequest, starter: str) -> func.HttpResponse:
         request_body = req.get_json()
     except ValueError:
         return client._create_http_response(400, "Request does not contain JSON body")
+    if not isinstance(request_body, dict):
+        return client._create_http_response(400, "Request body has to be JSON object")
+
+    # app settings are resolved here and passed in the input, orchestrator must not read them while it is replayed
+    request_body = get_orchestration_input(request_body)
 
     instance_id = await client.start_new(req.route_params["functionName"], None, request_body)
 
@@ -0,0 +1,18 @@
+import json
+import logging
+
+import azure.functions as func
+from Shared.function_util import get_snapshot_history
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request.')
+
+    history = get_snapshot_history()
+    if history is None:
+        return func.HttpResponse(json.dumps({"message": "HistoryFolder is not set."}), status_code=400)
+    timestamp = req.params.get('at')
+    if not timestamp:
+        return func.HttpResponse(json.dumps({"message": "Pass time as 'at' parameter, for example ?at=2021-03-01T12:00."}), status_code=400)
+
+    # lineage as saved by the last run before given time, rebuilt from the nearest base and the deltas after it
+    return func.HttpResponse(history.snapshot_at(timestamp), mimetype='text/csv', status_code=200)
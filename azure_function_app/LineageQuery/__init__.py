@@ -0,0 +1,52 @@
+import io
+import os
+import json
+import logging
+
+import azure.functions as func
+from Shared.data_lake_util import read_file
+from Shared.function_util import get_snapshot_catalog
+from Shared.lineage_query import LineageIndex, DOWNSTREAM_DIRECTION
+from Shared.snapshot_diff import read_snapshot
+
+# index of the latest snapshot is kept between calls, it is rebuilt only when a new snapshot appears
+_cached = {}
+
+def get_lineage_index() -> LineageIndex:
+    entries = get_snapshot_catalog().latest(1)
+    if not entries:
+        return None
+    entry = entries[0]
+    if _cached.get('sha256') != entry['sha256']:
+        content = read_file(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], entry['folder'], entry['file'])
+        header, rows = read_snapshot(content, ['id', 'name', 'type', 'parent', 'relatives'])
+        positions = [header.index(column) for column in ['id', 'name', 'type', 'parent', 'relatives']]
+        index = LineageIndex.from_rows([row[position] for position in positions] for row in rows)
+        if os.environ.get('LineageClosure', '').lower() == 'true':
+            index.precompute_closure()
+        _cached.clear()
+        _cached.update({'sha256': entry['sha256'], 'index': index, 'snapshot': entry['file']})
+    return _cached['index']
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request.')
+
+    index = get_lineage_index()
+    if index is None:
+        return func.HttpResponse(json.dumps({"message": "No snapshot in the catalog, run CreateDiagram first."}), status_code=404)
+
+    # ?search=<text> finds resources by name or id, ?id=<id>&direction=downstream|upstream|both&depth=<k> queries lineage
+    if req.params.get('search'):
+        return func.HttpResponse(json.dumps({"snapshot": _cached['snapshot'], "resources": index.find(req.params['search'])}),
+                                 mimetype='application/json', status_code=200)
+    if not req.params.get('id'):
+        return func.HttpResponse(json.dumps({"message": "Pass resource 'id' (or 'search') parameter."}), status_code=400)
+
+    depth = req.params.get('depth')
+    try:
+        resources = index.query(req.params['id'], req.params.get('direction', DOWNSTREAM_DIRECTION), int(depth) if depth else None)
+    except KeyError as error:
+        return func.HttpResponse(json.dumps({"message": str(error.args[0])}), status_code=404)
+    except ValueError as error:
+        return func.HttpResponse(json.dumps({"message": str(error)}), status_code=400)
+    return func.HttpResponse(json.dumps({"snapshot": _cached['snapshot'], "resources": resources}), mimetype='application/json', status_code=200)
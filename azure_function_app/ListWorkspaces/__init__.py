@@ -0,0 +1,31 @@
+import os
+
+from Shared.data_load_transform import list_workspaces
+from Shared.incremental_crawl import read_crawl_state, get_modified_workspaces
+from Shared.function_util import get_request_policy, get_function_client, get_crawl_categories, get_workspace_state_store
+
+
+
+def main(name) -> list:
+    '''
+    Find workspaces with given names (all workspaces when the list is empty) and return their ids and names.
+
+    Parameters:
+        name (list or dict): list of workspace names, or {"workspaces": list of names, "incremental": true} - then records
+                             of the workspaces hold also "modified" flag (changed since the previous incremental run),
+                             when admin 'workspaces/modified' API tells it
+
+    Returns:
+        workspaces (list): {"id", "name"} records (with "modified" in incremental runs)
+    '''
+    config = name if isinstance(name, dict) else {'workspaces': name}
+    with get_function_client(get_request_policy()) as pbi_client:
+        selected_groups = list_workspaces(pbi_client, config.get('workspaces') or [], os.environ.get('CrawlBackend', 'rest'))
+        workspaces = selected_groups[['id', 'name']].to_dict('records')
+        if config.get('incremental'):
+            state, _ = read_crawl_state(get_workspace_state_store(), get_crawl_categories())
+            modified = get_modified_workspaces(pbi_client, state['last_run']) if 'last_run' in state else None
+            if modified is not None:
+                for workspace in workspaces:
+                    workspace['modified'] = workspace['id'] in modified
+    return workspaces
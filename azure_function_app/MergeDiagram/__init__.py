@@ -0,0 +1,49 @@
+import json
+import logging
+
+import pandas as pd
+
+from Shared.data_load_transform import build_lineage_graph
+from Shared.incremental_crawl import deserialize_workspace_data, read_crawl_state, write_crawl_state
+from Shared.function_util import get_partial_store, save_diagram, log_run_metrics, get_crawl_categories, get_workspace_state_store
+from Shared.run_metrics import RunMetrics
+
+
+
+def main(name: dict) -> str:
+    '''
+    Build one diagram from partial results saved by CrawlWorkspaces, save CSV, TXT and .drawio outputs in ADLS
+    and delete the partial results. In incremental runs workspace data is read from WorkspaceStateFolder and crawl state
+    for the next run is saved there once the diagram is saved.
+
+    Parameters:
+        name (dict): {"run_id": orchestration instance id, "workspaces": list of {"id", "name"} records from ListWorkspaces,
+                      "incremental": bool, "run_start": start time of the run (ISO format, UTC), needed in incremental runs}
+    '''
+    metrics = RunMetrics()
+    categories = get_crawl_categories()
+    store = get_partial_store(name['run_id'])
+    data_store = get_workspace_state_store() if name.get('incremental') else store
+    selected_groups = pd.DataFrame(name['workspaces'], columns = ['id', 'name'])
+    with metrics.stage('download'):
+        workspaces_data = [deserialize_workspace_data(data_store.read(f'{workspace_id}.json')) for workspace_id in selected_groups['id']]
+
+    save_diagram(build_lineage_graph(selected_groups, workspaces_data, metrics, categories), metrics)
+
+    if name.get('incremental'):
+        states = {workspace_id: json.loads(store.read(f'{workspace_id}.state')) for workspace_id in selected_groups['id']}
+        state, selected = read_crawl_state(data_store, categories)
+        fingerprints = {**state.get('fingerprints', {}), **{workspace_id: item['fingerprint'] for workspace_id, item in states.items()}}
+        crawled = sum(item['crawled'] for item in states.values())
+        write_crawl_state(data_store, name['run_start'], fingerprints, selected, crawled, len(states) - crawled)
+        metrics.count('workspaces_crawled', crawled)
+        metrics.count('workspaces_reused', len(states) - crawled)
+    log_run_metrics(metrics)
+
+    # partial results are needed only until the diagram is saved, failed cleanup doesn't fail the run
+    try:
+        store.clear()
+    except Exception:
+        logging.exception(f"Partial results of run {name['run_id']} were not deleted")
+
+    return 'OK'
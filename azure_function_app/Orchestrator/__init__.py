@@ -1,6 +1,5 @@
 import logging
 import json
-import os
 
 import azure.functions as func
 import azure.durable_functions as df
@@ -9,9 +8,55 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
     
     # get user input from http request
     json_config = context.get_input()
+    # settings are filled in by HttpStart (get_orchestration_input), orchestrator code is replayed and must not read the environment
+    batch_size = int(json_config.get('batch_size', 1))
+    parallelism = int(json_config.get('parallelism', 8))
+    # partial results are kept per run, passing run_id of failed run resumes it without downloading saved workspaces again
+    run_id = json_config.get('run_id', context.instance_id)
+    run_start = context.current_utc_datetime.replace(tzinfo=None).isoformat()
 
-    result = yield context.call_activity('CreateDiagram', json_config['workspaces'])
+    # every activity (so every batch of workspaces) is retried on its own
+    retry_options = df.RetryOptions(first_retry_interval_in_milliseconds=int(json_config.get('retry_interval', 30)) * 1000,
+                                    max_number_of_attempts=int(json_config.get('retry_attempts', 3)))
+
+    # with seed item ids in "focus", only their neighbourhood ("hops" from them) is crawled, in one activity
+    if json_config.get('focus'):
+        result = yield context.call_activity_with_retry('CreateDiagram', retry_options,
+                                                        {'workspaces': json_config.get('workspaces', []), 'focus': json_config['focus'],
+                                                         'hops': json_config.get('hops', 2)})
+        return [result]
+
+    # incremental runs download only workspaces changed since the previous one, the rest is reused from WorkspaceStateFolder
+    incremental = bool(json_config.get('incremental', False))
+    workspaces = yield context.call_activity_with_retry('ListWorkspaces', retry_options,
+                                                        {'workspaces': json_config['workspaces'], 'incremental': incremental})
+    workspace_ids = [workspace['id'] for workspace in workspaces]
+    batches = [workspace_ids[i:i + batch_size] for i in range(0, len(workspace_ids), batch_size)]
+    # "modified" flags are there only when admin API told which workspaces changed, otherwise fingerprints are compared
+    modified = {workspace['id'] for workspace in workspaces if workspace.get('modified')} \
+        if all('modified' in workspace for workspace in workspaces) else None
+
+    # fan out - at most `parallelism` activities run at the same time, the next batch starts as soon as any of them finishes
+    pending = []
+    for batch in batches:
+        if len(pending) >= parallelism:
+            finished = yield context.task_any(pending)
+            pending.remove(finished)
+            # task_any doesn't raise when one task failed (after all its retries), the run fails like with task_all
+            if isinstance(finished.result, Exception):
+                raise finished.result
+        crawl_input = {'run_id': run_id, 'workspaces': batch, 'incremental': incremental}
+        if incremental:
+            crawl_input['modified'] = None if modified is None else [workspace_id for workspace_id in batch if workspace_id in modified]
+        pending.append(context.call_activity_with_retry('CrawlWorkspaces', retry_options, crawl_input))
+    yield context.task_all(pending)
+
+    # fan in - build one diagram from all partial results
+    # start time of the run is replayed from history (current_utc_datetime), changes made after it are found by the next run
+    result = yield context.call_activity_with_retry('MergeDiagram', retry_options,
+                                                    {'run_id': run_id, 'workspaces': workspaces, 'incremental': incremental,
+                                                     'run_start': run_start})
 
     return [result]
 
-main = df.Orchestrator.create(orchestrator_function)
\ No newline at end of file
+main = df.Orchestrator.create(orchestrator_function)
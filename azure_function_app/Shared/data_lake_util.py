@@ -1,28 +1,129 @@
 import io
 import os
+import re
+import json
+import time
+import random
+import datetime
+import posixpath
+import hashlib
+import threading
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
 
-from azure.core.exceptions import ResourceExistsError
-from azure.storage.filedatalake import DataLakeDirectoryClient, DataLakeServiceClient
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.storage.filedatalake import DataLakeDirectoryClient, DataLakeServiceClient, FileSystemClient
+from Shared.local_data_lake import LocalDataLakeServiceClient
+from Shared.request_scheduler import LEASE_SECONDS
 
-def get_directory_client(connection_string: str, container_name: str, folder_name: str) -> DataLakeDirectoryClient:
-    try:
-        # create a Data Lake service client
-        datalake_service_client = DataLakeServiceClient.from_connection_string(connection_string)
-    except Exception:
-        print("Connection string either blank or malformed.")
-        raise
-    # create or get a container that will contain imported data
-    try:
-        filesystem_client = datalake_service_client.create_file_system(file_system=container_name)
-    except ResourceExistsError:
-        filesystem_client = datalake_service_client.get_file_system_client(container_name)
+LOCAL_PREFIX = 'file://'
+# CSV snapshots are named by UTC time of the run, see save_diagram of function_util
+SNAPSHOT_FILE_NAME = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2})\.csv')
+SNAPSHOT_TIME_FORMAT = '%Y-%m-%d %H:%M'
+# files bigger than CHUNK_SIZE are uploaded and downloaded in ranges, up to MAX_TRANSFER_THREADS at the same time
+CHUNK_SIZE = 4 * 1024 ** 2
+MAX_TRANSFER_THREADS = 4
+
+# stable schema of Parquet snapshots - ids without draw.io quotation marks, type as dictionary (categorical) column
+SNAPSHOT_SCHEMA = pa.schema([('id', pa.string()), ('name', pa.string()), ('type', pa.dictionary(pa.int8(), pa.string())),
+                             ('parent', pa.string()), ('relatives', pa.string()), ('access', pa.string())])
+
+# clients are created once per process and reused by all calls
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_service_client(connection_string: str) -> DataLakeServiceClient:
+    '''
+    Cached Data Lake service client. Connection string "file://<directory>" gives local stand-in keeping files in the directory.
+    '''
+    with _clients_lock:
+        if connection_string not in _clients:
+            if connection_string.startswith(LOCAL_PREFIX):
+                _clients[connection_string] = LocalDataLakeServiceClient(connection_string[len(LOCAL_PREFIX):])
+            else:
+                try:
+                    # create a Data Lake service client
+                    _clients[connection_string] = DataLakeServiceClient.from_connection_string(connection_string)
+                except Exception:
+                    print("Connection string either blank or malformed.")
+                    raise
+        return _clients[connection_string]
+
+def get_file_system_client(connection_string: str, container_name: str) -> FileSystemClient:
+    '''
+    Cached client of the container, the container is created when it doesn't exist (checked once per process).
+    '''
+    key = (connection_string, container_name)
+    if key not in _clients:
+        datalake_service_client = get_service_client(connection_string)
+        # create or get a container that will contain imported data
+        try:
+            filesystem_client = datalake_service_client.create_file_system(file_system=container_name)
+        except ResourceExistsError:
+            filesystem_client = datalake_service_client.get_file_system_client(container_name)
+        with _clients_lock:
+            _clients.setdefault(key, filesystem_client)
+    return _clients[key]
 
-    # create a directory inside the container
-    dir_client = filesystem_client.get_directory_client(folder_name)
-    dir_client.create_directory()
+def get_directory_client(connection_string: str, container_name: str, folder_name: str, create: bool = True) -> DataLakeDirectoryClient:
+    '''
+    Cached client of the folder. With create the folder is created (once per process) - it is needed only before writing.
+    '''
+    key = (connection_string, container_name, folder_name)
+    dir_client = _clients.get(key)
+    if dir_client is None:
+        dir_client = get_file_system_client(connection_string, container_name).get_directory_client(folder_name)
+        with _clients_lock:
+            _clients.setdefault(key, dir_client)
+    if create and key + ('created',) not in _clients:
+        # create a directory inside the container
+        dir_client.create_directory()
+        with _clients_lock:
+            _clients[key + ('created',)] = True
     return dir_client
 
+def clear_clients():
+    '''
+    Forget cached clients (for example after folders were removed outside of this process).
+    '''
+    with _clients_lock:
+        _clients.clear()
+
+def upload_bytes(file_client, data: bytes):
+    '''
+    Write data into created file. Big data is appended in CHUNK_SIZE ranges in parallel and committed with one flush.
+    '''
+    view = memoryview(data)
+    chunks = [(offset, view[offset:offset + CHUNK_SIZE]) for offset in range(0, len(data), CHUNK_SIZE)]
+    if len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(MAX_TRANSFER_THREADS, len(chunks))) as executor:
+            list(executor.map(lambda chunk: file_client.append_data(bytes(chunk[1]), chunk[0], len(chunk[1])), chunks))
+    elif chunks:
+        file_client.append_data(data, 0, len(data))
+    file_client.flush_data(len(data))
+
+def download_ranges(file_client, size: int):
+    '''
+    Iterate over content of the file in CHUNK_SIZE ranges, downloaded in parallel - at most MAX_TRANSFER_THREADS of them
+    are in memory at once.
+    '''
+    ranges = [(offset, min(CHUNK_SIZE, size - offset)) for offset in range(0, size, CHUNK_SIZE)]
+    if len(ranges) <= 1:
+        yield file_client.download_file().readall()
+        return
+    with ThreadPoolExecutor(max_workers=min(MAX_TRANSFER_THREADS, len(ranges))) as executor:
+        for start in range(0, len(ranges), MAX_TRANSFER_THREADS):
+            yield from executor.map(lambda chunk: file_client.download_file(offset=chunk[0], length=chunk[1]).readall(),
+                                    ranges[start:start + MAX_TRANSFER_THREADS])
+
+def download_bytes(file_client) -> bytes:
+    '''
+    Read the whole file, big files in CHUNK_SIZE ranges downloaded in parallel.
+    '''
+    return b''.join(download_ranges(file_client, file_client.get_file_properties().size))
+
 def dataframe_to_csv_content(data: pd.DataFrame, compression='gzip'):
     f = io.BytesIO()
     data.replace('"""', '"').to_csv(f, sep = ',', compression=compression, index = False, encoding = 'CP1250')
@@ -30,25 +131,243 @@ def dataframe_to_csv_content(data: pd.DataFrame, compression='gzip'):
     content = f.read()
     return content
 
+class ParquetSnapshotWriter:
+    '''
+    Streaming writer of compressed Parquet snapshot with SNAPSHOT_SCHEMA columns, fed by DiagramSink with batches
+    of sorted rows (OUTPUT_COLUMNS tuples) - every batch is written as one row group, so only one is kept in memory.
+
+    Parameters:
+        file: binary file object to write to (for example DataLakeFileWriter), it is not closed by the writer
+        compression (str): Parquet compression codec
+    '''
+
+    def __init__(self, file, compression: str = 'zstd'):
+        self.writer = pq.ParquetWriter(pa.PythonFile(file, mode='w'), SNAPSHOT_SCHEMA, compression=compression)
+
+    def write_rows(self, rows: list):
+        if not rows:
+            return
+        ids, names, types, *edges = zip(*rows)
+        columns = [[node_id.strip('"') for node_id in ids], [name if isinstance(name, str) else None for name in names], list(types)] + \
+                  [[value if isinstance(value, str) else None for value in values] for values in edges]
+        self.writer.write_batch(pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, SNAPSHOT_SCHEMA)],
+                                                schema=SNAPSHOT_SCHEMA))
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
 def save_data(data: bytes, connection_string: str, container_name: str, folder_name: str, file_name: str):
     dir_client = get_directory_client(connection_string, container_name, folder_name)
     # save data to Data Lake Storage
     file_client = dir_client.create_file(file_name)  # DataLakeFileClient
-    file_client.append_data(data, 0, len(data))
-    file_client.flush_data(len(data))
+    upload_bytes(file_client, data)
     return f"{folder_name}/{file_name}"
 
 def read_file(connection_string: str, container_name: str, folder_name: str, file_name: str) -> io.BytesIO:
-    dir_client = get_directory_client(connection_string, container_name, folder_name)
+    dir_client = get_directory_client(connection_string, container_name, folder_name, create=False)
     file_client = dir_client.get_file_client(file_name)  # DataLakeFileClient
-    download = file_client.download_file()
-    downloaded_contents = download.readall()
-    return io.BytesIO(downloaded_contents)
-
-def list_and_sort_files(connection_string: str, container_name: str, folder_name: str):
-    datalake_service_client = DataLakeServiceClient.from_connection_string(connection_string)
-    file_system_client = datalake_service_client.get_file_system_client(file_system=container_name)
-    paths = file_system_client.get_paths(path = folder_name)
-    files = [path.name[4:20] for path in paths]
-    files.sort(reverse=True)
-    return files
+    return io.BytesIO(download_bytes(file_client))
+
+def download_to_file(connection_string: str, container_name: str, folder_name: str, file_name: str, path: str) -> int:
+    '''
+    Download the file into local file at path range by range (see download_ranges), so big snapshots can be streamed
+    from disk without being kept in memory. Returns size of the file.
+    '''
+    dir_client = get_directory_client(connection_string, container_name, folder_name, create=False)
+    file_client = dir_client.get_file_client(file_name)
+    size = file_client.get_file_properties().size
+    with open(path, 'wb') as file:
+        for chunk in download_ranges(file_client, size):
+            file.write(chunk)
+    return size
+
+def append_data(data: bytes, connection_string: str, container_name: str, folder_name: str, file_name: str):
+    '''
+    Append data at the end of the file, the file is created when it doesn't exist.
+    '''
+    dir_client = get_directory_client(connection_string, container_name, folder_name)
+    file_client = dir_client.get_file_client(file_name)
+    try:
+        size = file_client.get_file_properties().size
+    except ResourceNotFoundError:
+        file_client = dir_client.create_file(file_name)
+        size = 0
+    file_client.append_data(data, size, len(data))
+    file_client.flush_data(size + len(data))
+    return f"{folder_name}/{file_name}"
+
+def delete_file(connection_string: str, container_name: str, folder_name: str, file_name: str):
+    dir_client = get_directory_client(connection_string, container_name, folder_name, create=False)
+    dir_client.get_file_client(file_name).delete_file()
+
+def delete_folder(connection_string: str, container_name: str, folder_name: str):
+    '''
+    Delete the folder with all its files.
+    '''
+    get_directory_client(connection_string, container_name, folder_name, create=False).delete_directory()
+    # folder is created again before the next write
+    with _clients_lock:
+        _clients.pop((connection_string, container_name, folder_name, 'created'), None)
+
+def list_and_sort_files(connection_string: str, container_name: str, folder_name: str) -> list:
+    '''
+    File names of CSV snapshots ("YYYY-MM-DD HH:MM.csv") directly in the folder, the newest first.
+    Files with other names and files of subfolders are skipped.
+    '''
+    file_system_client = get_file_system_client(connection_string, container_name)
+    snapshots = []
+    for path in file_system_client.get_paths(path = folder_name):
+        folder, file_name = posixpath.split(path.name)
+        match = SNAPSHOT_FILE_NAME.fullmatch(file_name)
+        if not match or folder != folder_name.strip('/'):
+            continue
+        try:
+            snapshots.append((datetime.datetime.strptime(match.group(1), SNAPSHOT_TIME_FORMAT), file_name))
+        except ValueError:
+            pass
+    snapshots.sort(reverse=True)
+    return [file_name for _, file_name in snapshots]
+
+class DataLakeFolderStore:
+    '''
+    Folder in Data Lake used as a simple key-value store (file name: bytes), for example for incremental crawl state.
+    '''
+
+    def __init__(self, connection_string: str, container_name: str, folder_name: str):
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self.folder_name = folder_name
+
+    def read(self, file_name: str) -> bytes:
+        try:
+            return read_file(self.connection_string, self.container_name, self.folder_name, file_name).getvalue()
+        except ResourceNotFoundError:
+            return None
+
+    def write(self, file_name: str, data: bytes):
+        save_data(data, self.connection_string, self.container_name, self.folder_name, file_name)
+
+    def append(self, file_name: str, data: bytes):
+        append_data(data, self.connection_string, self.container_name, self.folder_name, file_name)
+
+    def delete(self, file_name: str):
+        try:
+            delete_file(self.connection_string, self.container_name, self.folder_name, file_name)
+        except ResourceNotFoundError:
+            pass
+
+    def clear(self):
+        '''
+        Delete the folder with all files of the store.
+        '''
+        try:
+            delete_folder(self.connection_string, self.container_name, self.folder_name)
+        except ResourceNotFoundError:
+            pass
+
+class DataLakeFileWriter:
+    '''
+    Binary file-like object writing new Data Lake file in blocks, so big outputs don't have to be kept in memory.
+    Data is visible in the file after close. SHA-256 of the written content is computed on the way (sha256).
+    '''
+
+    def __init__(self, connection_string: str, container_name: str, folder_name: str, file_name: str, block_size: int = 4 * 1024 ** 2):
+        self.file_client = get_directory_client(connection_string, container_name, folder_name).create_file(file_name)
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.offset = 0
+        self.closed = False
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def write(self, data: bytes):
+        self.buffer += data
+        self._sha256.update(data)
+        if len(self.buffer) >= self.block_size:
+            self._append()
+        return len(data)
+
+    def _append(self):
+        if self.buffer:
+            self.file_client.append_data(bytes(self.buffer), self.offset, len(self.buffer))
+            self.offset += len(self.buffer)
+            self.buffer = bytearray()
+
+    def close(self):
+        if self.closed:
+            return
+        self._append()
+        self.file_client.flush_data(self.offset)
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class DataLakeLeaseStore:
+    '''
+    JSON state kept in one Data Lake file and changed under the lease of the file, so processes on different hosts
+    (for example durable activities sharing RequestScheduler budget) read and write it one at a time.
+    With "file://" connection string the lease is a lock file of the local stand-in.
+
+    Parameters:
+        lease_seconds (int): lease duration (15-60 seconds), lease of a crashed holder expires after it
+        timeout (float): seconds to wait for the lease before TimeoutError is raised
+    '''
+
+    def __init__(self, connection_string: str, container_name: str, folder_name: str, file_name: str,
+                 lease_seconds: int = LEASE_SECONDS, timeout: float = 60.0):
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self.folder_name = folder_name
+        self.file_name = file_name
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+
+    def update(self, function):
+        '''
+        Call function with the state dictionary (changed in place) under the lease, save the state and return function result.
+        '''
+        dir_client = get_directory_client(self.connection_string, self.container_name, self.folder_name)
+        file_client = dir_client.get_file_client(self.file_name)
+        lease = self._acquire_lease(dir_client, file_client)
+        try:
+            content = download_bytes(file_client)
+            state = json.loads(content) if content else {}
+            result = function(state)
+            file_client.upload_data(json.dumps(state).encode(), overwrite=True, lease=lease)
+            return result
+        finally:
+            lease.release()
+
+    def _acquire_lease(self, dir_client, file_client):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return file_client.acquire_lease(lease_duration=self.lease_seconds)
+            except ResourceNotFoundError:
+                # created only when still missing - plain create would overwrite the state other process has just written
+                try:
+                    dir_client.create_file(self.file_name, if_none_match='*')
+                except (ResourceExistsError, ResourceModifiedError):
+                    # created by other process in the meantime
+                    pass
+                continue
+            except HttpResponseError as error:
+                # 409 - the lease is held by other process
+                if not isinstance(error, ResourceExistsError) and error.status_code != 409:
+                    raise
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'Lease of {self.folder_name}/{self.file_name} not acquired in {self.timeout} seconds')
+            time.sleep(random.uniform(0.02, 0.1))
@@ -0,0 +1,98 @@
+import io
+import csv
+import hashlib
+
+from Shared.drawio_spec import drawio_spec, html_spec
+from Shared.external_sort import ExternalSorter, SORT_CHUNK_ROWS
+from Shared.lineage_graph import OUTPUT_COLUMNS, row_key
+
+# rows encoded and written at once
+WRITE_BATCH_ROWS = 10000
+# relationships CSV is CP1250 encoded like the snapshots, draw.io TXT input UTF-8
+CSV_ENCODING = 'CP1250'
+TXT_ENCODING = 'utf-8'
+SPEC_COLUMNS = ['fill', 'image']
+
+class DiagramSink:
+    '''
+    Streaming writer of the diagram outputs: relationships CSV (OUTPUT_COLUMNS with fill and image of html_spec,
+    like drawio_relationships.csv and snapshots) and TXT input of draw.io CSV import (drawio_spec followed by the same rows).
+    Rows may come in any order and in any number of batches (for example workspace by workspace). They are sorted by type
+    and id with external sort - at most chunk_rows stay in memory - and on close merged, deduplicated (first row of every
+    key wins) and written in batches, to local files or DataLakeFileWriter (chunked appends).
+
+    Parameters:
+        csv_file: binary file object for relationships CSV, None to skip it
+        txt_file: binary file object for draw.io TXT input, None to skip it
+        chunk_rows (int): rows kept in memory while sorting
+        row_writers (list): other outputs with write_rows(rows) method, given the same batches of sorted rows
+                            (OUTPUT_COLUMNS tuples, without html variables) - for example ParquetSnapshotWriter of data_lake_util
+    '''
+
+    def __init__(self, csv_file = None, txt_file = None, chunk_rows: int = SORT_CHUNK_ROWS, row_writers: list = None):
+        self.csv_file = csv_file
+        self.txt_file = txt_file
+        self.row_writers = row_writers or []
+        self.sorter = ExternalSorter(row_key, chunk_rows)
+        self.specs = {node_type: tuple('' if not isinstance(value, str) else value for value in values)
+                      for node_type, *values in html_spec[['type'] + SPEC_COLUMNS].itertuples(index = False, name = None)}
+        self.rows = {}
+        self.bytes = {'csv': 0, 'txt': 0}
+        self._sha256 = hashlib.sha256()
+
+    def write_rows(self, rows):
+        '''
+        Add rows (OUTPUT_COLUMNS tuples) to the outputs.
+        '''
+        self.sorter.add(rows)
+
+    @property
+    def csv_sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def close(self) -> dict:
+        '''
+        Write all rows into the outputs (files themselves are not closed).
+
+        Returns:
+            rows (dict): number of written rows of every type
+        '''
+        self._write('txt', drawio_spec)
+        self._write_text([OUTPUT_COLUMNS + SPEC_COLUMNS])
+        batch = []
+        for row in self.sorter.sorted_rows(unique = True):
+            self.rows[row[2]] = self.rows.get(row[2], 0) + 1
+            batch.append(row)
+            if len(batch) >= WRITE_BATCH_ROWS:
+                self._write_batch(batch)
+                batch = []
+        self._write_batch(batch)
+        return self.rows
+
+    def _write_batch(self, rows: list):
+        if not rows:
+            return
+        for writer in self.row_writers:
+            writer.write_rows(rows)
+        self._write_text([tuple('' if value is None or isinstance(value, float) else value for value in row) + self.specs.get(row[2], ('', ''))
+                          for row in rows])
+
+    def _write_text(self, rows: list):
+        if self.csv_file is None and self.txt_file is None:
+            return
+        text = io.StringIO()
+        csv.writer(text, lineterminator = '\n').writerows(rows)
+        text = text.getvalue()
+        self._write('csv', text)
+        # TXT input keeps ids in single quotation marks, in CSV they are escaped by doubling
+        self._write('txt', text.replace('"""', '"'))
+
+    def _write(self, output: str, text: str):
+        file = self.csv_file if output == 'csv' else self.txt_file
+        if file is None:
+            return
+        content = text.encode(CSV_ENCODING if output == 'csv' else TXT_ENCODING, errors = 'replace')
+        file.write(content)
+        self.bytes[output] += len(content)
+        if output == 'csv':
+            self._sha256.update(content)
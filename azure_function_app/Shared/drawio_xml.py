@@ -0,0 +1,417 @@
+import io
+import base64
+import hashlib
+import html
+import zlib
+from functools import lru_cache
+import xml.etree.ElementTree as ET
+from urllib.parse import quote
+
+from Shared.lineage_graph import LineageGraph, PARENT
+from Shared.drawio_spec import html_spec
+
+NODE_WIDTH = 160
+NODE_HEIGHT = 60
+NODE_SPACING = 40
+LAYER_SPACING = 120
+# long layers are wrapped into rows of this many nodes, so the diagram doesn't get extremely wide
+MAX_ROW_NODES = 50
+# default limit of resources on one page of sharded diagram
+MAX_PAGE_NODES = 500
+# nodes of these types are shared by many workspaces, they are repeated on every page using them instead of linking
+SHARED_TYPES = ('users', 'dataflows_datasources', 'datasets_datasources')
+
+NODE_STYLE = 'label;image={image};whiteSpace=wrap;html=1;rounded=1;fillColor={fill};horizontal=1;'
+PARENT_EDGE_STYLE = 'curved=1;endArrow=none;endFill=1;fontSize=11;'
+RELATIVE_EDGE_STYLE = 'curved=1;fontSize=11;dashed=1;endArrow=none;'
+LINK_STYLE = 'rounded=1;whiteSpace=wrap;html=1;dashed=1;fillColor=#f5f5f5;fontColor=#333333;strokeColor=#666666;'
+
+def layered_layout(graph: LineageGraph, nodes: list = None, sweeps: int = 4, edges: list = None) -> dict:
+    '''
+    Compute Sugiyama-style layered layout: nodes are put into layers by longest path over parent edges
+    (parents above their children), then order of nodes within layers is improved with barycenter sweeps.
+    Runs in O((nodes + edges) * sweeps) time, so it handles tens of thousands of nodes.
+
+    Parameters:
+        graph (LineageGraph): graph to lay out
+        nodes (list): indexes of nodes to lay out, all typed nodes of the graph when missing
+        sweeps (int): number of ordering sweeps (alternately downwards and upwards)
+        edges (list): (source, target) pairs of parent edges to lay out by, all parent edges of the graph when missing
+
+    Returns:
+        positions (dict): node index: (x, y) of the top-left corner
+    '''
+    if nodes is None:
+        nodes = [index for index, _ in graph.typed_nodes()]
+    if edges is None:
+        edges = [(src, dst) for src, dst, _ in graph.edges(PARENT)]
+    selected = set(nodes)
+
+    parents = {index: [] for index in nodes}
+    children = {index: [] for index in nodes}
+    for src, dst in edges:
+        if src in selected and dst in selected and src != dst:
+            parents[src].append(dst)
+            children[dst].append(src)
+
+    # longest path layering (Kahn's algorithm), nodes left in cycles are put below their placed parents
+    layer = {}
+    pending = {index: len(parents[index]) for index in nodes}
+    queue = [index for index in nodes if pending[index] == 0]
+    for index in queue:
+        layer[index] = max((layer[parent] + 1 for parent in parents[index]), default=0)
+        for child in children[index]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                queue.append(child)
+    for index in nodes:
+        if index not in layer:
+            layer[index] = max((layer[parent] + 1 for parent in parents[index] if parent in layer), default=0)
+
+    layers = [[] for _ in range(max(layer.values(), default=-1) + 1)]
+    for index in nodes:
+        layers[layer[index]].append(index)
+
+    # barycenter ordering - node goes to the average position of its neighbours in the previous layer
+    position = {}
+    for nodes_in_layer in layers:
+        for order, index in enumerate(nodes_in_layer):
+            position[index] = order
+    for sweep in range(sweeps):
+        downwards = sweep % 2 == 0
+        neighbours = parents if downwards else children
+        for nodes_in_layer in (layers[1:] if downwards else reversed(layers[:-1])):
+            def barycenter(index):
+                linked = [position[neighbour] for neighbour in neighbours[index]]
+                return sum(linked) / len(linked) if linked else position[index]
+            nodes_in_layer.sort(key=barycenter)
+            for order, index in enumerate(nodes_in_layer):
+                position[index] = order
+
+    positions = {}
+    y = 0
+    for nodes_in_layer in layers:
+        for order, index in enumerate(nodes_in_layer):
+            row, column = divmod(order, MAX_ROW_NODES)
+            positions[index] = (column * (NODE_WIDTH + NODE_SPACING), y + row * (NODE_HEIGHT + NODE_SPACING))
+        rows = max(1, -(-len(nodes_in_layer) // MAX_ROW_NODES))
+        y += rows * (NODE_HEIGHT + NODE_SPACING) - NODE_SPACING + LAYER_SPACING
+
+    return positions
+
+@lru_cache(maxsize=None)
+def node_style(node_type: str) -> str:
+    '''
+    Style of the node, with colour and icon of its type taken from html_spec (computed once per type, not per page).
+    '''
+    spec = html_spec[html_spec['type'] == node_type]
+    fill, image = '#ffffff', ''
+    if not spec.empty:
+        fill = spec['fill'].iloc[0] if isinstance(spec['fill'].iloc[0], str) else fill
+        image = spec['image'].iloc[0] if isinstance(spec['image'].iloc[0], str) else image
+    return NODE_STYLE.format(image=image, fill=fill)
+
+def diagram_cells(graph: LineageGraph, positions: dict, extra_cells: list = None, edges: list = None) -> ET.Element:
+    '''
+    Create mxGraphModel element with node cells at the given positions and edges between them.
+
+    Parameters:
+        graph (LineageGraph): graph to draw
+        positions (dict): node index: (x, y), only these nodes are drawn
+        extra_cells (list): additional mxCell elements appended at the end (for example links to other pages)
+        edges (list): (edge number, source, target, edge type) tuples to draw from, all edges of the graph when missing
+    '''
+    model = ET.Element('mxGraphModel', {'grid': '1', 'gridSize': '10', 'guides': '1', 'tooltips': '1', 'connect': '1',
+                                         'arrows': '1', 'fold': '1', 'page': '0', 'pageScale': '1', 'math': '0', 'shadow': '0'})
+    root = ET.SubElement(model, 'root')
+    ET.SubElement(root, 'mxCell', {'id': '0'})
+    ET.SubElement(root, 'mxCell', {'id': '1', 'parent': '0'})
+
+    styles = {}
+    for index, (x, y) in positions.items():
+        node = graph.nodes[index]
+        if node.type not in styles:
+            styles[node.type] = node_style(node.type)
+        name = node.name if isinstance(node.name, str) else node.id
+        cell = ET.SubElement(root, 'mxCell', {'id': f'n{index}', 'value': f'{html.escape(name)}<br><i>{node.type}</i>',
+                                              'style': styles[node.type], 'vertex': '1', 'parent': '1'})
+        ET.SubElement(cell, 'mxGeometry', {'x': str(x), 'y': str(y), 'width': str(NODE_WIDTH), 'height': str(NODE_HEIGHT),
+                                           'as': 'geometry'})
+
+    if edges is None:
+        edges = ((number, src, dst, kind) for number, (src, dst, kind) in enumerate(graph.edges()))
+    for number, src, dst, kind in edges:
+        if src in positions and dst in positions:
+            root.append(edge_cell(f'e{number}', f'n{src}', f'n{dst}', kind, graph.edge_labels.get(number)))
+
+    for cell in extra_cells or []:
+        root.append(cell)
+
+    return model
+
+def edge_cell(cell_id: str, src_cell: str, dst_cell: str, kind: int, label: str = None) -> ET.Element:
+    '''
+    Edge between cells of the resource (src_cell) and its parent or relative (dst_cell), label is shown on the edge.
+    '''
+    # parent edges are drawn from the parent to the resource, as draw.io CSV import does with "invert": true
+    source, target, style = (dst_cell, src_cell, PARENT_EDGE_STYLE) if kind == PARENT else (src_cell, dst_cell, RELATIVE_EDGE_STYLE)
+    attributes = {'id': cell_id} if label is None else {'id': cell_id, 'value': html.escape(label)}
+    cell = ET.Element('mxCell', dict(attributes, style=style, edge='1', parent='1', source=source, target=target))
+    ET.SubElement(cell, 'mxGeometry', {'relative': '1', 'as': 'geometry'})
+    return cell
+
+def compress_diagram(model: ET.Element) -> str:
+    '''
+    Compress mxGraphModel the way draw.io does: URL-encode, raw deflate and base64.
+    '''
+    xml = ET.tostring(model, encoding='unicode')
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    deflated = compressor.compress(quote(xml, safe="~()*!.'").encode()) + compressor.flush()
+    return base64.b64encode(deflated).decode()
+
+def write_drawio(file, pages, compressed: bool = False):
+    '''
+    Write .drawio file content of the pages into binary file object page by page - when pages come from a generator
+    (like sharded_diagrams), only one page is kept in memory.
+
+    Parameters:
+        file: binary file object (local file or DataLakeFileWriter)
+        pages (iterable): (page id, page name, mxGraphModel element) tuples
+        compressed (bool): store pages deflate-compressed (smaller file, draw.io opens both)
+    '''
+    file.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+    file.write(f'<mxfile host="pbi_drawio_graph_automation" compressed="{"true" if compressed else "false"}">'.encode())
+    for page_id, page_name, model in pages:
+        diagram = ET.Element('diagram', {'id': page_id, 'name': page_name})
+        if compressed:
+            diagram.text = compress_diagram(model)
+        else:
+            diagram.append(model)
+        file.write(ET.tostring(diagram, encoding='utf-8'))
+    file.write(b'</mxfile>')
+
+def pages_to_drawio(pages: list, compressed: bool = False) -> bytes:
+    '''
+    Create .drawio file content of the pages, see write_drawio.
+
+    Returns:
+        content (bytes): .drawio file content
+    '''
+    output = io.BytesIO()
+    write_drawio(output, pages, compressed)
+    return output.getvalue()
+
+def page_id(key: str) -> str:
+    '''
+    Stable page id, so links to a page keep working when it is regenerated.
+    '''
+    return 'p-' + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def bfs_chunks(nodes: list, neighbours: dict, max_nodes: int) -> list:
+    '''
+    Split nodes into chunks of at most max_nodes, visiting them breadth-first, so connected resources stay together.
+    '''
+    chunks, chunk, seen = [], [], set()
+    for start in nodes:
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = [start]
+        for index in queue:
+            chunk.append(index)
+            if len(chunk) == max_nodes:
+                chunks.append(chunk)
+                chunk = []
+            for neighbour in neighbours[index]:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def shard_graph(graph: LineageGraph, shard_by: str = 'workspace', max_nodes: int = MAX_PAGE_NODES) -> list:
+    '''
+    Split nodes of the graph into pages. Users and datasources (SHARED_TYPES) are not assigned to any page,
+    they are repeated on pages of the resources using them.
+
+    Parameters:
+        graph (LineageGraph): graph to split
+        shard_by (str): 'workspace' - one page per workspace, 'component' - connected components packed into pages
+        max_nodes (int): maximal number of resources on a page, bigger workspaces or components are split into several pages
+
+    Returns:
+        pages (list): (page id, page name, node indexes) tuples
+    '''
+    owned = [index for index, node in graph.typed_nodes() if node.type not in SHARED_TYPES]
+    selected = set(owned)
+    neighbours = {index: [] for index in owned}
+    for src, dst, kind in graph.edges():
+        if src in selected and dst in selected and src != dst:
+            neighbours[src].append(dst)
+            neighbours[dst].append(src)
+
+    pages = []
+    if shard_by == 'workspace':
+        workspaces = {}
+        for index in owned:
+            workspaces.setdefault(graph.nodes[index].workspace, []).append(index)
+        for workspace_id, nodes in workspaces.items():
+            workspace = graph.get(workspace_id) if workspace_id is not None else None
+            name = workspace.name if workspace is not None and isinstance(workspace.name, str) else str(workspace_id)
+            # workspace node goes first, so it ends up on the first page of the workspace
+            nodes.sort(key = lambda index: graph.nodes[index].type != 'workspaces')
+            local = {index: [neighbour for neighbour in neighbours[index] if graph.nodes[neighbour].workspace == workspace_id]
+                     for index in nodes}
+            for number, chunk in enumerate(bfs_chunks(nodes, local, max_nodes)):
+                key = f'{workspace_id}:{number}'
+                pages.append((page_id(key), name if number == 0 else f'{name} ({number + 1})', chunk))
+    elif shard_by == 'component':
+        components = []
+        seen = set()
+        for start in owned:
+            if start not in seen:
+                component = bfs_chunks([start], neighbours, len(owned))[0]
+                seen.update(component)
+                components.append(component)
+        # big components are split, small ones packed together (first fit decreasing)
+        bins = []
+        for component in sorted(components, key = len, reverse = True):
+            if len(component) >= max_nodes:
+                bins.extend(bfs_chunks(component, neighbours, max_nodes))
+                continue
+            for page in bins:
+                if len(page) + len(component) <= max_nodes:
+                    page.extend(component)
+                    break
+            else:
+                bins.append(list(component))
+        for number, nodes in enumerate(bins):
+            key = min(graph.nodes[index].id for index in nodes)
+            pages.append((page_id(key), f'Cluster {number + 1}', nodes))
+    else:
+        raise ValueError(f'Unknown shard_by value: {shard_by}')
+    return pages
+
+def page_edges(graph: LineageGraph, node_pages: dict) -> tuple:
+    '''
+    Bucket edges of the graph by pages in one pass, so every page reads only its own edges.
+
+    Parameters:
+        graph (LineageGraph): whole graph
+        node_pages (dict): node index: page id, for resources of all pages
+
+    Returns:
+        edges (dict): page id: (edge number, source, target, edge type) tuples of the edges with a resource of the page
+        shared_edges (dict): node index: the same tuples of edges between two shared nodes (SHARED_TYPES)
+    '''
+    edges, shared_edges = {}, {}
+    for number, (src, dst, kind) in enumerate(graph.edges()):
+        edge = (number, src, dst, kind)
+        src_page, dst_page = node_pages.get(src), node_pages.get(dst)
+        if src_page is not None:
+            edges.setdefault(src_page, []).append(edge)
+        if dst_page is not None and dst_page != src_page:
+            edges.setdefault(dst_page, []).append(edge)
+        if src_page is None and dst_page is None and graph.nodes[src].type in SHARED_TYPES and graph.nodes[dst].type in SHARED_TYPES:
+            shared_edges.setdefault(src, []).append(edge)
+            shared_edges.setdefault(dst, []).append(edge)
+    return edges, shared_edges
+
+def page_diagram(graph: LineageGraph, nodes: list, node_pages: dict, page_names: dict, edges: list,
+                 shared_edges: dict) -> ET.Element:
+    '''
+    Create mxGraphModel of one page. Edges to resources on other pages end in link stubs, which open the other page when clicked.
+
+    Parameters:
+        graph (LineageGraph): whole graph
+        nodes (list): indexes of resources of the page
+        node_pages (dict): node index: page id, for resources of all pages
+        page_names (dict): page id: page name
+        edges (list): edges with a resource of the page, as page_edges returns them
+        shared_edges (dict): edges between shared nodes, as page_edges returns them
+    '''
+    local = set(nodes)
+    shared = set()
+    remote = {}
+    local_edges = []
+    remote_edges = []
+    for number, src, dst, kind in edges:
+        if src in local and dst in local:
+            local_edges.append((number, src, dst, kind))
+            continue
+        other = dst if src in local else src
+        if graph.nodes[other].type in SHARED_TYPES:
+            shared.add(other)
+            local_edges.append((number, src, dst, kind))
+        elif other in node_pages:
+            remote.setdefault(other, node_pages[other])
+            remote_edges.append((number, src, dst, kind))
+
+    # edges between shared nodes are drawn on every page showing both of them
+    extra = {edge for index in shared for edge in shared_edges.get(index, []) if edge[1] in shared and edge[2] in shared}
+    if extra:
+        local_edges = sorted(local_edges + list(extra))
+
+    positions = layered_layout(graph, nodes + sorted(shared), edges = [(src, dst) for _, src, dst, kind in local_edges if kind == PARENT])
+    bottom = max((y for _, y in positions.values()), default=-NODE_HEIGHT - LAYER_SPACING) + NODE_HEIGHT + LAYER_SPACING
+
+    # link stubs are put in rows below the page diagram
+    cells = []
+    for order, index in enumerate(sorted(remote, key = lambda index: (remote[index], index))):
+        node = graph.nodes[index]
+        row, column = divmod(order, MAX_ROW_NODES)
+        name = node.name if isinstance(node.name, str) else node.id
+        label = f'{html.escape(name)}<br><i>{node.type} on page {html.escape(page_names[remote[index]])}</i>'
+        stub = ET.Element('UserObject', {'id': f'l{index}', 'label': label, 'link': f'data:page/id,{remote[index]}'})
+        cell = ET.SubElement(stub, 'mxCell', {'style': LINK_STYLE, 'vertex': '1', 'parent': '1'})
+        ET.SubElement(cell, 'mxGeometry', {'x': str(column * (NODE_WIDTH + NODE_SPACING)),
+                                           'y': str(bottom + row * (NODE_HEIGHT + NODE_SPACING)),
+                                           'width': str(NODE_WIDTH), 'height': str(NODE_HEIGHT), 'as': 'geometry'})
+        cells.append(stub)
+    for number, src, dst, kind in remote_edges:
+        src_cell = f'n{src}' if src in local else f'l{src}'
+        dst_cell = f'n{dst}' if dst in local else f'l{dst}'
+        cells.append(edge_cell(f'e{number}', src_cell, dst_cell, kind, graph.edge_labels.get(number)))
+
+    return diagram_cells(graph, positions, cells, local_edges)
+
+def sharded_diagrams(graph: LineageGraph, shard_by: str = 'workspace', max_nodes: int = MAX_PAGE_NODES,
+                     page_ids: list = None):
+    '''
+    Split the graph into pages (see shard_graph) and create their diagrams one by one.
+    Page ids don't change between runs, so a subset of pages can be regenerated with page_ids.
+
+    Returns:
+        pages (iterator): (page id, page name, mxGraphModel element) tuples, ready for write_drawio
+    '''
+    pages = shard_graph(graph, shard_by, max_nodes)
+    node_pages = {index: page for page, _, nodes in pages for index in nodes}
+    page_names = {page: name for page, name, _ in pages}
+    edges, shared_edges = page_edges(graph, node_pages)
+    for page, name, nodes in pages:
+        if page_ids is None or page in page_ids:
+            yield page, name, page_diagram(graph, nodes, node_pages, page_names, edges.get(page, []), shared_edges)
+
+def write_graph_drawio(file, graph: LineageGraph, compressed: bool = False, page_name: str = 'Lineage', shard_by: str = None,
+                       max_page_nodes: int = MAX_PAGE_NODES):
+    '''
+    Write .drawio file with node positions already computed, so draw.io doesn't need to lay the diagram out when opening it.
+    The whole graph is put on one page, unless shard_by ('workspace' or 'component') is given - then every workspace
+    or group of connected resources gets its own page, with at most max_page_nodes resources.
+    Pages are built and written one at a time, so sharded diagram keeps only one page in memory; one-page diagram
+    is built whole.
+    '''
+    if shard_by:
+        write_drawio(file, sharded_diagrams(graph, shard_by, max_page_nodes), compressed)
+    else:
+        write_drawio(file, [('lineage', page_name, diagram_cells(graph, layered_layout(graph)))], compressed)
+
+def graph_to_drawio(graph: LineageGraph, compressed: bool = False, page_name: str = 'Lineage', shard_by: str = None,
+                    max_page_nodes: int = MAX_PAGE_NODES) -> bytes:
+    '''
+    Create .drawio file content of the graph, see write_graph_drawio.
+    '''
+    output = io.BytesIO()
+    write_graph_drawio(output, graph, compressed, page_name, shard_by, max_page_nodes)
+    return output.getvalue()
@@ -0,0 +1,76 @@
+import heapq
+import pickle
+import tempfile
+
+# rows kept in memory at once, sorted chunks of this size are written to temporary files
+SORT_CHUNK_ROWS = 200000
+
+def dump_chunk(rows: list):
+    chunk = tempfile.TemporaryFile()
+    for row in rows:
+        pickle.dump(row, chunk, pickle.HIGHEST_PROTOCOL)
+    chunk.seek(0)
+    return chunk
+
+def load_chunk(chunk):
+    while True:
+        try:
+            yield pickle.load(chunk)
+        except EOFError:
+            chunk.close()
+            return
+
+class ExternalSorter:
+    '''
+    Collects rows of any count in batches and returns them sorted, keeping at most chunk_rows of them in memory -
+    sorted chunks are written to temporary files and merged back by sorted_rows.
+
+    Parameters:
+        key (function): sort key of a row
+        chunk_rows (int): rows kept in memory
+    '''
+
+    def __init__(self, key, chunk_rows: int = SORT_CHUNK_ROWS):
+        self.key = key
+        self.chunk_rows = chunk_rows
+        self.chunks = []
+        self.buffer = []
+
+    def add(self, rows):
+        for row in rows:
+            self.buffer.append(row)
+            if len(self.buffer) >= self.chunk_rows:
+                self.buffer.sort(key = self.key)
+                self.chunks.append(dump_chunk(self.buffer))
+                self.buffer = []
+
+    def sorted_rows(self, unique: bool = False):
+        '''
+        Iterate over all added rows in key order (stable, so rows with equal keys keep order in which they were added).
+        With unique only the first row of every key is returned.
+        '''
+        self.buffer.sort(key = self.key)
+        if self.chunks:
+            self.chunks.append(dump_chunk(self.buffer))
+            rows = heapq.merge(*[load_chunk(chunk) for chunk in self.chunks], key = self.key)
+        else:
+            rows = iter(self.buffer)
+        self.chunks, self.buffer = [], []
+        if not unique:
+            yield from rows
+            return
+        previous = object()
+        for row in rows:
+            current = self.key(row)
+            if current != previous:
+                previous = current
+                yield row
+
+def external_sort(rows, key, chunk_rows: int = SORT_CHUNK_ROWS):
+    '''
+    Sort rows of any size keeping at most chunk_rows of them in memory - sorted chunks are written to temporary files
+    and merged back.
+    '''
+    sorter = ExternalSorter(key, chunk_rows)
+    sorter.add(rows)
+    yield from sorter.sorted_rows()
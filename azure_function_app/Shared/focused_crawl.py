@@ -0,0 +1,244 @@
+import pandas as pd
+
+from Shared.pbi_client import PowerBIClient
+from Shared.data_load_transform import MAX_WORKERS, FETCH_CATEGORIES, list_workspaces, download_content_df, fetch_concurrently, merge_specific_content, \
+                                       build_lineage_graph, get_column, is_id
+from Shared.lineage_graph import LineageGraph
+
+# categories lineage is followed through, users of their workspaces and their datasources are added around them
+ITEM_CATEGORIES = ['dataflows', 'datasets', 'reports', 'dashboards']
+DEFAULT_HOPS = 2
+
+class FocusedCrawl:
+    '''
+    Lazy crawl of the neighbourhood of seed items (dataflows, datasets, reports, dashboards) up to given number of hops.
+    Lineage is followed in both directions: dataset - dataflows it is loaded from (also in other workspaces),
+    report - its dataset (also in other workspace), dashboard - reports and datasets of its tiles, and back. Links back
+    (reports of a dataset, datasets of a dataflow, dashboards of a report) are looked for in the workspaces of the items
+    reached so far.
+    Every API call is made at most once and only when the next hop needs it, calls of one hop are made in parallel.
+    Lineage is followed through all item categories, the selected categories limit only what workspaces_data returns
+    (datasources are not downloaded at all when they are not selected).
+
+    Parameters:
+        client (PowerBIClient): client allowing connection to PBI Service API
+        workspaces (pd.DataFrame): workspaces (id and name columns) searched for seeds given without workspace
+        max_workers (int): maximal number of calls running at the same time
+        categories (list): FETCH_CATEGORIES to return, all when missing
+    '''
+
+    def __init__(self, client: PowerBIClient, workspaces: pd.DataFrame, max_workers: int = MAX_WORKERS, categories: list = None):
+        self.client = client
+        self.workspaces = workspaces
+        self.max_workers = max_workers
+        self.categories = [cat for cat in FETCH_CATEGORIES if not categories or cat in categories]
+        self.items = {}
+        self.hops = {}
+        self.loaded = []
+        self._responses = {}
+        # item id: linked (item id, workspace id) pairs, from the (workspace id, kind of links) pairs indexed so far
+        self._links = {}
+        self._linked = set()
+
+    def fetch(self, urls: list) -> list:
+        '''
+        Return listings of the urls, downloading the missing ones in parallel.
+        '''
+        missing = [url for url in dict.fromkeys(urls) if url not in self._responses]
+        for url, content in zip(missing, fetch_concurrently(download_content_df, [(self.client, url) for url in missing], self.max_workers)):
+            self._responses[url] = content
+        return [self._responses[url] for url in urls]
+
+    def load_workspaces(self, workspace_ids: list):
+        '''
+        Download item lists of the workspaces and remember workspace and category of every item.
+        '''
+        workspace_ids = [workspace_id for workspace_id in dict.fromkeys(workspace_ids) if workspace_id not in self.loaded]
+        jobs = [(workspace_id, cat) for workspace_id in workspace_ids for cat in ITEM_CATEGORIES]
+        for (workspace_id, cat), content in zip(jobs, self.fetch([f'groups/{workspace_id}/{cat}' for workspace_id, cat in jobs])):
+            for item_id in get_column(content, 'id'):
+                self.items.setdefault(item_id, (workspace_id, cat))
+        self.loaded += workspace_ids
+
+    def listing(self, workspace_id: str, cat: str) -> pd.DataFrame:
+        return self.fetch([f'groups/{workspace_id}/{cat}'])[0]
+
+    def resolve_seeds(self, seeds: list) -> list:
+        '''
+        Find workspaces of the seeds - seed is either "<workspace id>/<item id>" or item id alone, which is looked for
+        in the workspaces, max_workers of them at once, until all seeds are found.
+        '''
+        item_ids = []
+        for seed in seeds:
+            workspace_id, _, item_id = seed.strip('/').rpartition('/')
+            if workspace_id:
+                self.load_workspaces([workspace_id])
+            item_ids.append(item_id)
+
+        workspace_ids = [workspace_id for workspace_id in self.workspaces['id'] if workspace_id not in self.loaded]
+        step = max(1, self.max_workers // len(ITEM_CATEGORIES))
+        for start in range(0, len(workspace_ids), step):
+            if all(item_id in self.items for item_id in item_ids):
+                break
+            self.load_workspaces(workspace_ids[start:start + step])
+
+        missing = [item_id for item_id in item_ids if item_id not in self.items]
+        if missing:
+            raise ValueError(f"Items not found in the workspaces: {', '.join(missing)}")
+        return item_ids
+
+    def expand(self, seeds: list, hops: int = DEFAULT_HOPS) -> dict:
+        '''
+        Breadth-first crawl from the seeds, stopping after given number of hops or when no new item is reached.
+
+        Returns:
+            hops (dict): item id: number of hops from the nearest seed
+        '''
+        frontier = self.resolve_seeds(seeds)
+        self.hops = {item_id: 0 for item_id in frontier}
+        for hop in range(hops):
+            if not frontier:
+                break
+            self._link(frontier)
+            neighbours = [neighbour for item_id in frontier for neighbour in self.neighbours(item_id)]
+            # items of workspaces not reached yet (cross-workspace lineage) are looked up in those workspaces
+            self.load_workspaces([workspace_id for item_id, workspace_id in neighbours if item_id not in self.items and is_id(workspace_id)])
+            frontier = []
+            for item_id, _ in neighbours:
+                if item_id in self.items and item_id not in self.hops:
+                    self.hops[item_id] = hop + 1
+                    frontier.append(item_id)
+        return self.hops
+
+    def _link(self, frontier: list):
+        # links the frontier items need, from the workspaces of the items reached so far (workspaces loaded only while
+        # looking for the seeds are left out); every workspace is downloaded and indexed once, in one parallel round per hop
+        cats = {self.items[item_id][1] for item_id in frontier}
+        kinds = ['reports']
+        if cats & {'datasets', 'dataflows'}:
+            kinds.append('upstream')
+        if cats & {'datasets', 'reports', 'dashboards'}:
+            kinds.append('tiles')
+        scope = dict.fromkeys(self.items[item_id][0] for item_id in self.hops)
+        jobs = [(workspace_id, kind) for workspace_id in scope for kind in kinds if (workspace_id, kind) not in self._linked]
+        self.fetch([f'groups/{workspace_id}/datasets/upstreamdataflows' for workspace_id, kind in jobs if kind == 'upstream'] +
+                   [f'groups/{workspace_id}/dashboards/{dashboard_id}/tiles' for workspace_id, kind in jobs if kind == 'tiles'
+                    for dashboard_id in get_column(self.listing(workspace_id, 'dashboards'), 'id')])
+        for workspace_id, kind in jobs:
+            getattr(self, f'_link_{kind}')(workspace_id)
+            self._linked.add((workspace_id, kind))
+
+    def _add_link(self, item_id: str, neighbour_id: str, workspace_id: str):
+        if is_id(item_id) and is_id(neighbour_id):
+            self._links.setdefault(item_id, []).append((neighbour_id, workspace_id))
+
+    def _link_reports(self, workspace_id: str):
+        # report - its dataset (also in other workspace)
+        reports = self.listing(workspace_id, 'reports')
+        for report_id, dataset_id, dataset_workspace in zip(get_column(reports, 'id'), get_column(reports, 'datasetId'),
+                                                            get_column(reports, 'datasetWorkspaceId')):
+            self._add_link(report_id, dataset_id, dataset_workspace if is_id(dataset_workspace) else workspace_id)
+            self._add_link(dataset_id, report_id, workspace_id)
+
+    def _link_upstream(self, workspace_id: str):
+        # dataset - dataflows it is loaded from (also in other workspace)
+        upstream = self.fetch([f'groups/{workspace_id}/datasets/upstreamdataflows'])[0]
+        for dataset_id, dataflow_id, dataflow_workspace in zip(get_column(upstream, 'datasetObjectId'), get_column(upstream, 'dataflowObjectId'),
+                                                              get_column(upstream, 'workspaceObjectId')):
+            self._add_link(dataset_id, dataflow_id, dataflow_workspace if is_id(dataflow_workspace) else workspace_id)
+            self._add_link(dataflow_id, dataset_id, None)
+
+    def _link_tiles(self, workspace_id: str):
+        # dashboard - reports and datasets of its tiles
+        for dashboard_id in get_column(self.listing(workspace_id, 'dashboards'), 'id'):
+            tiles = self.fetch([f'groups/{workspace_id}/dashboards/{dashboard_id}/tiles'])[0]
+            for report_id, dataset_id in zip(get_column(tiles, 'reportId'), get_column(tiles, 'datasetId')):
+                for resource_id in (report_id, dataset_id):
+                    self._add_link(dashboard_id, resource_id, workspace_id)
+                    self._add_link(resource_id, dashboard_id, workspace_id)
+
+    def neighbours(self, item_id: str) -> list:
+        '''
+        Items linked with the item, as (item id, workspace id) pairs - workspace is known for items in other workspaces.
+        Only links indexed for the current frontier are known.
+        '''
+        return list(dict.fromkeys(self._links.get(item_id, [])))
+
+    def workspaces_data(self, hops: int = DEFAULT_HOPS) -> tuple:
+        '''
+        Data of the reached items in the format of download_workspaces_data: users of their workspaces, items themselves,
+        datasources of dataflows and datasets nearer than the hop limit (when selected), upstream dataflows of datasets
+        and tiles of dashboards. Users are returned always, like download_workspaces_data does, to recognize empty workspaces.
+
+        Returns:
+            selected_groups (pd.DataFrame): workspaces of the reached items (id and name columns)
+            workspaces_data (list): (data_dict, missing_cat) pair for each of the workspaces
+        '''
+        workspace_ids = [workspace_id for workspace_id in self.loaded
+                         if any(self.items[item_id][0] == workspace_id for item_id in self.hops)]
+        by_workspace = {workspace_id: {cat: [] for cat in ITEM_CATEGORIES} for workspace_id in workspace_ids}
+        for item_id in self.hops:
+            workspace_id, cat = self.items[item_id]
+            by_workspace[workspace_id][cat].append(item_id)
+
+        # children of all workspaces are downloaded in one parallel round
+        child_jobs = []
+        for workspace_id, items in by_workspace.items():
+            if 'datasources' in self.categories:
+                child_jobs += [(workspace_id, cat, item_id, f'groups/{workspace_id}/{cat}/{item_id}/datasources')
+                               for cat in ['dataflows', 'datasets'] for item_id in items[cat] if self.hops[item_id] < hops]
+            child_jobs += [(workspace_id, 'dashboards', item_id, f'groups/{workspace_id}/dashboards/{item_id}/tiles')
+                           for item_id in items['dashboards']]
+        urls = [f'groups/{workspace_id}/users' for workspace_id in workspace_ids] + \
+               [f'groups/{workspace_id}/datasets/upstreamdataflows' for workspace_id, items in by_workspace.items() if items['datasets']]
+        self.fetch(urls + [url for _, _, _, url in child_jobs])
+
+        workspaces_data = []
+        for workspace_id, items in by_workspace.items():
+            data_dict, missing_cat = {'users': self.fetch([f'groups/{workspace_id}/users'])[0]}, []
+            for cat in ITEM_CATEGORIES:
+                if not items[cat]:
+                    missing_cat.append(cat)
+                    continue
+                listing = self.listing(workspace_id, cat)
+                data_dict[cat] = listing[listing['id'].isin(items[cat])]
+            for cat, key in [('dataflows', 'dataflows_datasources'), ('datasets', 'datasets_datasources'), ('dashboards', 'dashboards_datasources')]:
+                jobs = [(item_id, url) for job_workspace, job_cat, item_id, url in child_jobs if job_workspace == workspace_id and job_cat == cat]
+                if jobs:
+                    data_dict[key] = merge_specific_content(self.fetch([url for _, url in jobs]), [item_id for item_id, _ in jobs], cat)
+            if items['datasets']:
+                upstream = self.fetch([f'groups/{workspace_id}/datasets/upstreamdataflows'])[0]
+                if 'datasetObjectId' in upstream.columns:
+                    upstream = upstream[upstream['datasetObjectId'].isin(items['datasets'])]
+                data_dict['datasets_upstreamdataflows'] = upstream
+            workspaces_data.append((data_dict, missing_cat))
+
+        names = dict(zip(self.workspaces['id'], self.workspaces['name']))
+        selected_groups = pd.DataFrame({'name': [names.get(workspace_id, workspace_id) for workspace_id in workspace_ids],
+                                        'id': workspace_ids})
+        return selected_groups, workspaces_data
+
+def execute_focused_load_graph(client: PowerBIClient, seeds: list, hops: int = DEFAULT_HOPS, ws_names: list = None,
+                               max_workers: int = MAX_WORKERS, categories: list = None) -> LineageGraph:
+    '''
+    Build lineage graph of the items within given number of hops from the seeds, downloading only what the crawl reaches.
+
+    Parameters:
+        client (PowerBIClient): client allowing connection to PBI Service API
+        seeds (list): ids of seed items, optionally prefixed with workspace id ("<workspace id>/<item id>") to skip searching
+        hops (int): how far from the seeds lineage is followed
+        ws_names (list): workspaces searched for seeds given without workspace (all workspaces when empty)
+        max_workers (int): maximal number of calls running at the same time
+        categories (list): FETCH_CATEGORIES put into the graph, all when missing
+
+    Returns:
+        graph (LineageGraph): graph of the reached items, their workspaces, users and datasources
+    '''
+    with client.metrics.stage('download'):
+        crawl = FocusedCrawl(client, list_workspaces(client, ws_names or []), max_workers, categories)
+        crawl.expand(seeds, hops)
+        selected_groups, workspaces_data = crawl.workspaces_data(hops)
+    client.metrics.count('focused_items', len(crawl.hops))
+    client.metrics.count('workspaces_crawled', len(crawl.loaded))
+
+    return build_lineage_graph(selected_groups, workspaces_data, client.metrics, categories)
@@ -0,0 +1,196 @@
+import os
+import json
+import contextlib
+import logging
+import datetime
+import tempfile
+
+from Shared.data_load_transform import get_app_client, MAX_WORKERS
+from Shared.diagram_sink import DiagramSink
+from Shared.drawio_xml import write_graph_drawio, MAX_PAGE_NODES
+from Shared.key_vault_util import get_secret_value
+from Shared.data_lake_util import download_to_file, DataLakeFolderStore, DataLakeFileWriter, DataLakeLeaseStore, \
+    ParquetSnapshotWriter
+from Shared.lineage_graph import LineageGraph
+from Shared.pbi_client import PowerBIClient
+from Shared.request_policy import RequestPolicy
+from Shared.request_scheduler import RequestScheduler, IDENTITY
+from Shared.run_metrics import RunMetrics
+from Shared.snapshot_catalog import SnapshotCatalog
+from Shared.snapshot_history import SnapshotHistory
+
+def get_request_policy() -> RequestPolicy:
+    '''
+    Request policy configured with RequestTimeout, BackoffMax and HedgePercentile settings.
+    '''
+    hedge_percentile = os.environ.get('HedgePercentile')
+    return RequestPolicy(timeout=float(os.environ.get('RequestTimeout', 120)), backoff_max=float(os.environ.get('BackoffMax', 60)),
+                         hedge_percentile=float(hedge_percentile) if hedge_percentile else None)
+
+def get_crawl_categories() -> list:
+    '''
+    Categories to download and put into the diagram, from comma-separated CrawlCategories setting (all when missing).
+    '''
+    categories = [cat.strip() for cat in os.environ.get('CrawlCategories', '').split(',') if cat.strip()]
+    return categories or None
+
+def get_orchestration_input(request_body: dict) -> dict:
+    '''
+    Orchestration input - request body with crawl settings (CrawlBatchSize, CrawlParallelism, ActivityRetryInterval,
+    ActivityRetryAttempts and IncrementalCrawl) filled in from app settings. Orchestrator code is replayed, so it reads
+    the settings from its input instead of the environment. Values passed in the request body win.
+    '''
+    settings = {'batch_size': int(os.environ.get('CrawlBatchSize', 1)), 'parallelism': int(os.environ.get('CrawlParallelism', 8)),
+                'retry_interval': int(os.environ.get('ActivityRetryInterval', 30)),
+                'retry_attempts': int(os.environ.get('ActivityRetryAttempts', 3)),
+                'incremental': os.environ.get('IncrementalCrawl', '').lower() == 'true'}
+    return {**settings, **request_body}
+
+# tokens taken from shared budget at once - every grant costs a lease round trip to Data Lake
+SHARED_GRANT_SIZE = 5
+
+def get_request_scheduler(identity: str) -> RequestScheduler:
+    '''
+    Request scheduler limiting the identity to RateLimit requests per second, None when the setting is missing.
+    With RateLimitStateFile (path in the container) the budget is kept in Data Lake under lease and shared by all
+    activities and function runs, otherwise every run has its own.
+    '''
+    rate_limit = os.environ.get('RateLimit')
+    if not rate_limit:
+        return None
+    store = None
+    state_file = os.environ.get('RateLimitStateFile')
+    if state_file:
+        folder_name, _, file_name = state_file.rpartition('/')
+        store = DataLakeLeaseStore(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'], folder_name or 'state',
+                                   file_name)
+    return RequestScheduler(identity, {IDENTITY: float(rate_limit)}, store, grant_size = SHARED_GRANT_SIZE if store else 1)
+
+def get_function_client(policy: RequestPolicy, metrics: RunMetrics = None) -> PowerBIClient:
+    '''
+    PBI Service API client signed in with credentials stored in Key Vault, with MaxConcurrentRequests connections
+    and RateLimit scheduler.
+    '''
+    username = get_secret_value('username')
+    return get_app_client(username=username, password=get_secret_value('password'),
+                          client_id=get_secret_value('client-id'), tenant_id=get_secret_value('tenant-id'),
+                          max_workers=int(os.environ.get('MaxConcurrentRequests', MAX_WORKERS)), policy=policy, metrics=metrics,
+                          scheduler=get_request_scheduler(username))
+
+def log_run_metrics(metrics: RunMetrics, policy: RequestPolicy = None, scheduler: RequestScheduler = None) -> dict:
+    '''
+    Log metrics of the run (with retry and throttling counters of the policy and waits and rates of the scheduler)
+    as one JSON line, return them as dictionary.
+    '''
+    run_metrics = metrics.as_dict()
+    if policy is not None:
+        run_metrics['request_policy'] = policy.stats.as_dict()
+    if scheduler is not None:
+        run_metrics['request_scheduler'] = scheduler.as_dict()
+    logging.info(f'Run metrics: {json.dumps(run_metrics)}')
+    return run_metrics
+
+def save_diagram(graph: LineageGraph, metrics: RunMetrics = None, snapshot: bool = True):
+    '''
+    Save outputs of the graph in ADLS: CSV and/or Parquet snapshot with relationships (CSVDataFolder, SnapshotFormat setting
+    'csv', 'parquet' or 'both'), TXT input for draw.io CSV import and laid out .drawio diagram (DiagramDataFolder).
+    Parquet snapshot, when saved, is the one recorded in the snapshot catalog.
+    CSV, TXT and Parquet are streamed into ADLS in blocks (see DiagramSink), without building whole table or text in memory.
+    .drawio diagram split into pages (DiagramPages) is written page by page; one-page diagram is laid out whole in memory.
+    History delta is computed from snapshots downloaded into temporary files.
+    Writing the outputs is timed as 'export' stage of the metrics, catalog update as 'upload'.
+    Without snapshot (diagrams of a part of the tenant) only TXT and .drawio files, named "<time> focus", are saved.
+    '''
+    metrics = metrics or RunMetrics()
+    connection_string, container_name = os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName']
+    now = datetime.datetime.utcnow()
+    timestamp = now.strftime("%Y-%m-%d %H:%M")
+    snapshot_format = os.environ.get('SnapshotFormat', 'csv') if snapshot else None
+    diagram_name = timestamp if snapshot else timestamp + ' focus'
+
+    with metrics.stage('export'):
+        # stream sorted rows with html variables into CSV snapshot and TXT input for draw.io, and raw rows into Parquet
+        # snapshot - it keeps only SNAPSHOT_SCHEMA columns, fill and image of html_spec are static per type
+        with contextlib.ExitStack() as files:
+            txt_file = files.enter_context(DataLakeFileWriter(connection_string, container_name, os.environ['DiagramDataFolder'],
+                                                              diagram_name + '.txt'))
+            csv_file, parquet_file, row_writers = None, None, []
+            if snapshot_format in ('csv', 'both'):
+                csv_file = files.enter_context(DataLakeFileWriter(connection_string, container_name, os.environ['CSVDataFolder'],
+                                                                  timestamp + '.csv'))
+            if snapshot_format in ('parquet', 'both'):
+                parquet_file = files.enter_context(DataLakeFileWriter(connection_string, container_name, os.environ['CSVDataFolder'],
+                                                                      timestamp + '.parquet'))
+                row_writers.append(files.enter_context(ParquetSnapshotWriter(parquet_file)))
+            sink = DiagramSink(csv_file, txt_file, row_writers = row_writers)
+            sink.write_rows(graph.rows())
+            rows = sink.close()
+        metrics.count('upload_bytes', sink.bytes['csv'] + sink.bytes['txt'])
+        file_name, digest = timestamp + '.csv', sink.csv_sha256
+        if parquet_file is not None:
+            file_name, digest = timestamp + '.parquet', parquet_file.sha256
+            metrics.count('upload_bytes', parquet_file.offset)
+
+        # laid out diagram, which can be opened in draw.io directly
+        # with DiagramPages set to 'workspace' or 'component', the diagram is split into linked pages
+        with DataLakeFileWriter(connection_string, container_name, os.environ['DiagramDataFolder'], diagram_name + '.drawio') as drawio_file:
+            write_graph_drawio(drawio_file, graph, compressed = os.environ.get('DrawioCompressed', '').lower() == 'true',
+                               shard_by = os.environ.get('DiagramPages') or None,
+                               max_page_nodes = int(os.environ.get('MaxPageNodes', MAX_PAGE_NODES)))
+        metrics.count('upload_bytes', drawio_file.offset)
+
+    if not snapshot:
+        return
+
+    with metrics.stage('upload'):
+        catalog = get_snapshot_catalog()
+        previous = catalog.latest(1)
+        catalog.record(os.environ['CSVDataFolder'], file_name, now.isoformat(), None, rows, digest)
+
+    # with HistoryFolder set, the snapshot is also kept in delta-encoded history
+    history = get_snapshot_history()
+    if history is not None:
+        with metrics.stage('history'):
+            # snapshots are downloaded range by range into temporary files, the delta is computed streaming from them
+            # the previous snapshot is downloaded only when the history's last entry is that snapshot (digests match)
+            with tempfile.TemporaryDirectory() as directory:
+                latest_path, previous_path = os.path.join(directory, 'latest'), os.path.join(directory, 'previous')
+                download_to_file(connection_string, container_name, os.environ['CSVDataFolder'], file_name, latest_path)
+
+                def previous_file():
+                    if not os.path.exists(previous_path):
+                        download_to_file(connection_string, container_name, previous[0]['folder'], previous[0]['file'], previous_path)
+                    return open(previous_path, 'rb')
+
+                history.record(now.isoformat(), lambda: open(latest_path, 'rb'), previous_file if previous else None, digest,
+                               previous[0].get('sha256') if previous else None)
+
+def get_snapshot_catalog() -> SnapshotCatalog:
+    '''
+    Catalog of CSV snapshots, kept in CatalogFolder ('catalog' when the setting is missing).
+    '''
+    return SnapshotCatalog(DataLakeFolderStore(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'],
+                                               os.environ.get('CatalogFolder', 'catalog')))
+
+def get_snapshot_history() -> SnapshotHistory:
+    '''
+    Delta-encoded snapshot history kept in HistoryFolder, None when the setting is missing.
+    '''
+    if not os.environ.get('HistoryFolder'):
+        return None
+    return SnapshotHistory(DataLakeFolderStore(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'],
+                                               os.environ['HistoryFolder']))
+
+def get_workspace_state_store() -> DataLakeFolderStore:
+    '''
+    Folder keeping incremental crawl state and per-workspace results (WorkspaceStateFolder).
+    '''
+    return DataLakeFolderStore(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'],
+                               os.environ['WorkspaceStateFolder'])
+
+def get_partial_store(run_id: str) -> DataLakeFolderStore:
+    '''
+    Folder keeping per-workspace results of one orchestration run (PartialDataFolder/run_id).
+    '''
+    return DataLakeFolderStore(os.environ['DataLakeConnectionString'], os.environ['DataLakeContainerName'],
+                               os.environ['PartialDataFolder'] + '/' + run_id)
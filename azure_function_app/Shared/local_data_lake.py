@@ -0,0 +1,154 @@
+import os
+import shutil
+import threading
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from Shared.request_scheduler import FileLease, LEASE_SECONDS
+
+class LocalPath:
+    def __init__(self, name: str, is_directory: bool):
+        self.name = name
+        self.is_directory = is_directory
+
+class LocalFileProperties:
+    def __init__(self, size: int):
+        self.size = size
+
+class LocalDownload:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def readall(self) -> bytes:
+        return self.data
+
+class LocalFileClient:
+    '''
+    File of the local stand-in, with the subset of DataLakeFileClient methods used by data_lake_util.
+    Appended data is kept aside until flush_data, like in Data Lake. Leases are lock files (FileLease).
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def create_file(self, if_none_match: str = None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if if_none_match == '*':
+            # created only when missing, like with If-None-Match header in Data Lake
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                raise ResourceExistsError(f'{self.path} already exists')
+        else:
+            open(self.path, 'wb').close()
+        self._pending = {}
+
+    def append_data(self, data: bytes, offset: int, length: int = None):
+        with self._lock:
+            self._pending[offset] = bytes(data[:length])
+
+    def flush_data(self, offset: int):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        with open(self.path, 'r+b') as file:
+            for position, data in sorted(pending.items()):
+                if position + len(data) <= offset:
+                    file.seek(position)
+                    file.write(data)
+            file.truncate(offset)
+
+    def upload_data(self, data: bytes, overwrite: bool = False, lease = None):
+        if not overwrite and os.path.isfile(self.path):
+            raise ResourceExistsError(f'{self.path} already exists')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, self.path)
+
+    def acquire_lease(self, lease_duration: int = -1) -> FileLease:
+        if not os.path.isfile(self.path):
+            raise ResourceNotFoundError(f'{self.path} does not exist')
+        lease = FileLease(self.path, lease_duration if lease_duration > 0 else float('inf'))
+        if not lease.acquire(timeout=0):
+            raise ResourceExistsError(f'{self.path} has an active lease')
+        return lease
+
+    def get_file_properties(self) -> LocalFileProperties:
+        if not os.path.isfile(self.path):
+            raise ResourceNotFoundError(f'{self.path} does not exist')
+        return LocalFileProperties(os.path.getsize(self.path))
+
+    def download_file(self, offset: int = None, length: int = None) -> LocalDownload:
+        if not os.path.isfile(self.path):
+            raise ResourceNotFoundError(f'{self.path} does not exist')
+        with open(self.path, 'rb') as file:
+            file.seek(offset or 0)
+            return LocalDownload(file.read() if length is None else file.read(length))
+
+    def delete_file(self):
+        if not os.path.isfile(self.path):
+            raise ResourceNotFoundError(f'{self.path} does not exist')
+        os.remove(self.path)
+
+class LocalDirectoryClient:
+    def __init__(self, path: str):
+        self.path = path
+
+    def create_directory(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def delete_directory(self):
+        if not os.path.isdir(self.path):
+            raise ResourceNotFoundError(f'{self.path} does not exist')
+        shutil.rmtree(self.path)
+
+    def get_file_client(self, file_name: str) -> LocalFileClient:
+        return LocalFileClient(os.path.join(self.path, file_name))
+
+    def create_file(self, file_name: str, if_none_match: str = None) -> LocalFileClient:
+        file_client = self.get_file_client(file_name)
+        file_client.create_file(if_none_match)
+        return file_client
+
+class LocalFileSystemClient:
+    def __init__(self, path: str):
+        self.path = path
+
+    def get_directory_client(self, folder_name: str) -> LocalDirectoryClient:
+        return LocalDirectoryClient(os.path.join(self.path, folder_name))
+
+    def get_paths(self, path: str = None) -> list:
+        '''
+        Paths under the folder, relative to the container and with '/' separators, like Data Lake returns them.
+        '''
+        top = os.path.join(self.path, path) if path else self.path
+        if not os.path.isdir(top):
+            raise ResourceNotFoundError(f'{top} does not exist')
+        paths = []
+        for folder, folders, files in os.walk(top):
+            for name in sorted(folders):
+                paths.append(LocalPath(os.path.relpath(os.path.join(folder, name), self.path).replace(os.sep, '/'), True))
+            for name in sorted(files):
+                paths.append(LocalPath(os.path.relpath(os.path.join(folder, name), self.path).replace(os.sep, '/'), False))
+        return paths
+
+class LocalDataLakeServiceClient:
+    '''
+    Stand-in of DataLakeServiceClient keeping containers as folders of a local directory. It is used when Data Lake
+    connection string is "file://<directory>", so the functions and scripts can be run and tested without storage account.
+    '''
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def create_file_system(self, file_system: str) -> LocalFileSystemClient:
+        path = os.path.join(self.root, file_system)
+        if os.path.isdir(path):
+            raise ResourceExistsError(f'{file_system} already exists')
+        os.makedirs(path)
+        return LocalFileSystemClient(path)
+
+    def get_file_system_client(self, file_system: str) -> LocalFileSystemClient:
+        return LocalFileSystemClient(os.path.join(self.root, file_system))
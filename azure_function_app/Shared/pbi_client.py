@@ -0,0 +1,161 @@
+import threading
+import time
+import msal
+import requests
+from requests.adapters import HTTPAdapter
+
+from Shared.request_policy import RequestPolicy, retry_after_seconds, IDEMPOTENT_METHODS
+from Shared.request_scheduler import RequestScheduler, endpoint_class
+from Shared.response_cache import ResponseCache, CacheMissError
+from Shared.run_metrics import RunMetrics
+
+API_URL = 'https://api.powerbi.com/v1.0/myorg/'
+AUTHORITY_URL = 'https://login.microsoftonline.com/'
+SCOPE = ['https://analysis.windows.net/powerbi/api/.default']
+
+# refresh the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 300
+# responses never cached - status of a running scan changes with every poll and ids of scan results are single-use
+UNCACHED_URLS = ('admin/workspaces/scanStatus/', 'admin/workspaces/scanResult/')
+
+class PowerBIClient:
+    '''
+    Client for PBI Service API. It keeps one pooled HTTP session (connections are reused between calls)
+    and MSAL token cache, so the token is refreshed silently when it is close to expiring.
+
+    Parameters:
+        username (str): for Azure & PowerBI account
+        password (str): for Azure & PowerBI account
+        client_id (str): Azure App Registration (client) ID
+        tenant_id (str): Azure App Registration directory (tenant) ID
+        pool_size (int): number of connections kept open, should not be lower than number of parallel calls
+        base_url (str): PBI Service API address
+        token_cache (msal.SerializableTokenCache): cache to keep tokens in, new in-memory cache is used when missing
+        policy (RequestPolicy): timeouts, retries and hedging of the requests, default policy is used when missing
+        access_token (str): fixed token used instead of signing in (for example token from other tool or local mock API)
+        cache (ResponseCache): on-disk cache of GET responses (except UNCACHED_URLS), keyed by username and URL,
+                               in replay mode no request is sent
+        metrics (RunMetrics): collects latency, request and byte counts of every endpoint, new one is used when missing
+        scheduler (RequestScheduler): rate-limit-aware admission of every sent request (including retries), none when missing
+    '''
+
+    def __init__(self, username: str = None, password: str = None, client_id: str = None, tenant_id: str = None, pool_size: int = 10,
+                 base_url: str = API_URL, token_cache: msal.SerializableTokenCache = None, policy: RequestPolicy = None,
+                 access_token: str = None, cache: ResponseCache = None, metrics: RunMetrics = None, scheduler: RequestScheduler = None):
+        self.username = username
+        self.base_url = base_url
+        self.policy = policy or RequestPolicy()
+        self.cache = cache
+        self.metrics = metrics or RunMetrics()
+        self.scheduler = scheduler
+        self._password = password
+        self._app = None
+        if access_token is None:
+            self._app = msal.PublicClientApplication(client_id, authority=AUTHORITY_URL + tenant_id,
+                                                     token_cache=token_cache or msal.SerializableTokenCache())
+        self._token = access_token
+        self._expires_at = float('inf') if access_token is not None else 0
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def get_token(self, force_refresh: bool = False) -> str:
+        '''
+        Return valid access token. Cached token is used until it is about to expire, then MSAL refreshes it silently
+        and only when that fails, new token is requested with username and password.
+        '''
+        with self._lock:
+            if self._app is None or (not force_refresh and self._token and time.time() < self._expires_at - TOKEN_REFRESH_MARGIN):
+                return self._token
+
+            result = None
+            accounts = self._app.get_accounts(username=self.username)
+            if accounts:
+                result = self._app.acquire_token_silent(SCOPE, account=accounts[0], force_refresh=force_refresh)
+            if not result:
+                result = self._app.acquire_token_by_username_password(username=self.username, password=self._password, scopes=SCOPE)
+            if 'access_token' not in result:
+                raise PermissionError(f"Unable to acquire PBI Service token: {result.get('error_description', result.get('error'))}")
+
+            self._token = result['access_token']
+            self._expires_at = time.time() + int(result.get('expires_in', 0))
+            return self._token
+
+    def get(self, url_extension: str) -> requests.Response:
+        '''
+        Send GET request to PBI Service API.
+        '''
+        return self.request('GET', url_extension)
+
+    def request(self, method: str, url_extension: str, json: dict = None) -> requests.Response:
+        '''
+        Send request to PBI Service API following the request policy (timeouts, retries, hedging).
+        When the token is rejected, the request is repeated once with refreshed token.
+        With scheduler every attempt waits for its budget and reports the response status back.
+        Non-idempotent requests (POST) are retried only after throttling or connection errors.
+        In replay mode of the cache CacheMissError is raised instead.
+        '''
+        if self.cache is not None and self.cache.replay:
+            raise CacheMissError(f'{method} {url_extension} cannot be replayed, only cached GET responses can')
+        url = self.base_url + url_extension
+        budget = endpoint_class(url_extension)
+
+        def attempt(timeout, token):
+            if self.scheduler is not None:
+                self.scheduler.acquire(budget)
+            response = self.session.request(method, url, json=json, headers={'Authorization': f'Bearer {token}'}, timeout=timeout)
+            if self.scheduler is not None:
+                self.scheduler.observe(budget, response.status_code, retry_after_seconds(response, self.policy.backoff_max))
+            return response
+
+        def send(timeout):
+            response = attempt(timeout, self.get_token())
+            if response.status_code == 401:
+                # the repeated request takes its own budget too
+                response = attempt(timeout, self.get_token(force_refresh=True))
+            return response
+
+        start = time.perf_counter()
+        try:
+            response = self.policy.execute(send, idempotent = method.upper() in IDEMPOTENT_METHODS)
+        except Exception:
+            self.metrics.record_request(method, url_extension, time.perf_counter() - start, False, 0)
+            raise
+        self.metrics.record_request(method, url_extension, time.perf_counter() - start, True, len(response.content))
+        return response
+
+    def get_json(self, url_extension: str) -> dict:
+        '''
+        Send GET request to PBI Service API and return decoded JSON body. Cached body is returned when available.
+        '''
+        if self.cache is None or url_extension.startswith(UNCACHED_URLS):
+            return self.get(url_extension).json()
+
+        identity = self.username or ''
+        body = self.cache.get(self.base_url + url_extension, identity)
+        if body is not None:
+            self.metrics.count('cached_responses')
+        else:
+            body = self.get(url_extension).json()
+            self.cache.put(self.base_url + url_extension, identity, body)
+        return body
+
+    def post_json(self, url_extension: str, body: dict) -> dict:
+        '''
+        Send POST request with JSON body to PBI Service API and return decoded JSON response.
+        '''
+        return self.request('POST', url_extension, json=body).json()
+
+    def close(self):
+        self.policy.close()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
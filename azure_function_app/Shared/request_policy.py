@@ -0,0 +1,195 @@
+import random
+import threading
+import time
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# statuses after which the request is sent again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# requests which can be repeated without side effects - other ones (POST like admin/workspaces/getInfo starting a scan)
+# are repeated only when they surely were not processed: after 429 response or failed connection, and are never hedged
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+NON_IDEMPOTENT_RETRY_STATUSES = (429,)
+
+class RequestStats:
+    '''
+    Thread-safe counters of one run: sent requests, retries, throttled responses, hedged requests and time spent waiting.
+    Latencies of the latest successful requests are kept to compute percentiles for hedging.
+    '''
+
+    def __init__(self, latency_window: int = 1000):
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.wait_seconds = 0.0
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency_percentile(self, percentile: float, min_samples: int = 1) -> float:
+        '''
+        Return latency (in seconds) below which given percentile (0-1) of recorded requests finished,
+        or None when there are less than min_samples recorded.
+        '''
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies or len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(percentile * len(latencies)))]
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {'requests': self.requests, 'retries': self.retries, 'throttled': self.throttled, 'timeouts': self.timeouts,
+                    'hedged': self.hedged, 'hedge_wins': self.hedge_wins, 'wait_seconds': round(self.wait_seconds, 3)}
+
+class RequestPolicy:
+    '''
+    Rules for sending requests: per-call timeout, retries with exponential backoff (honouring Retry-After header
+    of 429 and 503 responses, at most backoff_max seconds) and optional hedging - when the call runs longer than given
+    latency percentile, duplicate request is sent and the faster response is used.
+    Non-idempotent requests are retried only after 429 response or connection error and are not hedged.
+
+    Parameters:
+        timeout (float or tuple): timeout in seconds, or tuple of connect and read timeouts
+        max_retries (int): how many times the request may be repeated
+        backoff_base (float): delay before the first retry in seconds, doubled with every next retry
+        backoff_max (float): maximal delay between retries in seconds, longer Retry-After is cut to it
+        hedge_percentile (float): latency percentile (0-1) after which hedged request is sent, None turns hedging off
+        hedge_min_samples (int): number of finished requests needed before hedging starts
+        stats (RequestStats): counters to update, new ones are created when missing
+    '''
+
+    def __init__(self, timeout: tuple = (10, 120), max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 hedge_percentile: float = None, hedge_min_samples: int = 20, stats: RequestStats = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.stats = stats or RequestStats()
+        self._hedge_executor = None
+        self._lock = threading.Lock()
+
+    def execute(self, send, idempotent: bool = True) -> requests.Response:
+        '''
+        Send the request following the policy.
+
+        Parameters:
+            send (callable): function sending the request, it takes timeout as the only argument and returns response
+            idempotent (bool): whether the request can be repeated after any failure (see IDEMPOTENT_METHODS)
+
+        Returns:
+            response (requests.Response): successful response, HTTPError is raised when retries are exhausted
+        '''
+        retry_statuses = RETRY_STATUSES if idempotent else NON_IDEMPOTENT_RETRY_STATUSES
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._send(send) if idempotent else self._timed_send(send)
+            except (requests.Timeout, requests.ConnectionError) as error:
+                if isinstance(error, requests.Timeout):
+                    self.stats.add(timeouts=1)
+                # read timeout of non-idempotent request may come after the request was processed
+                if attempt == self.max_retries or not (idempotent or isinstance(error, requests.ConnectionError)):
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in retry_statuses or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response
+                if response.status_code == 429:
+                    self.stats.add(throttled=1)
+                delay = retry_after_seconds(response, self.backoff_max)
+                if delay is None:
+                    delay = self._backoff(attempt)
+
+            self.stats.add(retries=1, wait_seconds=delay)
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        # exponential backoff with full jitter, so parallel calls don't retry at the same moment
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _timed_send(self, send) -> requests.Response:
+        start = time.perf_counter()
+        response = send(self.timeout)
+        self.stats.add(requests=1)
+        if response.ok:
+            self.stats.record_latency(time.perf_counter() - start)
+        return response
+
+    def _send(self, send) -> requests.Response:
+        hedge_delay = None
+        if self.hedge_percentile is not None:
+            hedge_delay = self.stats.latency_percentile(self.hedge_percentile, self.hedge_min_samples)
+        if hedge_delay is None:
+            return self._timed_send(send)
+
+        executor = self._get_hedge_executor()
+        first = executor.submit(self._timed_send, send)
+        done, _ = wait([first], timeout=hedge_delay)
+        if done:
+            return first.result()
+
+        # the call is slower than usual, send duplicate and take whichever finishes first
+        self.stats.add(hedged=1)
+        second = executor.submit(self._timed_send, send)
+        done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+        succeeded = [future for future in (first, second) if future in done and future.exception() is None]
+        if not succeeded and pending:
+            wait(pending)
+            succeeded = [future for future in pending if future.exception() is None]
+        if not succeeded:
+            return first.result()
+
+        if succeeded[0] is second:
+            self.stats.add(hedge_wins=1)
+        return succeeded[0].result()
+
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(thread_name_prefix='hedge')
+            return self._hedge_executor
+
+    def close(self):
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+
+def retry_after_seconds(response: requests.Response, max_seconds: float = None) -> float:
+    '''
+    Read Retry-After header (either number of seconds or HTTP date), return None when it is missing or malformed.
+    Longer delays than max_seconds are cut to it, so a bogus header can't stall the crawl.
+    '''
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_date.tzinfo is None:
+            retry_date = retry_date.replace(tzinfo=datetime.timezone.utc)
+        seconds = (retry_date - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    if seconds != seconds:
+        return None
+    seconds = max(0.0, seconds)
+    return seconds if max_seconds is None else min(max_seconds, seconds)
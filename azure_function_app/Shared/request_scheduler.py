@@ -0,0 +1,303 @@
+import os
+import json
+import heapq
+import random
+import itertools
+import threading
+import time
+from functools import partial
+
+# endpoint classes with their own budget, in priority order - top-level listings (workspaces, resources of a workspace)
+# go before admin scanner calls and before per-item calls (datasources, tiles, upstream dataflows)
+LISTING = 'listing'
+ADMIN = 'admin'
+ITEM = 'item'
+PRIORITIES = {LISTING: 0, ADMIN: 1, ITEM: 2}
+# budget shared by all endpoint classes of one identity
+IDENTITY = 'identity'
+# requests per second, the starting (and maximal) rates adapted to observed throttling
+DEFAULT_RATES = {IDENTITY: 20.0, LISTING: 20.0, ADMIN: 2.0, ITEM: 20.0}
+# bucket capacity in seconds of its rate - size of allowed bursts
+BURST_SECONDS = 2.0
+# AIMD: rate is multiplied by DECREASE on 429 (at most once in DECREASE_INTERVAL seconds, as responses of requests
+# sent at the same time come together) and raised by INCREASE of the configured rate with every successful request
+DECREASE = 0.5
+DECREASE_INTERVAL = 1.0
+INCREASE = 0.01
+MIN_RATE = 0.05
+# seconds the identity is blocked after 429 without Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+# expiry of the lease of crashed holder of shared state
+LEASE_SECONDS = 15
+
+def endpoint_class(url_extension: str) -> str:
+    '''
+    Budget class of the API call: ADMIN for scanner calls ('admin/workspaces/getInfo', 'scanStatus', 'scanResult'),
+    ITEM for calls below a resource of a workspace ('groups/{id}/datasets/{id}/datasources', 'groups/{id}/dashboards/{id}/tiles',
+    'groups/{id}/datasets/upstreamdataflows') and LISTING for the rest ('groups', 'groups/{id}/datasets', 'admin/groups').
+    '''
+    parts = url_extension.split('?')[0].strip('/').split('/')
+    if parts[0] == 'admin':
+        return ADMIN if len(parts) > 2 and parts[2] in ('getInfo', 'scanStatus', 'scanResult') else LISTING
+    if parts[0] == 'groups' and len(parts) > 3:
+        return ITEM
+    return LISTING
+
+class FileLease:
+    '''
+    Exclusive lease of a file, held through "<path>.lease" lock file which is created atomically by the holder.
+    Lease of a holder that crashed expires after duration seconds.
+    '''
+
+    def __init__(self, path: str, duration: float = LEASE_SECONDS):
+        self.lock_path = path + '.lease'
+        self.duration = duration
+
+    def acquire(self, timeout: float = None) -> bool:
+        '''
+        Wait for the lease at most timeout seconds (without limit when None), return whether it was acquired.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) > self.duration:
+                    os.remove(self.lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(random.uniform(0.005, 0.02))
+
+    def release(self):
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+class MemoryBudgetStore:
+    '''
+    Budget state of one process.
+    '''
+
+    def __init__(self):
+        self.state = {}
+        self._lock = threading.Lock()
+
+    def update(self, function):
+        '''
+        Call function with the state dictionary (changed in place) and return its result, atomically.
+        '''
+        with self._lock:
+            return function(self.state)
+
+class FileBudgetStore:
+    '''
+    Budget state kept in a local JSON file and changed under FileLease, so processes running on one machine
+    (parallel create_graph runs, tests of shared budget) share it.
+    '''
+
+    def __init__(self, path: str, lease_seconds: float = LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+
+    def update(self, function):
+        lease = FileLease(self.path, self.lease_seconds)
+        lease.acquire()
+        try:
+            state = {}
+            if os.path.isfile(self.path):
+                with open(self.path, 'rb') as file:
+                    state = json.loads(file.read() or b'{}')
+            result = function(state)
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(state, file)
+            os.replace(temp_path, self.path)
+            return result
+        finally:
+            lease.release()
+
+class RequestScheduler:
+    '''
+    Rate-limit-aware admission of PBI Service API requests. Every request takes a token from the token bucket
+    of its identity and from the bucket of its endpoint class (endpoint_class). Callers waiting for tokens are served
+    in priority order (LISTING, ADMIN, ITEM) and in arrival order within one class, so workspace listings are not starved
+    by thousands of per-item calls. Rates adapt to throttling (AIMD): 429 response halves the rates of the identity
+    and of the class and blocks the identity for Retry-After seconds, successful responses raise them back additively
+    up to the configured rates.
+
+    Bucket state lives in the store, shared stores (FileBudgetStore, DataLakeLeaseStore of data_lake_util) let processes
+    and durable activities crawling with the same identity keep one common budget.
+
+    Parameters:
+        identity (str): user or service principal the budget belongs to
+        rates (dict): requests per second of the identity (IDENTITY key) and of endpoint classes, missing ones from DEFAULT_RATES
+        store (object): store of the bucket state with update(function) method, MemoryBudgetStore when missing
+        grant_size (int): tokens taken from the store at once (and successes reported at once) - higher values save
+                          round trips to shared stores at the cost of less exact sharing
+    '''
+
+    def __init__(self, identity: str = '', rates: dict = None, store = None, grant_size: int = 1):
+        self.identity = identity or ''
+        self.rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.store = store or MemoryBudgetStore()
+        self.grant_size = max(1, grant_size)
+        self.stats = {'waits': 0, 'wait_seconds': 0.0, 'throttled': 0, 'store_updates': 0}
+        self._granted = {}
+        self._successes = {}
+        self._blocked_until = 0.0
+        # incremented when throttling is observed, grants taken from the store before it are not used
+        self._epoch = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, endpoint_class: str):
+        '''
+        Block until the request of the endpoint class may be sent.
+        '''
+        ticket = (PRIORITIES.get(endpoint_class, len(PRIORITIES)), next(self._sequence))
+        start = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            self._condition.notify_all()
+        try:
+            while True:
+                with self._condition:
+                    while self._waiting[0] != ticket:
+                        self._condition.wait()
+                    delay = self._take(endpoint_class)
+                    epoch = self._epoch
+                if delay is None:
+                    # new grant is taken from the store without holding the lock, so a slow shared store doesn't block
+                    # observe and as_dict of other threads
+                    granted, delay = self._update(partial(self._take_tokens, endpoint_class))
+                    if granted:
+                        with self._condition:
+                            # tokens granted before throttling was observed are dropped and the state is checked again
+                            if epoch != self._epoch:
+                                continue
+                            self._granted[endpoint_class] = self._granted.get(endpoint_class, 0) + granted - 1
+                            delay = 0.0
+                if delay <= 0:
+                    break
+                with self._condition:
+                    self._condition.wait(delay)
+        finally:
+            with self._condition:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                waited = time.monotonic() - start
+                if waited > 0.001:
+                    self.stats['waits'] += 1
+                    self.stats['wait_seconds'] += waited
+
+    def observe(self, endpoint_class: str, status_code: int, retry_after: float = None):
+        '''
+        Adapt the rates to the response of a request admitted by acquire.
+
+        Parameters:
+            endpoint_class (str): class the request was admitted for
+            status_code (int): HTTP status of the response
+            retry_after (float): seconds from Retry-After header of the response, if any
+        '''
+        update = None
+        with self._condition:
+            if status_code == 429:
+                delay = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+                self.stats['throttled'] += 1
+                self._granted.clear()
+                self._epoch += 1
+                self._blocked_until = max(self._blocked_until, time.time() + delay)
+                update = partial(self._throttle, endpoint_class, delay)
+                self._condition.notify_all()
+            elif status_code < 400:
+                successes = self._successes.get(endpoint_class, 0) + 1
+                if successes >= self.grant_size:
+                    update = partial(self._increase, endpoint_class, successes)
+                    successes = 0
+                self._successes[endpoint_class] = successes
+        if update is not None:
+            self._update(update)
+
+    def as_dict(self) -> dict:
+        '''
+        Wait and throttling counters with current rates of the identity buckets.
+        '''
+        with self._condition:
+            stats = dict(self.stats, wait_seconds=round(self.stats['wait_seconds'], 3))
+        stats['rates'] = self._update(self._rates)
+        return stats
+
+    ''' BUCKET STATE '''
+
+    def _update(self, function):
+        # store is called without holding _condition - round trips to shared stores take long
+        with self._condition:
+            self.stats['store_updates'] += 1
+        return self.store.update(function)
+
+    def _take(self, endpoint_class: str) -> float:
+        # take one of locally granted tokens, return seconds to wait while blocked, None when a new grant is needed
+        now = time.time()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._granted.get(endpoint_class, 0) <= 0:
+            return None
+        self._granted[endpoint_class] -= 1
+        return 0.0
+
+    def _buckets(self, state: dict, endpoint_class: str) -> list:
+        # refilled buckets of the identity and of the endpoint class
+        now = time.time()
+        buckets = []
+        for name in (IDENTITY, endpoint_class):
+            rate = self.rates.get(name, self.rates[IDENTITY])
+            bucket = state.setdefault(f'{self.identity}|{name}', {'rate': rate, 'tokens': max(1.0, rate * BURST_SECONDS),
+                                                                  'updated': now, 'blocked_until': 0.0, 'decreased': 0.0})
+            bucket['ceiling'] = rate
+            bucket['rate'] = min(bucket['rate'], rate)
+            capacity = max(1.0, bucket['rate'] * BURST_SECONDS)
+            bucket['tokens'] = min(capacity, bucket['tokens'] + max(0.0, now - bucket['updated']) * bucket['rate'])
+            bucket['updated'] = now
+            buckets.append(bucket)
+        return buckets
+
+    def _take_tokens(self, endpoint_class: str, state: dict) -> tuple:
+        now = time.time()
+        buckets = self._buckets(state, endpoint_class)
+        blocked_until = max(bucket['blocked_until'] for bucket in buckets)
+        if blocked_until > now:
+            return 0, blocked_until - now
+        granted = int(min([self.grant_size] + [bucket['tokens'] for bucket in buckets]))
+        if granted < 1:
+            return 0, max((1.0 - bucket['tokens']) / bucket['rate'] for bucket in buckets)
+        for bucket in buckets:
+            bucket['tokens'] -= granted
+        return granted, 0.0
+
+    def _throttle(self, endpoint_class: str, delay: float, state: dict):
+        now = time.time()
+        for bucket in self._buckets(state, endpoint_class):
+            if now - bucket['decreased'] >= DECREASE_INTERVAL:
+                bucket['rate'] = max(MIN_RATE, bucket['rate'] * DECREASE)
+                bucket['decreased'] = now
+            bucket['tokens'] = min(bucket['tokens'], 0.0)
+            bucket['blocked_until'] = max(bucket['blocked_until'], now + delay)
+
+    def _increase(self, endpoint_class: str, successes: int, state: dict):
+        for bucket in self._buckets(state, endpoint_class):
+            bucket['rate'] = min(bucket['ceiling'], bucket['rate'] + bucket['ceiling'] * INCREASE * successes)
+
+    def _rates(self, state: dict) -> dict:
+        prefix = self.identity + '|'
+        return {key[len(prefix):]: round(bucket['rate'], 3) for key, bucket in state.items() if key.startswith(prefix)}
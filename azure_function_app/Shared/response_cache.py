@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+class CacheMissError(LookupError):
+    '''
+    Raised in replay mode, when the response is not in the cache.
+    '''
+
+class ResponseCache:
+    '''
+    On-disk cache of PBI Service API responses. Each response is kept in its own file, named by hash of the identity
+    (account) and URL. Entries older than ttl are downloaded again and least recently used entries are removed
+    when the cache grows over max_bytes.
+
+    Parameters:
+        folder (str): cache folder
+        ttl (float): seconds after which entry expires, None keeps entries forever
+        max_bytes (int): maximal size of the cache
+        replay (bool): use only cached responses (expired too) and raise CacheMissError instead of calling API
+    '''
+
+    def __init__(self, folder: str, ttl: float = 24 * 3600, max_bytes: int = 500 * 1024 ** 2, replay: bool = False):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._size = sum(os.path.getsize(path) for path in self._entry_paths())
+
+    def _entry_paths(self) -> list:
+        return [os.path.join(self.folder, name) for name in os.listdir(self.folder) if name.endswith('.json')]
+
+    def _path(self, url: str, identity: str) -> str:
+        key = hashlib.sha256(f'{identity}\n{url}'.encode()).hexdigest()
+        return os.path.join(self.folder, key + '.json')
+
+    def get(self, url: str, identity: str = '') -> dict:
+        '''
+        Return cached JSON body of the response, None when it is missing or expired.
+        '''
+        path = self._path(url, identity)
+        try:
+            with open(path, 'rb') as file:
+                entry = json.load(file)
+        except (FileNotFoundError, ValueError):
+            entry = None
+
+        if entry is not None and (self.replay or self.ttl is None or time.time() - entry['stored'] <= self.ttl):
+            # modification time marks the last use, it is used for LRU eviction
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # evicted by other thread or process after it was read, the body read is still valid
+                pass
+            with self._lock:
+                self.hits += 1
+            return entry['body']
+
+        with self._lock:
+            self.misses += 1
+        if self.replay:
+            raise CacheMissError(f'Response for {url} is not cached, it cannot be replayed')
+        return None
+
+    def put(self, url: str, identity: str, body: dict):
+        '''
+        Store JSON body of the response, evicting least recently used entries when the cache is too big.
+        '''
+        path = self._path(url, identity)
+        content = json.dumps({'url': url, 'stored': time.time(), 'body': body}).encode()
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+
+        # write to temporary file first, so parallel readers never see half-written entry
+        handle, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._size += len(content) - previous_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # remove least recently used entries until the cache takes 90% of max_bytes
+        entries = []
+        for path in self._entry_paths():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size_bytes': self._size}
@@ -0,0 +1,121 @@
+import sys
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak memory is reported only when tracemalloc is tracing
+    resource = None
+
+# upper bounds (in seconds) of the latency histogram buckets, the last bucket takes everything slower
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# url parts kept in endpoint names, other parts are ids and become '{id}'
+ENDPOINT_WORDS = {'groups', 'users', 'dataflows', 'datasets', 'reports', 'dashboards', 'datasources', 'upstreamdataflows', 'tiles',
+                  'admin', 'workspaces', 'getInfo', 'scanStatus', 'scanResult', 'modified'}
+# number of slowest workspaces listed in as_dict
+TOP_WORKSPACES = 20
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.response_bytes = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds: float, ok: bool, response_bytes: int):
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.response_bytes += response_bytes
+        self.buckets[next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))] += 1
+
+    def as_dict(self) -> dict:
+        return {'requests': self.requests, 'errors': self.errors, 'seconds': round(self.seconds, 3),
+                'mean_ms': round(1000 * self.seconds / self.requests, 1) if self.requests else None,
+                'max_ms': round(1000 * self.max_seconds, 1), 'response_bytes': self.response_bytes,
+                'histogram': dict(zip([f'le_{bound:g}s' for bound in LATENCY_BUCKETS] + ['gt_30s'], self.buckets))}
+
+class RunMetrics:
+    '''
+    Thread-safe instrumentation of one run: wall time of stages (download, users, dataflows, ..., export, upload),
+    latency histogram, request and byte counts of every API endpoint, API time spent per workspace, free-form counters
+    and peak memory. as_dict returns all of it as JSON-serializable dictionary.
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.endpoints = {}
+        self.workspaces = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        '''
+        Measure wall time of the block, repeated stages of the same name are summed.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                total, count = self.stages.get(name, (0.0, 0))
+                self.stages[name] = (total + seconds, count + 1)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_request(self, method: str, url_extension: str, seconds: float, ok: bool, response_bytes: int):
+        '''
+        Record finished API call (including its retries) under its endpoint and workspace.
+        '''
+        endpoint = method + ' ' + endpoint_name(url_extension)
+        parts = url_extension.split('?')[0].split('/')
+        workspace_id = parts[1] if len(parts) > 2 and parts[0] == 'groups' else None
+        with self._lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()).add(seconds, ok, response_bytes)
+            if workspace_id is not None:
+                total, count = self.workspaces.get(workspace_id, (0.0, 0))
+                self.workspaces[workspace_id] = (total + seconds, count + 1)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            endpoints = {name: stats.as_dict() for name, stats in sorted(self.endpoints.items())}
+            slowest = sorted(self.workspaces.items(), key = lambda item: -item[1][0])[:TOP_WORKSPACES]
+            return {'seconds': round(time.perf_counter() - self.started, 3),
+                    'stages': {name: {'seconds': round(total, 3), 'count': count} for name, (total, count) in self.stages.items()},
+                    'requests': sum(stats['requests'] for stats in endpoints.values()),
+                    'response_bytes': sum(stats['response_bytes'] for stats in endpoints.values()),
+                    'endpoints': endpoints,
+                    'workspaces': {'count': len(self.workspaces),
+                                   'slowest': [{'id': workspace_id, 'api_seconds': round(total, 3), 'requests': count}
+                                               for workspace_id, (total, count) in slowest]},
+                    'counters': dict(self.counters),
+                    'peak_memory_mb': peak_memory_mb()}
+
+def endpoint_name(url_extension: str) -> str:
+    '''
+    Url without query and with ids replaced by '{id}', for example 'groups/{id}/datasets/{id}/datasources'.
+    '''
+    return '/'.join(part if part in ENDPOINT_WORDS else '{id}' for part in url_extension.split('?')[0].split('/'))
+
+def peak_memory_mb() -> float:
+    '''
+    Peak memory of the process in MB - peak of Python allocations when tracemalloc is tracing, otherwise peak resident size.
+    '''
+    if tracemalloc.is_tracing():
+        return round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return round(peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024, 1)
@@ -0,0 +1,143 @@
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from Shared.pbi_client import PowerBIClient
+
+# admin API accepts up to 100 workspaces in one scan and runs up to 16 scans at the same time
+SCAN_BATCH_SIZE = 100
+MAX_PARALLEL_SCANS = 16
+SCAN_PARAMS = 'lineage=True&datasourceDetails=True&getArtifactUsers=True'
+
+def list_admin_workspaces(client: PowerBIClient, page_size: int = 5000) -> pd.DataFrame:
+    '''
+    List all active workspaces of the tenant with admin API (personal workspaces are skipped).
+
+    Parameters:
+        client (PowerBIClient): client of the account with PBI Service admin rights
+        page_size (int): number of workspaces downloaded in one call
+
+    Returns:
+        group_df (pd.DataFrame): workspaces with at least id and name columns
+    '''
+    groups = []
+    while True:
+        page = client.get_json(f'admin/groups?$top={page_size}&$skip={len(groups)}').get('value', [])
+        groups.extend(page)
+        if len(page) < page_size:
+            break
+
+    group_df = pd.DataFrame(groups, columns = ['id', 'name', 'type', 'state'])
+    group_df = group_df[(group_df['type'].fillna('Workspace') == 'Workspace') & (group_df['state'].fillna('Active') == 'Active')]
+    return group_df
+
+def scan_batch(client: PowerBIClient, workspace_ids: list, poll_interval: float = 5, timeout: float = 1800) -> dict:
+    '''
+    Scan one batch of workspaces: request the scan, poll its status until it succeeds and download the result.
+
+    Parameters:
+        client (PowerBIClient): client of the account with PBI Service admin rights
+        workspace_ids (list): up to SCAN_BATCH_SIZE workspace ids
+        poll_interval (float): seconds between scan status checks
+        timeout (float): seconds after which waiting for the scan is stopped
+
+    Returns:
+        scan_result (dict): scan result with 'workspaces' and 'datasourceInstances' lists
+    '''
+    scan = client.post_json(f'admin/workspaces/getInfo?{SCAN_PARAMS}', {'workspaces': list(workspace_ids)})
+    scan_id = scan['id']
+
+    deadline = time.monotonic() + timeout
+    status = scan.get('status')
+    while status != 'Succeeded':
+        if status == 'Failed':
+            raise RuntimeError(f'Workspace scan {scan_id} failed: {scan.get("error")}')
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Workspace scan {scan_id} did not finish in {timeout} seconds')
+        time.sleep(poll_interval)
+        scan = client.get_json(f'admin/workspaces/scanStatus/{scan_id}')
+        status = scan.get('status')
+
+    return client.get_json(f'admin/workspaces/scanResult/{scan_id}')
+
+def scan_workspaces(client: PowerBIClient, workspace_ids: list, batch_size: int = SCAN_BATCH_SIZE, max_workers: int = MAX_PARALLEL_SCANS,
+                    poll_interval: float = 5) -> dict:
+    '''
+    Scan all workspaces in batches running in parallel and merge the results.
+
+    Returns:
+        scan_result (dict): merged 'workspaces' and 'datasourceInstances' lists of all batches
+    '''
+    batches = [workspace_ids[i:i + batch_size] for i in range(0, len(workspace_ids), batch_size)]
+    result = {'workspaces': [], 'datasourceInstances': []}
+    if not batches:
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, MAX_PARALLEL_SCANS, len(batches)))) as executor:
+        for batch_result in executor.map(lambda batch: scan_batch(client, batch, poll_interval), batches):
+            result['workspaces'].extend(batch_result.get('workspaces', []))
+            result['datasourceInstances'].extend(batch_result.get('datasourceInstances', []))
+
+    return result
+
+def scanned_workspace_to_data_dict(workspace: dict, datasource_instances: dict, categories: list) -> tuple:
+    '''
+    Convert one workspace of the scan result into the same (data_dict, missing_cat) pair download_all_data returns.
+
+    Parameters:
+        workspace (dict): workspace from the scan result
+        datasource_instances (dict): datasource instances of the scan result, keyed by datasourceId
+        categories (list): entity categories to convert
+
+    Returns:
+        data_dict (dict): dictionary with key-dataframe pairs
+        missing_cat (list): categories without any entity
+    '''
+    data_dict = {}
+    missing_cat = []
+    for cat in categories:
+        items = workspace.get(cat) or []
+        if not items:
+            missing_cat.append(cat)
+            continue
+        data_dict[cat] = pd.DataFrame(items).rename(columns = {'objectId': 'id'})
+
+        if cat in ['dataflows', 'datasets']:
+            data_dict[cat+'_datasources'] = _datasource_usages_df(items, datasource_instances, cat)
+
+        if cat in ['datasets']:
+            upstream = [{'datasetObjectId': item['id'], 'dataflowObjectId': dataflow['targetDataflowId'],
+                         'workspaceObjectId': dataflow.get('groupId', workspace['id'])}
+                        for item in items for dataflow in item.get('upstreamDataflows') or []]
+            data_dict[cat+'_upstreamdataflows'] = pd.DataFrame(upstream)
+
+        if cat in ['dashboards']:
+            tiles = [dict(tile, dashboardsId=item['id']) for item in items for tile in item.get('tiles') or []]
+            data_dict[cat+'_datasources'] = pd.DataFrame(tiles, columns = ['id', 'title', 'reportId', 'datasetId', 'dashboardsId'])
+
+    return data_dict, missing_cat
+
+def _datasource_usages_df(items: list, datasource_instances: dict, data_category: str) -> pd.DataFrame:
+    # rebuild the same columns as 'groups/{id}/{category}/{id}/datasources' returns
+    rows = []
+    for item in items:
+        item_id = item.get('objectId', item.get('id'))
+        for usage in item.get('datasourceUsages') or []:
+            instance = datasource_instances.get(usage.get('datasourceInstanceId'))
+            if instance is not None:
+                rows.append({'datasourceType': instance.get('datasourceType'), 'connectionDetails': instance.get('connectionDetails'),
+                             'datasourceId': instance.get('datasourceId'), 'gatewayId': instance.get('gatewayId'),
+                             data_category+'Id': item_id})
+    return pd.DataFrame(rows)
+
+def download_scanner_data(client: PowerBIClient, categories: list, workspace_ids: list, max_workers: int = MAX_PARALLEL_SCANS) -> list:
+    '''
+    Scanner API counterpart of download_workspaces_data - scan the workspaces and convert the result
+    into (data_dict, missing_cat) pair for each workspace, in the same order as workspace_ids.
+    '''
+    scan_result = scan_workspaces(client, list(workspace_ids), max_workers=max_workers)
+    datasource_instances = {instance['datasourceId']: instance for instance in scan_result['datasourceInstances']}
+    workspaces = {workspace['id']: workspace for workspace in scan_result['workspaces']}
+
+    return [scanned_workspace_to_data_dict(workspaces.get(workspace_id, {'id': workspace_id}), datasource_instances, categories)
+            for workspace_id in workspace_ids]
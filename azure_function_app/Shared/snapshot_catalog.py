@@ -0,0 +1,78 @@
+import json
+import hashlib
+import datetime
+
+LATEST_FILE = 'latest.json'
+# number of newest entries kept in LATEST_FILE, lookups of more snapshots read manifest partitions
+LATEST_ENTRIES = 20
+
+class SnapshotCatalog:
+    '''
+    Append-only manifest of saved snapshots. Every entry (folder, file name, UTC timestamp, row counts, content hash)
+    is appended to monthly partition "manifest-YYYY-MM.jsonl" and newest entries are also kept in small LATEST_FILE index,
+    so finding latest snapshots reads one small file and a time range reads only partitions of its months.
+
+    Parameters:
+        store (DataLakeFolderStore): folder of the catalog, with read, write and append methods
+    '''
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def partition_name(timestamp: str) -> str:
+        return f'manifest-{timestamp[:7]}.jsonl'
+
+    def record(self, folder: str, file_name: str, timestamp: str, content: bytes, rows: dict, digest: str = None) -> dict:
+        '''
+        Add snapshot to the catalog.
+
+        Parameters:
+            folder, file_name (str): location of the snapshot in the container
+            timestamp (str): UTC time of the snapshot, ISO format
+            content (bytes): snapshot content, only its hash is stored (None when digest is given)
+            rows (dict): number of rows of every resource type
+            digest (str): SHA-256 hex digest of the content, for snapshots streamed without keeping the content
+
+        Returns:
+            entry (dict): catalog entry of the snapshot
+        '''
+        entry = {'folder': folder, 'file': file_name, 'timestamp': timestamp, 'rows': sum(rows.values()), 'rows_by_type': rows,
+                 'sha256': digest or hashlib.sha256(content).hexdigest()}
+        self.store.append(self.partition_name(timestamp), (json.dumps(entry) + '\n').encode())
+        index = self.read_index()
+        index = {'first': index.get('first', timestamp), 'entries': ([entry] + index.get('entries', []))[:LATEST_ENTRIES]}
+        self.store.write(LATEST_FILE, json.dumps(index).encode())
+        return entry
+
+    def read_index(self) -> dict:
+        return json.loads(self.store.read(LATEST_FILE) or b'{}')
+
+    def latest(self, count: int = 2) -> list:
+        '''
+        Newest snapshots, the newest first.
+        '''
+        index = self.read_index()
+        latest = index.get('entries', [])
+        if count <= len(latest) or len(latest) < LATEST_ENTRIES:
+            return latest[:count]
+        # older entries are read from manifest partitions
+        return list(reversed(self.between(index['first'], latest[0]['timestamp'])))[:count]
+
+    def between(self, start: str, end: str) -> list:
+        '''
+        Snapshots with timestamp in [start, end] range (ISO format), the oldest first.
+        '''
+        entries = []
+        month = datetime.date.fromisoformat(start[:7] + '-01')
+        while month.isoformat()[:7] <= end[:7]:
+            entries += [entry for entry in self.read_partition(month.isoformat()[:7]) or []
+                        if start <= entry['timestamp'] <= end]
+            month = (month + datetime.timedelta(days = 32)).replace(day = 1)
+        return sorted(entries, key = lambda entry: entry['timestamp'])
+
+    def read_partition(self, month: str) -> list:
+        content = self.store.read(self.partition_name(month))
+        if content is None:
+            return None
+        return [json.loads(line) for line in content.decode().splitlines() if line]
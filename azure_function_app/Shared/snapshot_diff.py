@@ -0,0 +1,217 @@
+import io
+import csv
+import json
+import tempfile
+import pyarrow.parquet as pq
+
+from Shared.external_sort import external_sort, SORT_CHUNK_ROWS
+
+KEY_COLUMNS = ('type', 'id')
+SPOOL_BYTES = 8 * 1024 ** 2
+# snapshot columns holding comma-separated edges of the row
+EDGE_COLUMNS = ('parent', 'relatives', 'access')
+PARQUET_MAGIC = b'PAR1'
+
+def read_snapshot(file, columns: list = None) -> tuple:
+    '''
+    Open snapshot saved by CreateDiagram (binary file object, CP1250 encoded CSV or Parquet) for streaming.
+
+    Parameters:
+        file: binary file object of the snapshot
+        columns (list): columns needed by the caller, Parquet snapshots read only these (CSV snapshots always all)
+
+    Returns:
+        header (list): column names
+        rows (iterator): rows as lists of strings
+    '''
+    if file.read(len(PARQUET_MAGIC)) == PARQUET_MAGIC:
+        file.seek(0)
+        return read_parquet_snapshot(file, columns)
+    file.seek(0)
+    reader = csv.reader(io.TextIOWrapper(file, encoding = 'CP1250', newline = ''))
+    header = next(reader, [])
+    if 'id' not in header:
+        return header, reader
+    id_position = header.index('id')
+
+    def rows():
+        # ids are saved between quotation marks for draw.io, Parquet snapshots keep them without
+        for row in reader:
+            row[id_position] = row[id_position].strip('"')
+            yield row
+
+    return header, rows()
+
+def read_parquet_snapshot(file, columns: list = None) -> tuple:
+    parquet_file = pq.ParquetFile(file)
+    names = parquet_file.schema_arrow.names
+    header = [column for column in names if columns is None or column in columns]
+
+    def rows():
+        for batch in parquet_file.iter_batches(columns = header):
+            for row in zip(*[column.to_pylist() for column in batch.columns]):
+                yield ['' if value is None else value for value in row]
+
+    return header, rows()
+
+def keyed_rows(open_file, header: list, key_columns: tuple = KEY_COLUMNS, chunk_rows: int = SORT_CHUNK_ROWS):
+    '''
+    Iterate over (key, row) pairs of the snapshot in key order. Snapshots saved by CreateDiagram are already sorted
+    by (type, id), so they are only streamed; older unsorted snapshots are detected in the first pass and sorted on disk.
+
+    Parameters:
+        open_file (function): returns the snapshot file object (positioned at the header), called once per pass
+        header (list): column names of the snapshot
+        key_columns (tuple): columns making the row key
+        chunk_rows (int): rows kept in memory while sorting
+    '''
+    # first pass reads only key columns
+    key_header, rows = read_snapshot(open_file(), list(key_columns))
+    key_positions = [key_header.index(column) for column in key_columns]
+    previous = None
+    is_sorted = True
+    for row in rows:
+        current = tuple(row[position] for position in key_positions)
+        if previous is not None and current < previous:
+            is_sorted = False
+            break
+        previous = current
+
+    positions = [header.index(column) for column in key_columns]
+    def key(row):
+        return tuple(row[position] for position in positions)
+
+    _, rows = read_snapshot(open_file())
+    for row in (rows if is_sorted else external_sort(rows, key, chunk_rows)):
+        yield key(row), row
+
+def diff_snapshots(latest_file, previous_file, key_columns: tuple = KEY_COLUMNS, chunk_rows: int = SORT_CHUNK_ROWS):
+    '''
+    Compare two snapshots with a merge-join of their sorted rows, in memory independent of snapshot size.
+
+    Parameters:
+        latest_file, previous_file (function): return binary file object of the snapshot, see keyed_rows
+        key_columns (tuple): columns identifying the row
+        chunk_rows (int): rows kept in memory when unsorted snapshot has to be sorted
+
+    Returns:
+        columns (dict): {"columns_added": [...], "columns_removed": [...]}
+        changes (iterator): ('added' | 'removed' | 'changed', record) pairs, in key order
+    '''
+    latest_header, _ = read_snapshot(latest_file())
+    previous_header, _ = read_snapshot(previous_file())
+    columns = {'columns_added': [column for column in latest_header if column not in previous_header],
+               'columns_removed': [column for column in previous_header if column not in latest_header]}
+    common = [column for column in latest_header if column in previous_header and column not in key_columns]
+    latest_positions = [latest_header.index(column) for column in common]
+    previous_positions = [previous_header.index(column) for column in common]
+
+    def changes():
+        latest_rows = keyed_rows(latest_file, latest_header, key_columns, chunk_rows)
+        previous_rows = keyed_rows(previous_file, previous_header, key_columns, chunk_rows)
+        latest = next(latest_rows, None)
+        previous = next(previous_rows, None)
+        while latest is not None or previous is not None:
+            if previous is None or (latest is not None and latest[0] < previous[0]):
+                yield 'added', dict(zip(latest_header, latest[1]))
+                latest = next(latest_rows, None)
+            elif latest is None or previous[0] < latest[0]:
+                yield 'removed', dict(zip(previous_header, previous[1]))
+                previous = next(previous_rows, None)
+            else:
+                fields = {column: [previous[1][previous_position], latest[1][latest_position]]
+                          for column, latest_position, previous_position in zip(common, latest_positions, previous_positions)
+                          if latest[1][latest_position] != previous[1][previous_position]}
+                if fields:
+                    record = dict(zip(key_columns, latest[0]))
+                    record['changes'] = fields
+                    yield 'changed', record
+                latest = next(latest_rows, None)
+                previous = next(previous_rows, None)
+
+    return columns, changes()
+
+def write_diff_json(columns: dict, changes, output) -> dict:
+    '''
+    Write diff as JSON object {"added": [...], "removed": [...], "changed": [...], "columns_added": [...], "columns_removed": [...]}
+    into binary output, record by record. Sections are collected in spooled temporary files, so only a few MB stay in memory.
+
+    Returns:
+        counts (dict): number of added, removed and changed records
+    '''
+    sections = {name: tempfile.SpooledTemporaryFile(max_size = SPOOL_BYTES) for name in ('added', 'removed', 'changed')}
+    counts = {name: 0 for name in sections}
+    for change_type, record in changes:
+        section = sections[change_type]
+        if counts[change_type]:
+            section.write(b', ')
+        section.write(json.dumps(record).encode())
+        counts[change_type] += 1
+
+    output.write(b'{')
+    for name, section in sections.items():
+        output.write(f'"{name}": ['.encode())
+        section.seek(0)
+        for block in iter(lambda: section.read(1024 ** 2), b''):
+            output.write(block)
+        section.close()
+        output.write(b'], ')
+    output.write(f'"columns_added": {json.dumps(columns["columns_added"])}, '
+                 f'"columns_removed": {json.dumps(columns["columns_removed"])}}}'.encode())
+    return counts
+
+def graph_items(open_file):
+    '''
+    Iterate over nodes and edges of the snapshot: ('node', node type, id) and (edge type, source type, source id, target id)
+    tuples, where edge type is 'parent', 'relatives' or 'access' (target is "access right:user id", so changed access right
+    of a workspace user is reported as removed and added edge). Order of ids in the edge strings doesn't matter.
+    '''
+    header, rows = read_snapshot(open_file(), ['id', 'type'] + list(EDGE_COLUMNS))
+    id_position, type_position = header.index('id'), header.index('type')
+    edge_positions = [(column, header.index(column)) for column in EDGE_COLUMNS if column in header]
+    for row in rows:
+        node_id, node_type = row[id_position], row[type_position]
+        yield 'node', node_type, node_id
+        for column, position in edge_positions:
+            for target in set(row[position].split(',')) if row[position] else ():
+                yield column, node_type, node_id, target
+
+def graph_diff(latest_file, previous_file, max_items: int = None) -> dict:
+    '''
+    Compare lineage of two snapshots - added and removed nodes and edges, grouped by type. Nodes and edges are kept
+    as sets of 64-bit hashes (hash() is stable within one process, that is enough here), details of the differing ones
+    are collected in a second pass over the snapshots.
+    Changes of names or other attributes are not reported.
+
+    Parameters:
+        latest_file, previous_file (function): return binary file object of the snapshot, called once per pass
+        max_items (int): maximal number of ids listed in every group (counts in summary are always complete)
+
+    Returns:
+        diff (dict): {"summary": counts, "nodes": {"added"/"removed": {node type: [ids]}},
+                      "edges": {"added"/"removed": {edge type: {source type: [[source, target]]}}}}
+    '''
+    latest = {hash(item) for item in graph_items(latest_file)}
+    previous = {hash(item) for item in graph_items(previous_file)}
+    changes = {'added': (latest_file, latest - previous), 'removed': (previous_file, previous - latest)}
+    del latest, previous
+
+    diff = {'summary': {}, 'nodes': {'added': {}, 'removed': {}}, 'edges': {'added': {}, 'removed': {}}}
+    for change_type, (open_file, digests) in changes.items():
+        nodes, edges = diff['nodes'][change_type], diff['edges'][change_type]
+        node_count = edge_count = 0
+        for item in graph_items(open_file):
+            if hash(item) not in digests:
+                continue
+            if item[0] == 'node':
+                node_count += 1
+                group = nodes.setdefault(item[1], [])
+                value = item[2]
+            else:
+                edge_count += 1
+                group = edges.setdefault(item[0], {}).setdefault(item[1], [])
+                value = [item[2], item[3]]
+            if max_items is None or len(group) < max_items:
+                group.append(value)
+        diff['summary'][change_type] = {'nodes': node_count, 'edges': edge_count}
+    return diff
@@ -0,0 +1,238 @@
+import io
+import csv
+import gzip
+import json
+
+from Shared.snapshot_diff import read_snapshot, diff_snapshots, KEY_COLUMNS
+
+INDEX_FILE = 'history.json'
+HISTORY_COLUMNS = ['id', 'name', 'type', 'parent', 'relatives', 'access']
+# new full base is written after this many deltas, or when deltas since the last base changed more rows than
+# BASE_CHURN part of the base, so replaying never needs too many files
+BASE_EVERY = 30
+BASE_CHURN = 0.5
+
+class SnapshotHistory:
+    '''
+    History of snapshots kept as periodic full bases and per-run deltas (added rows, changed values, removed keys)
+    produced by the snapshot diff. Storage grows with the number of changes, not with the number of runs,
+    and lineage at any point in time is rebuilt from the nearest earlier base and the deltas after it.
+
+    Parameters:
+        store (DataLakeFolderStore): history folder, with read, write and delete methods
+    '''
+
+    def __init__(self, store):
+        self.store = store
+
+    def read_index(self) -> list:
+        '''
+        History entries, the oldest first: {"timestamp", "kind": "base" | "delta", "file", "rows" or "changes", "sha256"}.
+        '''
+        return json.loads(self.store.read(INDEX_FILE) or b'[]')
+
+    def write_index(self, index: list):
+        self.store.write(INDEX_FILE, json.dumps(index).encode())
+
+    def record(self, timestamp: str, latest_file, previous_file = None, digest: str = None, previous_digest: str = None) -> dict:
+        '''
+        Add snapshot of a run to the history - as a delta against the previous run's snapshot or as a new base.
+        A delta is written only against the snapshot of the last history entry, when digests tell that the previous
+        snapshot is another one (for example history was not recorded by some run), a new base is written instead.
+
+        Parameters:
+            timestamp (str): UTC time of the run, ISO format
+            latest_file (function): returns binary file object of the run's snapshot
+            previous_file (function): returns binary file object of the previous run's snapshot, None when there is no such
+            digest (str): SHA-256 of the run's snapshot (catalog entry), kept in the history entry
+            previous_digest (str): SHA-256 of the previous run's snapshot, compared with the one of the last history entry
+        '''
+        index = self.read_index()
+        bases = [position for position, entry in enumerate(index) if entry['kind'] == 'base']
+        since_base = index[bases[-1] + 1:] if bases else []
+        is_base = previous_file is None or not bases or index[-1]['timestamp'] >= timestamp or len(since_base) >= BASE_EVERY
+        if previous_digest is not None and not is_base:
+            is_base = index[-1].get('sha256') != previous_digest
+
+        if not is_base:
+            # delta can't carry a column added to or removed from the snapshots, so history starts from a new base
+            delta = snapshot_delta(latest_file, previous_file)
+            is_base = delta is None or \
+                sum(entry['changes'] for entry in since_base) + delta['changes'] > BASE_CHURN * index[bases[-1]]['rows']
+
+        if is_base:
+            header, rows = read_snapshot(latest_file(), HISTORY_COLUMNS)
+            positions = [header.index(column) if column in header else None for column in HISTORY_COLUMNS]
+            content, count = encode_rows(HISTORY_COLUMNS, ([row[position] if position is not None else '' for position in positions]
+                                                           for row in rows))
+            entry = {'timestamp': timestamp, 'kind': 'base', 'file': f'base-{file_stamp(timestamp)}.csv.gz', 'rows': count}
+            self.store.write(entry['file'], content)
+        else:
+            entry = {'timestamp': timestamp, 'kind': 'delta', 'file': f'delta-{file_stamp(timestamp)}.json.gz',
+                     'changes': delta['changes']}
+            self.store.write(entry['file'], gzip.compress(json.dumps(delta).encode()))
+        if digest is not None:
+            entry['sha256'] = digest
+
+        self.write_index(index + [entry])
+        return entry
+
+    def read_base(self, entry: dict) -> dict:
+        header, rows = read_snapshot(io.BytesIO(gzip.decompress(self.store.read(entry['file']))))
+        positions = [header.index(column) for column in KEY_COLUMNS]
+        return {tuple(row[position] for position in positions): dict(zip(header, row)) for row in rows}
+
+    def read_delta(self, entry: dict) -> dict:
+        return json.loads(gzip.decompress(self.store.read(entry['file'])))
+
+    def state_at(self, timestamp: str) -> dict:
+        '''
+        Rebuild lineage at given time (ISO format, UTC) - as it was saved by the last run before or at that time.
+
+        Returns:
+            state (dict): (type, id): row dictionary with HISTORY_COLUMNS, empty when history starts later
+        '''
+        entries = [entry for entry in self.read_index() if entry['timestamp'] <= timestamp]
+        bases = [position for position, entry in enumerate(entries) if entry['kind'] == 'base']
+        if not bases:
+            return {}
+        state = self.read_base(entries[bases[-1]])
+        for entry in entries[bases[-1] + 1:]:
+            apply_delta(state, self.read_delta(entry))
+        return state
+
+    def snapshot_at(self, timestamp: str) -> bytes:
+        '''
+        Rebuild lineage at given time as CSV snapshot (CP1250, sorted by type and id, like snapshots saved by CreateDiagram).
+        '''
+        state = self.state_at(timestamp)
+        return encode_rows(HISTORY_COLUMNS, ([row.get(column, '') for column in HISTORY_COLUMNS] for _, row in sorted(state.items())),
+                           compress = False)[0]
+
+    def compact(self, merge_before: str, drop_before: str = None) -> dict:
+        '''
+        Compaction job: deltas older than merge_before are merged into one delta per day (points in time between them are lost)
+        and with drop_before history older than that time is removed, starting the history from the last base before it.
+
+        Returns:
+            counts (dict): number of removed and written files
+        '''
+        index = self.read_index()
+
+        # merge consecutive deltas of the same day (bases stay where they are), merged deltas are kept in memory until
+        # the whole day is merged
+        compacted, merged, starts = [], {}, {}
+        for entry in index:
+            previous = compacted[-1] if compacted else None
+            if (entry['kind'] == 'delta' and entry['timestamp'] < merge_before and previous is not None and previous['kind'] == 'delta'
+                    and previous['timestamp'][:10] == entry['timestamp'][:10]):
+                delta = merge_deltas(merged.pop(previous['file'], None) or self.read_delta(previous), self.read_delta(entry))
+                # name of the merged delta covers its whole range, so it never overwrites a file the current index refers to
+                start = starts.pop(previous['file'], previous['timestamp'])
+                merged_entry = {'timestamp': entry['timestamp'], 'kind': 'delta', 'changes': delta['changes'],
+                                'file': f'delta-{file_stamp(start)}-{file_stamp(entry["timestamp"])}.json.gz'}
+                if 'sha256' in entry:
+                    merged_entry['sha256'] = entry['sha256']
+                merged[merged_entry['file']], starts[merged_entry['file']] = delta, start
+                compacted[-1] = merged_entry
+            else:
+                compacted.append(entry)
+
+        # points before drop_before can't be rebuilt anymore, entries before the last base preceding it are not needed
+        if drop_before is not None:
+            bases = [position for position, entry in enumerate(compacted) if entry['kind'] == 'base' and entry['timestamp'] <= drop_before]
+            if bases:
+                compacted = compacted[bases[-1]:]
+
+        # merged deltas are written under new names, then the index is switched to them and only then the replaced files
+        # are deleted - an interrupted job leaves only unreferenced files behind, never an index pointing to a changed file
+        kept = {entry['file'] for entry in compacted}
+        written = [file_name for file_name in merged if file_name in kept]
+        for file_name in written:
+            self.store.write(file_name, gzip.compress(json.dumps(merged[file_name]).encode()))
+        self.write_index(compacted)
+        removed = {entry['file'] for entry in index} - kept
+        for file_name in removed:
+            self.store.delete(file_name)
+        return {'removed': len(removed), 'written': len(written)}
+
+def file_stamp(timestamp: str) -> str:
+    return timestamp.replace(':', '').replace('-', '').replace('.', '')
+
+def encode_rows(header: list, rows, compress: bool = True) -> tuple:
+    '''
+    Write rows as CP1250 CSV (gzip-compressed by default), returns content and number of rows.
+    '''
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    content = output.getvalue().encode('CP1250', errors = 'replace')
+    return (gzip.compress(content) if compress else content), count
+
+def snapshot_delta(latest_file, previous_file) -> dict:
+    '''
+    Delta turning the previous snapshot into the latest one, taken from the snapshot diff:
+    {"upsert": [added rows], "update": [[type, id, {column: new value}]], "delete": [[type, id]], "changes": count}.
+    None when HISTORY_COLUMNS of the snapshots differ (values of the added column would be lost).
+    '''
+    columns, changes = diff_snapshots(latest_file, previous_file)
+    if any(column in HISTORY_COLUMNS for column in columns['columns_added'] + columns['columns_removed']):
+        return None
+    delta = {'upsert': [], 'update': [], 'delete': [], 'changes': 0}
+    for change_type, record in changes:
+        key = [record['type'], record['id']]
+        if change_type == 'added':
+            delta['upsert'].append({column: record.get(column, '') for column in HISTORY_COLUMNS})
+        elif change_type == 'removed':
+            delta['delete'].append(key)
+        else:
+            fields = {column: values[1] for column, values in record['changes'].items() if column in HISTORY_COLUMNS}
+            if not fields:
+                continue
+            delta['update'].append(key + [fields])
+        delta['changes'] += 1
+    return delta
+
+def apply_delta(state: dict, delta: dict):
+    '''
+    Apply delta to the state ((type, id): row dictionary) in place.
+    '''
+    for key in delta['delete']:
+        state.pop(tuple(key), None)
+    for row in delta['upsert']:
+        state[(row['type'], row['id'])] = row
+    for node_type, node_id, fields in delta['update']:
+        row = state.get((node_type, node_id))
+        if row is not None:
+            state[(node_type, node_id)] = dict(row, **fields)
+
+def merge_deltas(first: dict, second: dict) -> dict:
+    '''
+    One delta with the same effect as applying first and then second delta.
+    '''
+    upserts = {(row['type'], row['id']): row for row in first['upsert']}
+    updates = {(node_type, node_id): fields for node_type, node_id, fields in first['update']}
+    deletes = {tuple(key) for key in first['delete']}
+
+    for key in map(tuple, second['delete']):
+        upserts.pop(key, None)
+        updates.pop(key, None)
+        deletes.add(key)
+    for row in second['upsert']:
+        key = (row['type'], row['id'])
+        upserts[key] = row
+        updates.pop(key, None)
+        deletes.discard(key)
+    for node_type, node_id, fields in second['update']:
+        key = (node_type, node_id)
+        if key in upserts:
+            upserts[key] = dict(upserts[key], **fields)
+        else:
+            updates[key] = dict(updates.get(key, {}), **fields)
+
+    return {'upsert': list(upserts.values()), 'update': [list(key) + [fields] for key, fields in updates.items()],
+            'delete': [list(key) for key in deletes], 'changes': len(upserts) + len(updates) + len(deletes)}
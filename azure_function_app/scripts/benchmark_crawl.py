@@ -0,0 +1,220 @@
+'''
+End-to-end benchmark of the crawl against local mock of PBI Service API (scripts/mock_pbi_api) serving synthetic tenants
+(scripts/synthetic_tenant). For every scale it reports wall time, number of API requests, peak memory of Python allocations
+and size of the output of execute_load_transform and of create_graph.main from local_app, and checks the output:
+resource counts expected from the tenant, the same graph from every backend and from create_graph.main, and golden files.
+
+Run from azure_function_app folder:
+    python -m scripts.benchmark_crawl
+    python -m scripts.benchmark_crawl --workspaces 10 100 1000 --latency 0.05 --throttle_rate 0.02
+    python -m scripts.benchmark_crawl --backends rest scanner --skip_create_graph
+    python -m scripts.benchmark_crawl --update_golden     # (re)write golden files of the sample and synthetic tenants
+
+Peak memory is measured with tracemalloc, which slows the crawl down a little; times are comparable between runs, not with production.
+Scanner backend waits 5 seconds before the first scan status check, its times include that wait.
+'''
+import argparse
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from Shared.pbi_client import PowerBIClient
+from Shared.request_policy import RequestPolicy
+from Shared.data_load_transform import execute_load_transform, MAX_WORKERS
+from scripts.mock_pbi_api import MockPowerBIApi, SAMPLE_TENANT
+from scripts.synthetic_tenant import synthetic_tenant, expected_counts, tenant_size
+
+SCALES = [10, 100, 500]
+OUTPUT_COLUMNS = ['id', 'name', 'type', 'parent', 'relatives', 'access']
+GOLDEN_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+LOCAL_APP = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'local_app')
+
+# runs create_graph.main of local_app in separate process (both apps have their own Shared package)
+CREATE_GRAPH_RUNNER = '''
+import sys, json, time, tracemalloc
+import create_graph
+from Shared.request_policy import RequestPolicy
+create_graph.wd = sys.argv[1]
+tracemalloc.start()
+start = time.perf_counter()
+run_metrics = create_graph.main('benchmark', None, None, None, [], int(sys.argv[4]), RequestPolicy(), sys.argv[3], api_url = sys.argv[2])
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'peak_mb': tracemalloc.get_traced_memory()[1] / 1024 ** 2, 'stages': run_metrics['stages']}))
+'''
+
+def canonical_rows(rows) -> list:
+    '''
+    Output rows as sorted tuples of strings - ids without quotation marks, missing values empty
+    and comma-separated parent, relatives and access sorted, so outputs of different runs can be compared.
+    '''
+    canonical = []
+    for row in rows:
+        row = ['' if not isinstance(value, str) else value for value in row]
+        canonical.append((row[0].strip('"'), row[1], row[2]) + tuple(','.join(sorted(value.split(','))) if value else ''
+                                                                     for value in row[3:]))
+    return sorted(canonical, key = lambda row: (row[2], row[0]))
+
+def frame_rows(output) -> list:
+    return canonical_rows(output[OUTPUT_COLUMNS].itertuples(index = False, name = None))
+
+def csv_rows(content: bytes) -> list:
+    reader = csv.DictReader(io.StringIO(content.decode('CP1250')))
+    return canonical_rows([row[column] for column in OUTPUT_COLUMNS] for row in reader)
+
+def rows_to_csv(rows: list) -> bytes:
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator = '\n')
+    writer.writerow(OUTPUT_COLUMNS)
+    writer.writerows(rows)
+    return output.getvalue().encode('CP1250', errors = 'replace')
+
+def type_counts(rows: list) -> dict:
+    counts = {}
+    for row in rows:
+        counts[row[2]] = counts.get(row[2], 0) + 1
+    return counts
+
+def run_transform(tenant: dict, backend: str, max_workers: int, mock_options: dict) -> tuple:
+    '''
+    Crawl the mock serving the tenant with execute_load_transform.
+
+    Returns:
+        rows (list): canonical output rows
+        metrics (dict): wall time, requests received by the mock, throttled requests, peak memory, output size and stage timings
+    '''
+    with MockPowerBIApi(tenant, **mock_options) as api, \
+         PowerBIClient(base_url = api.url, access_token = 'mock', pool_size = max_workers, policy = RequestPolicy()) as client:
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            output = execute_load_transform(client, [], max_workers, backend)
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        requests_count, throttled = api.request_count, api.throttled_count
+        stages = client.metrics.as_dict()['stages']
+
+    rows = frame_rows(output)
+    output_bytes = len(output.to_csv(index = False, sep = ',', encoding = 'CP1250').encode('CP1250', errors = 'replace'))
+    return rows, {'seconds': round(seconds, 3), 'requests': requests_count, 'throttled': throttled, 'peak_mb': round(peak / 1024 ** 2, 1),
+                  'rows': len(rows), 'output_kb': round(output_bytes / 1024, 1), 'stages': stages}
+
+def run_create_graph(tenant: dict, backend: str, max_workers: int, mock_options: dict) -> tuple:
+    '''
+    Run create_graph.main of local_app against the mock serving the tenant, output is written to temporary folder.
+
+    Returns:
+        rows (list): canonical rows of drawio_relationships.csv
+        metrics (dict): wall time, requests received by the mock, throttled requests, peak memory, size of all output files
+                        and stage timings
+    '''
+    with tempfile.TemporaryDirectory() as folder, MockPowerBIApi(tenant, **mock_options) as api:
+        os.makedirs(os.path.join(folder, 'output'))
+        env = dict(os.environ, PYTHONPATH = LOCAL_APP)
+        process = subprocess.run([sys.executable, '-c', CREATE_GRAPH_RUNNER, folder, api.url, backend, str(max_workers)],
+                                 cwd = folder, env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+        if process.returncode != 0:
+            raise RuntimeError(f'create_graph.main failed:\n{process.stderr.decode(errors = "replace")}')
+        measured = json.loads(process.stdout.decode().strip().splitlines()[-1])
+
+        output_folder = os.path.join(folder, 'output')
+        output_bytes = sum(os.path.getsize(os.path.join(output_folder, name)) for name in os.listdir(output_folder))
+        with open(os.path.join(output_folder, 'drawio_relationships.csv'), 'rb') as file:
+            rows = csv_rows(file.read())
+        requests_count, throttled = api.request_count, api.throttled_count
+
+    return rows, {'seconds': round(measured['seconds'], 3), 'requests': requests_count, 'throttled': throttled,
+                  'peak_mb': round(measured['peak_mb'], 1), 'rows': len(rows), 'output_kb': round(output_bytes / 1024, 1),
+                  'stages': measured['stages']}
+
+def check_golden(name: str, rows: list, update: bool) -> str:
+    '''
+    Compare rows with golden file of the tenant, or (re)write it with update. Returns result of the check.
+    '''
+    path = os.path.join(GOLDEN_FOLDER, name + '.csv')
+    content = rows_to_csv(rows)
+    if update:
+        os.makedirs(GOLDEN_FOLDER, exist_ok = True)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return 'written'
+    if not os.path.isfile(path):
+        return 'missing (run with --update_golden)'
+    with open(path, 'rb') as file:
+        golden = csv_rows(file.read())
+    if golden == rows:
+        return 'ok'
+    missing, extra = len(set(golden) - set(rows)), len(set(rows) - set(golden))
+    return f'FAILED ({missing} golden rows missing, {extra} unexpected rows)'
+
+def run_benchmark(name: str, tenant: dict, backends: list, max_workers: int, mock_options: dict, create_graph: bool = True,
+                  update_golden: bool = False) -> list:
+    '''
+    Benchmark and check crawl of one tenant with every backend (and create_graph.main with the first one).
+
+    Returns:
+        results (list): metrics and check results of every run
+    '''
+    results = []
+    reference = None
+    expected = expected_counts(tenant)
+    runs = [('execute_load_transform', backend, run_transform) for backend in backends]
+    if create_graph:
+        runs.append(('create_graph.main', backends[0], run_create_graph))
+
+    for target, backend, run in runs:
+        rows, metrics = run(tenant, backend, max_workers, mock_options)
+        checks = {'counts': 'ok' if type_counts(rows) == expected else f'FAILED (expected {expected}, got {type_counts(rows)})'}
+        if reference is None:
+            reference = rows
+            checks['golden'] = check_golden(name, rows, update_golden)
+        else:
+            checks['same_output'] = 'ok' if rows == reference else 'FAILED'
+        results.append(dict({'tenant': name, 'target': target, 'backend': backend}, **metrics, checks = checks))
+        print(json.dumps(results[-1]))
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark crawl against local mock of PBI Service API')
+    parser.add_argument('--workspaces', type=int, nargs='+', default=SCALES, help='numbers of workspaces of the synthetic tenants')
+    parser.add_argument('--users', type=int, default=5, help='users per workspace')
+    parser.add_argument('--dataflows', type=int, default=2, help='dataflows per workspace')
+    parser.add_argument('--datasets', type=int, default=5, help='datasets per workspace')
+    parser.add_argument('--reports', type=int, default=2, help='reports per dataset')
+    parser.add_argument('--dashboards', type=int, default=1, help='dashboards per workspace')
+    parser.add_argument('--tiles', type=int, default=4, help='tiles per dashboard')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backends', nargs='+', choices=['rest', 'scanner'], default=['rest'])
+    parser.add_argument('--max_workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every mock response is delayed by')
+    parser.add_argument('--throttle_rate', type=float, default=0.0, help='part of requests answered with 429 (0-1)')
+    parser.add_argument('--retry_after', type=float, default=0.1, help='seconds in Retry-After header of 429 responses')
+    parser.add_argument('--skip_create_graph', action='store_true', help='benchmark only execute_load_transform')
+    parser.add_argument('--update_golden', action='store_true', help='write golden files instead of checking them')
+    args = parser.parse_args()
+
+    mock_options = {'latency': args.latency, 'throttle_rate': args.throttle_rate, 'retry_after': args.retry_after, 'seed': args.seed,
+                    'scan_duration': 0}
+    tenants = [('sample', SAMPLE_TENANT)]
+    for workspaces in args.workspaces:
+        tenant = synthetic_tenant(workspaces, args.users, args.dataflows, args.datasets, args.reports, args.dashboards, args.tiles,
+                                  seed = args.seed)
+        tenants.append((f'synthetic-w{workspaces}-u{args.users}-df{args.dataflows}-ds{args.datasets}-rp{args.reports}'
+                        f'-db{args.dashboards}-tl{args.tiles}-seed{args.seed}', tenant))
+
+    results = []
+    for name, tenant in tenants:
+        print(f'{name}: {tenant_size(tenant)}')
+        results += run_benchmark(name, tenant, args.backends, args.max_workers, mock_options, not args.skip_create_graph, args.update_golden)
+
+    failed = [result for result in results if any(check.startswith('FAILED') for check in result['checks'].values())]
+    print(f'{len(results)} runs, {len(failed)} with failed checks')
+    sys.exit(1 if failed else 0)
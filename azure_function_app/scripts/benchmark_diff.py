@@ -0,0 +1,88 @@
+'''
+Benchmark of the streaming snapshot diff used by ControlChanges, on synthetic CSV snapshots (no Azure calls).
+
+Run from azure_function_app folder:
+    python -m scripts.benchmark_diff
+    python -m scripts.benchmark_diff --rows 1000000 5000000 --change_rate 0.01 --unsorted
+    python -m scripts.benchmark_diff --mode graph
+'''
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+
+from Shared.snapshot_diff import diff_snapshots, write_diff_json, graph_diff
+
+TYPES = ['dashboards', 'dataflows', 'datasets', 'reports', 'users', 'workspaces']
+
+def snapshot_records(rows: int, change_rate: float, seed: int):
+    '''
+    Generate rows looking like CreateDiagram output, already sorted by (type, id). Snapshots with different seeds share
+    most of the rows, about change_rate of rows is removed, changed or replaced with a new one.
+    '''
+    rng = random.Random(seed)
+    for number in range(rows):
+        node_type = TYPES[number * len(TYPES) // rows]
+        resource_id = f'{node_type[:2]}{number:012}'
+        parent = f'ws{number % (rows // 50 + 1)}'
+        if rng.random() < change_rate:
+            change = rng.randrange(3)
+            if change == 0:
+                continue
+            if change == 1:
+                parent = f'ws{rng.randrange(rows // 50 + 1)}'
+            else:
+                resource_id += f'-{seed}'
+        yield [f'"{resource_id}"', f'Resource {number}', node_type, parent, '']
+
+def write_snapshot(path: str, rows: int, change_rate: float, seed: int, shuffle: bool = False):
+    records = snapshot_records(rows, change_rate, seed)
+    if shuffle:
+        records = list(records)
+        random.Random(seed).shuffle(records)
+    with open(path, 'w', encoding = 'CP1250', newline = '') as file:
+        writer = csv.writer(file)
+        writer.writerow(['id', 'name', 'type', 'parent', 'relatives'])
+        writer.writerows(records)
+
+def run_benchmark(row_counts: list, change_rate: float, shuffle: bool, mode: str = 'rows') -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in row_counts:
+            latest, previous, output = (os.path.join(folder, name) for name in ('latest.csv', 'previous.csv', 'diff.json'))
+            write_snapshot(previous, rows, change_rate, seed = 1, shuffle = shuffle)
+            write_snapshot(latest, rows, change_rate, seed = 2, shuffle = shuffle)
+
+            start = time.perf_counter()
+            if mode == 'graph':
+                diff = graph_diff(lambda: open(latest, 'rb'), lambda: open(previous, 'rb'))
+                with open(output, 'w') as file:
+                    json.dump(diff, file)
+                counts = diff['summary']
+            else:
+                columns, changes = diff_snapshots(lambda: open(latest, 'rb'), lambda: open(previous, 'rb'))
+                with open(output, 'wb') as file:
+                    counts = write_diff_json(columns, changes, file)
+            seconds = time.perf_counter() - start
+
+            results.append({'rows': rows, 'seconds': round(seconds, 2), 'rows_per_second': int(2 * rows / seconds),
+                            'output_mb': round(os.path.getsize(output) / 1024 ** 2, 1), **counts})
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark of the streaming snapshot diff')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000, 3000000])
+    parser.add_argument('--change_rate', type=float, default=0.01, help='part of rows added, removed or changed between snapshots')
+    parser.add_argument('--mode', choices=['rows', 'graph'], default='rows', help='diff of rows or of lineage nodes and edges')
+    parser.add_argument('--unsorted', action='store_true', help='shuffle snapshots, so they have to be sorted on disk')
+    args = parser.parse_args()
+
+    for result in run_benchmark(args.rows, args.change_rate, args.unsorted, args.mode):
+        print(result)
+    # on Linux ru_maxrss is in KB, with --unsorted it includes shuffling of generated snapshots
+    print('peak memory MB:', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024)
@@ -0,0 +1,82 @@
+'''
+Scaling benchmark of transform_workspaces_data on synthetic workspaces (no API calls).
+
+Run from azure_function_app folder:
+    python -m scripts.benchmark_transform
+    python -m scripts.benchmark_transform --workspaces 10 100 1000 5000 --items 10
+'''
+import argparse
+import random
+import time
+import pandas as pd
+
+from Shared.data_load_transform import transform_workspaces_data
+
+def synthetic_workspace_data(workspace_id: str, items: int, rng: random.Random) -> tuple:
+    '''
+    Create (data_dict, missing_cat) pair looking like downloaded data of one workspace,
+    with given number of users, dataflows, datasets, reports and dashboards.
+    '''
+    users = pd.DataFrame({'identifier': [f'user{rng.randrange(items * 20)}@contoso.com' for _ in range(items)],
+                          'displayName': [f'User {i}' for i in range(items)],
+                          'groupUserAccessRight': [rng.choice(['Admin', 'Member', 'Viewer']) for _ in range(items)]})
+    dataflows = pd.DataFrame({'id': [f'{workspace_id}-df{i}' for i in range(items)], 'name': [f'Dataflow {i}' for i in range(items)]})
+    datasets = pd.DataFrame({'id': [f'{workspace_id}-ds{i}' for i in range(items)], 'name': [f'Dataset {i}' for i in range(items)],
+                             'configuredBy': list(users['identifier'])})
+    reports = pd.DataFrame({'id': [f'{workspace_id}-rp{i}' for i in range(items)], 'name': [f'Report {i}' for i in range(items)],
+                            'datasetId': [rng.choice(list(datasets['id'])) for _ in range(items)]})
+    dashboards = pd.DataFrame({'id': [f'{workspace_id}-db{i}' for i in range(items)], 'displayName': [f'Dashboard {i}' for i in range(items)]})
+
+    def datasources(ids, category):
+        return pd.DataFrame([{'datasourceType': 'Sql', category + 'Id': resource_id,
+                              'connectionDetails': {'server': f'sql{rng.randrange(items)}.contoso.com', 'database': 'db'}}
+                             for resource_id in ids])
+
+    data_dict = {
+        'users': users,
+        'dataflows': dataflows,
+        'dataflows_datasources': datasources(dataflows['id'], 'dataflows'),
+        'datasets': datasets,
+        'datasets_datasources': datasources(datasets['id'], 'datasets'),
+        'datasets_upstreamdataflows': pd.DataFrame({'datasetObjectId': list(datasets['id']),
+                                                    'dataflowObjectId': [rng.choice(list(dataflows['id'])) for _ in range(items)],
+                                                    'workspaceObjectId': workspace_id}),
+        'reports': reports,
+        'dashboards': dashboards,
+        'dashboards_datasources': pd.DataFrame({'id': [f'{workspace_id}-tl{i}' for i in range(items)],
+                                                'reportId': list(reports['id']), 'datasetId': list(reports['datasetId']),
+                                                'dashboardsId': list(dashboards['id'])}),
+    }
+    return data_dict, []
+
+def synthetic_tenant_data(workspaces: int, items: int, seed: int = 0) -> tuple:
+    '''
+    Create selected_groups dataframe and workspaces_data list of synthetic tenant.
+    '''
+    rng = random.Random(seed)
+    selected_groups = pd.DataFrame({'id': [f'ws{i}' for i in range(workspaces)], 'name': [f'Workspace {i}' for i in range(workspaces)]})
+    workspaces_data = [synthetic_workspace_data(workspace_id, items, rng) for workspace_id in selected_groups['id']]
+    return selected_groups, workspaces_data
+
+def run_benchmark(workspace_counts: list, items: int, repeat: int = 3) -> list:
+    results = []
+    for workspaces in workspace_counts:
+        selected_groups, workspaces_data = synthetic_tenant_data(workspaces, items)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = transform_workspaces_data(selected_groups, workspaces_data)
+            timings.append(time.perf_counter() - start)
+        results.append({'workspaces': workspaces, 'rows': len(output), 'seconds': min(timings),
+                        'ms_per_workspace': 1000 * min(timings) / workspaces})
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the draw.io transform')
+    parser.add_argument('--workspaces', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--items', type=int, default=5, help='number of resources of every category in a workspace')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(pd.DataFrame(run_benchmark(args.workspaces, args.items, args.repeat)).to_string(index=False))
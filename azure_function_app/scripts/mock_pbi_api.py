@@ -0,0 +1,271 @@
+'''
+Local mock of PBI Service API - admin scanner endpoints and the standard workspace endpoints called by the REST crawl
+(groups, their users, dataflows, datasets, reports, dashboards, datasources, upstream dataflows and tiles),
+so both crawls can be run and checked offline. Latency and 429 throttling can be injected.
+
+Run from azure_function_app folder:
+    python -m scripts.mock_pbi_api                      # serve sample tenant on http://localhost:5000
+    python -m scripts.mock_pbi_api --tenant tenant.json # serve tenant from file (scan result format, see scripts/synthetic_tenant)
+    python -m scripts.mock_pbi_api --latency 0.2 --throttle_rate 0.05
+    python -m scripts.mock_pbi_api --crawl              # crawl the mock with scanner backend and print the result
+    python -m scripts.mock_pbi_api --crawl --backend rest
+'''
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+API_PREFIX = '/v1.0/myorg/'
+CATEGORIES = ['users', 'dataflows', 'datasets', 'reports', 'dashboards']
+# keys of the scan result missing in responses of the standard API
+SCAN_ONLY_KEYS = ['datasourceUsages', 'upstreamDataflows', 'tiles', 'users']
+
+# tenant is kept in the same format as admin scan result
+SAMPLE_TENANT = {
+    'workspaces': [
+        {
+            'id': 'ws-sales', 'name': 'Sales', 'type': 'Workspace', 'state': 'Active',
+            'users': [{'groupUserAccessRight': 'Admin', 'identifier': 'anna@contoso.com', 'displayName': 'Anna', 'principalType': 'User'},
+                      {'groupUserAccessRight': 'Viewer', 'identifier': 'bob@contoso.com', 'displayName': 'Bob', 'principalType': 'User'}],
+            'dataflows': [{'objectId': 'df-orders', 'name': 'Orders', 'configuredBy': 'anna@contoso.com',
+                           'datasourceUsages': [{'datasourceInstanceId': 'src-sql'}]}],
+            'datasets': [{'id': 'ds-sales', 'name': 'Sales model', 'configuredBy': 'anna@contoso.com',
+                          'datasourceUsages': [{'datasourceInstanceId': 'src-sql'}],
+                          'upstreamDataflows': [{'targetDataflowId': 'df-orders', 'groupId': 'ws-sales'}]}],
+            'reports': [{'id': 'rp-sales', 'name': 'Sales report', 'datasetId': 'ds-sales'}],
+            'dashboards': [{'id': 'db-sales', 'displayName': 'Sales dashboard',
+                            'tiles': [{'id': 'tl-1', 'title': 'Revenue', 'reportId': 'rp-sales', 'datasetId': 'ds-sales'}]}],
+        },
+        {
+            'id': 'ws-finance', 'name': 'Finance', 'type': 'Workspace', 'state': 'Active',
+            'users': [{'groupUserAccessRight': 'Member', 'identifier': 'carol@contoso.com', 'displayName': 'Carol', 'principalType': 'User'}],
+            'datasets': [{'id': 'ds-budget', 'name': 'Budget', 'configuredBy': 'carol@contoso.com',
+                          'datasourceUsages': [{'datasourceInstanceId': 'src-sharepoint'}],
+                          'upstreamDataflows': [{'targetDataflowId': 'df-orders', 'groupId': 'ws-sales'}]}],
+            'reports': [{'id': 'rp-budget', 'name': 'Budget report', 'datasetId': 'ds-budget'}],
+        },
+    ],
+    'datasourceInstances': [
+        {'datasourceId': 'src-sql', 'datasourceType': 'Sql', 'connectionDetails': {'server': 'sql.contoso.com', 'database': 'sales'}},
+        {'datasourceId': 'src-sharepoint', 'datasourceType': 'SharePointList',
+         'connectionDetails': {'url': 'https://contoso.sharepoint.com/sites/finance'}},
+    ],
+}
+
+class MockPowerBIApi:
+    '''
+    PBI Service API mock running in background thread. Scans finish after scan_duration seconds.
+
+    Parameters:
+        tenant (dict): tenant in the admin scan result format ('workspaces' and 'datasourceInstances' lists)
+        port (int): port to listen on, 0 picks a free one
+        scan_duration (float): seconds between scan request and its success
+        latency (float): seconds every response is delayed by
+        throttle_rate (float): part of requests (0-1) answered with 429 Too Many Requests
+        retry_after (float): seconds sent in Retry-After header of 429 responses
+        seed (int): seed of the random generator choosing throttled requests
+    '''
+
+    def __init__(self, tenant: dict = None, port: int = 0, scan_duration: float = 0.5, latency: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 1, seed: int = None):
+        self.tenant = tenant or SAMPLE_TENANT
+        self.scan_duration = scan_duration
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.scans = {}
+        self.request_count = 0
+        self.throttled_count = 0
+        self._workspaces = {workspace['id']: workspace for workspace in self.tenant['workspaces']}
+        self._instances = {instance['datasourceId']: instance for instance in self.tenant['datasourceInstances']}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('localhost', port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://localhost:{self._server.server_address[1]}{API_PREFIX}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def admit(self) -> bool:
+        '''
+        Count the request, wait the injected latency and decide whether it is throttled.
+        '''
+        with self._lock:
+            self.request_count += 1
+            throttled = self.throttle_rate > 0 and self._random.random() < self.throttle_rate
+            if throttled:
+                self.throttled_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return not throttled
+
+    def handle(self, method: str, path: str, query: dict, body: dict) -> tuple:
+        '''
+        Return (status code, JSON body) for the request.
+        '''
+        if method == 'GET' and path == 'admin/groups':
+            top = int(query.get('$top', ['5000'])[0])
+            skip = int(query.get('$skip', ['0'])[0])
+            groups = [{key: workspace.get(key) for key in ['id', 'name', 'type', 'state']} for workspace in self.tenant['workspaces']]
+            return 200, {'value': groups[skip:skip + top]}
+
+        if method == 'POST' and path == 'admin/workspaces/getInfo':
+            workspace_ids = body.get('workspaces', [])
+            if len(workspace_ids) > 100:
+                return 400, {'error': {'code': 'InvalidRequest', 'message': 'Up to 100 workspaces can be scanned at once'}}
+            scan_id = str(uuid.uuid4())
+            with self._lock:
+                self.scans[scan_id] = (time.monotonic(), set(workspace_ids))
+            return 202, {'id': scan_id, 'createdDateTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'status': 'NotStarted'}
+
+        if method == 'GET' and path.startswith('admin/workspaces/scanStatus/'):
+            scan = self.scans.get(path.rsplit('/', 1)[1])
+            if scan is None:
+                return 404, {'error': {'code': 'NotFound'}}
+            status = 'Succeeded' if time.monotonic() - scan[0] >= self.scan_duration else 'Running'
+            return 200, {'id': path.rsplit('/', 1)[1], 'status': status}
+
+        if method == 'GET' and path.startswith('admin/workspaces/scanResult/'):
+            scan = self.scans.get(path.rsplit('/', 1)[1])
+            if scan is None or time.monotonic() - scan[0] < self.scan_duration:
+                return 404, {'error': {'code': 'NotFound'}}
+            workspaces = [workspace for workspace in self.tenant['workspaces'] if workspace['id'] in scan[1]]
+            used = {usage['datasourceInstanceId'] for workspace in workspaces for cat in ['dataflows', 'datasets']
+                    for item in workspace.get(cat, []) for usage in item.get('datasourceUsages', [])}
+            instances = [instance for instance in self.tenant['datasourceInstances'] if instance['datasourceId'] in used]
+            return 200, {'workspaces': workspaces, 'datasourceInstances': instances}
+
+        if method == 'GET' and (path == 'groups' or path.startswith('groups/')):
+            return self.handle_rest(path.split('/'))
+
+        return 404, {'error': {'code': 'NotFound', 'message': f'{method} {path} is not mocked'}}
+
+    def handle_rest(self, parts: list) -> tuple:
+        '''
+        Answer standard API call ('groups/...' path split by '/') from the tenant, in the shape the real API returns.
+        '''
+        if parts == ['groups']:
+            return 200, {'value': [{'id': workspace['id'], 'name': workspace['name'], 'isReadOnly': False, 'isOnDedicatedCapacity': False}
+                                   for workspace in self.tenant['workspaces']]}
+
+        workspace = self._workspaces.get(parts[1])
+        if workspace is None or len(parts) < 3 or parts[2] not in CATEGORIES:
+            return 404, {'error': {'code': 'ItemNotFound', 'message': '/'.join(parts) + ' is not found'}}
+        cat = parts[2]
+        items = workspace.get(cat) or []
+
+        if len(parts) == 3:
+            if cat == 'users':
+                return 200, {'value': items}
+            return 200, {'value': [{key: value for key, value in item.items() if key not in SCAN_ONLY_KEYS} for item in items]}
+
+        if parts[3:] == ['upstreamdataflows'] and cat == 'datasets':
+            return 200, {'value': [{'datasetObjectId': item['id'], 'dataflowObjectId': dataflow['targetDataflowId'],
+                                    'workspaceObjectId': dataflow.get('groupId', workspace['id'])}
+                                   for item in items for dataflow in item.get('upstreamDataflows') or []]}
+
+        if len(parts) == 5:
+            item = next((item for item in items if item.get('objectId', item.get('id')) == parts[3]), None)
+            if item is not None and parts[4] == 'datasources' and cat in ['dataflows', 'datasets']:
+                instances = [self._instances.get(usage.get('datasourceInstanceId')) for usage in item.get('datasourceUsages') or []]
+                return 200, {'value': [{'datasourceType': instance.get('datasourceType'), 'connectionDetails': instance.get('connectionDetails'),
+                                        'datasourceId': instance.get('datasourceId'), 'gatewayId': instance.get('gatewayId')}
+                                       for instance in instances if instance is not None]}
+            if item is not None and parts[4] == 'tiles' and cat == 'dashboards':
+                return 200, {'value': item.get('tiles') or []}
+
+        return 404, {'error': {'code': 'ItemNotFound', 'message': '/'.join(parts) + ' is not found'}}
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _respond(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                request_body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                headers = {}
+                if not parsed.path.startswith(API_PREFIX):
+                    status, body = 404, {'error': {'code': 'NotFound'}}
+                elif not api.admit():
+                    status, body = 429, {'error': {'code': 'TooManyRequests', 'message': 'Rate limit is exceeded'}}
+                    headers['Retry-After'] = f'{api.retry_after:g}'
+                else:
+                    status, body = api.handle(method, parsed.path[len(API_PREFIX):], parse_qs(parsed.query), request_body)
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def crawl_mock(tenant: dict = None, backend: str = 'scanner', **options):
+    '''
+    Crawl the mock with given backend and return draw.io dataframe, options are passed to MockPowerBIApi.
+    '''
+    from Shared.pbi_client import PowerBIClient
+    from Shared.data_load_transform import execute_load_transform
+
+    with MockPowerBIApi(tenant, **options) as api, PowerBIClient(base_url=api.url, access_token='mock') as client:
+        output = execute_load_transform(client, [], backend=backend)
+        print(f'{api.request_count} requests sent to the mock API, {api.throttled_count} throttled')
+    return output
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Mock of PBI Service API')
+    parser.add_argument('--tenant', help='json file with tenant in scan result format, sample tenant is used when missing')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every response is delayed by')
+    parser.add_argument('--throttle_rate', type=float, default=0.0, help='part of requests answered with 429 (0-1)')
+    parser.add_argument('--retry_after', type=float, default=1, help='seconds in Retry-After header of 429 responses')
+    parser.add_argument('--crawl', action='store_true', help='crawl the mock and print the result')
+    parser.add_argument('--backend', choices=['rest', 'scanner'], default='scanner', help='backend of the crawl')
+    args = parser.parse_args()
+    options = {'latency': args.latency, 'throttle_rate': args.throttle_rate, 'retry_after': args.retry_after}
+
+    tenant = None
+    if args.tenant:
+        with open(args.tenant) as file:
+            tenant = json.load(file)
+
+    if args.crawl:
+        print(crawl_mock(tenant, args.backend, **options).to_string())
+    else:
+        api = MockPowerBIApi(tenant, port=args.port, **options)
+        print(f'Serving mock PBI Service API on {api.url}')
+        api._server.serve_forever()
@@ -0,0 +1,155 @@
+'''
+Generator of synthetic PBI tenants in the admin scan result format, served by scripts/mock_pbi_api.
+
+Run from azure_function_app folder:
+    python -m scripts.synthetic_tenant --workspaces 100 --output tenant.json
+    python -m scripts.synthetic_tenant --workspaces 1000 --datasets 10 --reports 3 --tiles 8 --output tenant.json
+'''
+import argparse
+import json
+import random
+
+from Shared.entity_normalization import datasource_entity, canonical_identifier
+
+def synthetic_tenant(workspaces: int = 10, users: int = 5, dataflows: int = 2, datasets: int = 5, reports: int = 2,
+                     dashboards: int = 1, tiles: int = 4, datasources: int = None, cross_workspace: float = 0.1,
+                     empty_workspaces: float = 0.0, seed: int = 0) -> dict:
+    '''
+    Create tenant with given number of workspaces and fan-out of their resources.
+
+    Parameters:
+        workspaces (int): number of workspaces
+        users (int): users per workspace, drawn from a pool shared by all workspaces
+        dataflows (int): dataflows per workspace
+        datasets (int): datasets per workspace, each loaded from one dataflow when the workspace has any
+        reports (int): reports per dataset
+        dashboards (int): dashboards per workspace
+        tiles (int): tiles per dashboard, each pinned from a report of the workspace
+        datasources (int): number of distinct datasources in the tenant (2 per workspace by default)
+        cross_workspace (float): part of datasets loaded from a dataflow of other workspace
+        empty_workspaces (float): part of workspaces without any users and resources
+        seed (int): seed of the random generator, the same arguments always give the same tenant
+
+    Returns:
+        tenant (dict): tenant in the admin scan result format ('workspaces' and 'datasourceInstances' lists)
+    '''
+    rng = random.Random(seed)
+    datasources = datasources or max(1, 2 * workspaces)
+    instances = [{'datasourceId': f'src{i}', 'datasourceType': 'Sql',
+                  'connectionDetails': {'server': f'sql{i % 50}.contoso.com', 'database': f'db{i}'}} for i in range(datasources)]
+    user_pool = [f'user{i}@contoso.com' for i in range(max(users, workspaces * users // 2))]
+
+    def usages():
+        return [{'datasourceInstanceId': f'src{i}'} for i in sorted(rng.sample(range(datasources), min(2, datasources)))]
+
+    tenant_workspaces = []
+    all_dataflows = []
+    for w in range(workspaces):
+        workspace_id = f'ws{w}'
+        workspace = {'id': workspace_id, 'name': f'Workspace {w}', 'type': 'Workspace', 'state': 'Active'}
+        tenant_workspaces.append(workspace)
+        if rng.random() < empty_workspaces:
+            continue
+
+        identifiers = rng.sample(user_pool, users)
+        workspace['users'] = [{'groupUserAccessRight': rng.choice(['Admin', 'Member', 'Contributor', 'Viewer']), 'identifier': identifier,
+                               'displayName': identifier.split('@')[0].capitalize(), 'principalType': 'User'} for identifier in identifiers]
+
+        workspace_dataflows = [{'objectId': f'{workspace_id}-df{i}', 'name': f'Dataflow {i}', 'configuredBy': rng.choice(identifiers),
+                                'datasourceUsages': usages()} for i in range(dataflows)]
+        if workspace_dataflows:
+            workspace['dataflows'] = workspace_dataflows
+
+        workspace_datasets = []
+        for i in range(datasets):
+            dataset = {'id': f'{workspace_id}-ds{i}', 'name': f'Dataset {i}', 'configuredBy': rng.choice(identifiers),
+                       'datasourceUsages': usages()}
+            if all_dataflows and rng.random() < cross_workspace:
+                dataflow_workspace, dataflow_id = rng.choice(all_dataflows)
+                dataset['upstreamDataflows'] = [{'targetDataflowId': dataflow_id, 'groupId': dataflow_workspace}]
+            elif workspace_dataflows:
+                dataset['upstreamDataflows'] = [{'targetDataflowId': rng.choice(workspace_dataflows)['objectId'], 'groupId': workspace_id}]
+            workspace_datasets.append(dataset)
+        if workspace_datasets:
+            workspace['datasets'] = workspace_datasets
+        all_dataflows += [(workspace_id, dataflow['objectId']) for dataflow in workspace_dataflows]
+
+        workspace_reports = [{'id': f'{dataset["id"]}-rp{i}', 'name': f'{dataset["name"]} report {i}', 'datasetId': dataset['id']}
+                             for dataset in workspace_datasets for i in range(reports)]
+        if workspace_reports:
+            workspace['reports'] = workspace_reports
+
+        workspace_dashboards = []
+        for i in range(dashboards):
+            dashboard_id = f'{workspace_id}-db{i}'
+            pinned = [rng.choice(workspace_reports) for _ in range(tiles)] if workspace_reports else []
+            workspace_dashboards.append({'id': dashboard_id, 'displayName': f'Dashboard {i}',
+                                         'tiles': [{'id': f'{dashboard_id}-tl{t}', 'title': f'Tile {t}', 'reportId': report['id'],
+                                                    'datasetId': report['datasetId']} for t, report in enumerate(pinned)]})
+        if workspace_dashboards:
+            workspace['dashboards'] = workspace_dashboards
+
+    return {'workspaces': tenant_workspaces, 'datasourceInstances': instances}
+
+def expected_counts(tenant: dict) -> dict:
+    '''
+    Number of resources of every type the crawl of the whole tenant should produce (rows of draw.io output by type).
+    Workspaces without users are skipped by the transformation, so their resources are not counted.
+    Users and datasources are counted once per tenant, like the transformation interns them.
+    '''
+    instances = {instance['datasourceId']: instance for instance in tenant['datasourceInstances']}
+    counts = {}
+    sources = {'dataflows': set(), 'datasets': set()}
+    for workspace in tenant['workspaces']:
+        if not workspace.get('users'):
+            continue
+        counts['workspaces'] = counts.get('workspaces', 0) + 1
+        for cat in ['dataflows', 'datasets', 'reports', 'dashboards']:
+            if workspace.get(cat):
+                counts[cat] = counts.get(cat, 0) + len(workspace[cat])
+        for cat in ['dataflows', 'datasets']:
+            sources[cat].update(datasource_entity(instances[usage['datasourceInstanceId']]['datasourceType'],
+                                                  instances[usage['datasourceInstanceId']]['connectionDetails'])[0]
+                                for item in workspace.get(cat) or [] for usage in item.get('datasourceUsages') or [])
+        counts.setdefault('users', set()).update(canonical_identifier(user['identifier']) for user in workspace['users'])
+    if 'users' in counts:
+        counts['users'] = len(counts['users'])
+    for cat, keys in sources.items():
+        if keys:
+            counts[cat + '_datasources'] = len(keys)
+    return counts
+
+def tenant_size(tenant: dict) -> dict:
+    '''
+    Number of workspaces and resources of every category in the tenant.
+    '''
+    size = {'workspaces': len(tenant['workspaces'])}
+    for cat in ['users', 'dataflows', 'datasets', 'reports', 'dashboards']:
+        size[cat] = sum(len(workspace.get(cat) or []) for workspace in tenant['workspaces'])
+    size['tiles'] = sum(len(dashboard.get('tiles') or []) for workspace in tenant['workspaces'] for dashboard in workspace.get('dashboards') or [])
+    size['datasources'] = len(tenant['datasourceInstances'])
+    return size
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Generate synthetic PBI tenant in scan result format')
+    parser.add_argument('--workspaces', type=int, default=10)
+    parser.add_argument('--users', type=int, default=5, help='users per workspace')
+    parser.add_argument('--dataflows', type=int, default=2, help='dataflows per workspace')
+    parser.add_argument('--datasets', type=int, default=5, help='datasets per workspace')
+    parser.add_argument('--reports', type=int, default=2, help='reports per dataset')
+    parser.add_argument('--dashboards', type=int, default=1, help='dashboards per workspace')
+    parser.add_argument('--tiles', type=int, default=4, help='tiles per dashboard')
+    parser.add_argument('--datasources', type=int, help='distinct datasources in the tenant, 2 per workspace by default')
+    parser.add_argument('--cross_workspace', type=float, default=0.1, help='part of datasets loaded from dataflow of other workspace')
+    parser.add_argument('--empty_workspaces', type=float, default=0.0, help='part of workspaces without users and resources')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='json file to write, tenant size is printed when missing')
+    args = parser.parse_args()
+
+    tenant = synthetic_tenant(args.workspaces, args.users, args.dataflows, args.datasets, args.reports, args.dashboards, args.tiles,
+                              args.datasources, args.cross_workspace, args.empty_workspaces, args.seed)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(tenant, file)
+    print(tenant_size(tenant))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# tests import Shared and scripts packages the same way the functions do, from azure_function_app folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+import io
+
+from Shared.lineage_graph import LineageGraph, RELATIVE
+from Shared.diagram_sink import DiagramSink
+from Shared.drawio_xml import graph_to_drawio
+from Shared.snapshot_diff import diff_snapshots, graph_diff
+
+def workspace_graph(access_right: str) -> LineageGraph:
+    graph = LineageGraph()
+    workspace = graph.add_node('ws-sales', 'Sales', 'workspaces', 'ws-sales')
+    for identifier, right in (('anna@contoso.com', 'Admin'), ('bob@contoso.com', access_right)):
+        graph.add_edge(workspace, graph.add_node(identifier, identifier, 'users', 'ws-sales'), RELATIVE, right)
+    return graph
+
+def snapshot(graph: LineageGraph) -> bytes:
+    output = io.BytesIO()
+    sink = DiagramSink(output, None)
+    sink.write_rows(graph.rows())
+    sink.close()
+    return output.getvalue()
+
+def test_access_right_is_kept_on_user_edges():
+    graph = workspace_graph('Viewer')
+    workspace = next(row for row in graph.rows() if row[2] == 'workspaces')
+    assert workspace[4:] == ('anna@contoso.com,bob@contoso.com', 'Admin:anna@contoso.com,Viewer:bob@contoso.com')
+    diagram = graph_to_drawio(graph).decode()
+    assert 'value="Admin"' in diagram and 'value="Viewer"' in diagram
+
+def test_changed_access_right_is_reported_by_diffs():
+    latest, previous = snapshot(workspace_graph('Member')), snapshot(workspace_graph('Viewer'))
+    _, changes = diff_snapshots(lambda: io.BytesIO(latest), lambda: io.BytesIO(previous))
+    assert list(changes) == [('changed', {'type': 'workspaces', 'id': 'ws-sales', 'changes': {
+        'access': ['Admin:anna@contoso.com,Viewer:bob@contoso.com', 'Admin:anna@contoso.com,Member:bob@contoso.com']}})]
+    diff = graph_diff(lambda: io.BytesIO(latest), lambda: io.BytesIO(previous))
+    assert diff['edges']['added'] == {'access': {'workspaces': [['ws-sales', 'Member:bob@contoso.com']]}}
+    assert diff['edges']['removed'] == {'access': {'workspaces': [['ws-sales', 'Viewer:bob@contoso.com']]}}
@@ -0,0 +1,48 @@
+import time
+import threading
+
+import pandas as pd
+import pytest
+
+from Shared.pbi_client import PowerBIClient
+from Shared.data_load_transform import fetch_concurrently, download_workspaces_data
+from scripts.mock_pbi_api import MockPowerBIApi
+
+def test_results_keep_order_of_arguments_and_pool_is_bounded():
+    lock = threading.Lock()
+    running, most_running = [0], [0]
+
+    def call(position, delay):
+        with lock:
+            running[0] += 1
+            most_running[0] = max(most_running[0], running[0])
+        time.sleep(delay)
+        with lock:
+            running[0] -= 1
+        return position
+
+    # later calls finish first
+    args_list = [(position, 0.05 - position * 0.005) for position in range(10)]
+    assert fetch_concurrently(call, args_list, max_workers = 3) == list(range(10))
+    assert most_running[0] == 3
+
+def test_error_of_any_call_is_raised():
+    def call(position):
+        if position == 2:
+            raise ValueError('call failed')
+        return position
+
+    with pytest.raises(ValueError, match = 'call failed'):
+        fetch_concurrently(call, [(position,) for position in range(4)], max_workers = 4)
+
+def test_parallel_download_matches_serial_download():
+    with MockPowerBIApi(latency = 0.01) as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        serial = download_workspaces_data(client, [], ['ws-sales', 'ws-finance'], max_workers = 1)
+        parallel = download_workspaces_data(client, [], ['ws-sales', 'ws-finance'], max_workers = 8)
+    assert len(serial) == len(parallel) == 2
+    for (serial_dict, serial_missing), (parallel_dict, parallel_missing) in zip(serial, parallel):
+        assert serial_missing == parallel_missing
+        assert set(serial_dict) == set(parallel_dict)
+        for key, frame in serial_dict.items():
+            pd.testing.assert_frame_equal(frame.reset_index(drop = True), parallel_dict[key].reset_index(drop = True))
+    assert set(serial[0][0]) >= {'users', 'dataflows', 'datasets', 'reports', 'dashboards', 'dashboards_datasources'}
@@ -0,0 +1,47 @@
+import json
+import types
+import datetime
+
+import azure.functions as func
+
+import ControlChanges
+from Shared import function_util
+from Shared.data_load_transform import build_lineage_graph
+from scripts.benchmark_transform import synthetic_tenant_data
+
+def save_snapshots(tmp_path, monkeypatch, snapshot_format: str = 'parquet'):
+    settings = {'DataLakeConnectionString': f'file://{tmp_path}', 'DataLakeContainerName': 'lineage', 'DiagramDataFolder': 'diagrams',
+                'CSVDataFolder': 'snapshots', 'ChangesDataFolder': 'changes', 'SnapshotFormat': snapshot_format, 'CatalogFolder': 'catalog'}
+    for name, value in settings.items():
+        monkeypatch.setenv(name, value)
+    times = iter([datetime.datetime(2024, 5, 1, 8, 0), datetime.datetime(2024, 5, 2, 8, 0)])
+
+    class Clock(datetime.datetime):
+        @classmethod
+        def utcnow(cls):
+            return next(times)
+
+    monkeypatch.setattr(function_util, 'datetime', types.SimpleNamespace(datetime = Clock))
+    for workspaces in (6, 7):
+        function_util.save_diagram(build_lineage_graph(*synthetic_tenant_data(workspaces, 4)))
+
+def call(mode: str) -> dict:
+    response = ControlChanges.main(func.HttpRequest('GET', '/api/ControlChanges', params = {'mode': mode}, body = b''))
+    assert response.status_code == 200
+    return json.loads(response.get_body())
+
+def test_changes_of_downloaded_snapshots(tmp_path, monkeypatch):
+    save_snapshots(tmp_path, monkeypatch)
+    rows = call('rows')
+    graph = call('graph')
+    changes = tmp_path / 'lineage' / 'changes'
+    assert rows['added'] > 0 and graph['added']['nodes'] > 0
+    assert json.loads((changes / '2024-05-02 08:00 VS 2024-05-01 08:00.json').read_text())
+    assert sorted(path.name for path in changes.iterdir()) == ['2024-05-02 08:00 VS 2024-05-01 08:00 graph.json',
+                                                               '2024-05-02 08:00 VS 2024-05-01 08:00.json']
+
+def test_snapshots_without_catalog_are_found_by_listing(tmp_path, monkeypatch):
+    save_snapshots(tmp_path, monkeypatch, 'csv')
+    (tmp_path / 'lineage' / 'catalog' / 'latest.json').unlink()
+    assert call('rows')['added'] > 0
+    assert (tmp_path / 'lineage' / 'changes' / '2024-05-02 08:00 VS 2024-05-01 08:00.json').is_file()
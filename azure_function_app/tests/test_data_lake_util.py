@@ -0,0 +1,97 @@
+import os
+import hashlib
+import threading
+
+import pytest
+
+from Shared import data_lake_util
+from azure.core.exceptions import ResourceExistsError
+
+from Shared.data_lake_util import get_service_client, get_directory_client, clear_clients, save_data, read_file, download_to_file, \
+    list_and_sort_files, DataLakeFileWriter, DataLakeFolderStore, DataLakeLeaseStore
+
+CHUNK_SIZE = 1000
+
+@pytest.fixture
+def lake(tmp_path, monkeypatch):
+    # small chunks, so multi-range transfers are exercised with small files
+    monkeypatch.setattr(data_lake_util, 'CHUNK_SIZE', CHUNK_SIZE)
+    yield f'file://{tmp_path}'
+    clear_clients()
+
+def test_clients_are_cached(lake):
+    assert get_service_client(lake) is get_service_client(lake)
+    folder = get_directory_client(lake, 'lineage', 'snapshots')
+    assert get_directory_client(lake, 'lineage', 'snapshots', create=False) is folder
+    clear_clients()
+    assert get_directory_client(lake, 'lineage', 'snapshots') is not folder
+
+@pytest.mark.parametrize('size', [0, 1, CHUNK_SIZE, 3 * CHUNK_SIZE, 3 * CHUNK_SIZE + 17, 9 * CHUNK_SIZE - 1])
+def test_chunked_transfers_round_trip(lake, tmp_path, size):
+    data = os.urandom(size)
+    save_data(data, lake, 'lineage', 'snapshots', 'data.bin')
+    assert read_file(lake, 'lineage', 'snapshots', 'data.bin').getvalue() == data
+    path = tmp_path / 'downloaded.bin'
+    assert download_to_file(lake, 'lineage', 'snapshots', 'data.bin', str(path)) == size
+    assert path.read_bytes() == data
+
+def test_file_writer_appends_blocks_and_flushes_on_close(lake, tmp_path):
+    pieces = [os.urandom(size) for size in (10, 700, 1, 2500, 0, 333)]
+    with DataLakeFileWriter(lake, 'lineage', 'diagrams', 'out.txt', block_size = CHUNK_SIZE) as writer:
+        for piece in pieces:
+            assert writer.write(piece) == len(piece)
+        # appended blocks are not visible before the flush
+        assert (tmp_path / 'lineage' / 'diagrams' / 'out.txt').read_bytes() == b''
+    data = b''.join(pieces)
+    assert writer.closed and writer.offset == len(data) and writer.sha256 == hashlib.sha256(data).hexdigest()
+    assert read_file(lake, 'lineage', 'diagrams', 'out.txt').getvalue() == data
+    writer.close()
+
+def test_folder_store(lake):
+    store = DataLakeFolderStore(lake, 'lineage', 'state')
+    assert store.read('missing.json') is None
+    store.write('state.json', b'{}')
+    store.write('state.json', b'{"a": 1}')
+    assert store.read('state.json') == b'{"a": 1}'
+    store.append('log.jsonl', b'1\n')
+    store.append('log.jsonl', b'2\n')
+    assert store.read('log.jsonl') == b'1\n2\n'
+    store.delete('state.json')
+    store.delete('state.json')
+    assert store.read('state.json') is None
+
+def test_snapshots_are_listed_by_time_in_their_names(lake):
+    for file_name in ['2024-05-02 08:00.csv', '2023-12-31 23:59.csv', '2024-05-10 07:30.csv', '2024-05-02 08:00.parquet',
+                      'notes.csv', '2024-13-01 00:00.csv', 'archive/2025-01-01 00:00.csv']:
+        folder, _, name = ('snapshots/' + file_name).rpartition('/')
+        save_data(b'id\n', lake, 'lineage', folder, name)
+    assert list_and_sort_files(lake, 'lineage', 'snapshots') == ['2024-05-10 07:30.csv', '2024-05-02 08:00.csv', '2023-12-31 23:59.csv']
+
+def test_cleared_folder_store_is_deleted_and_can_be_written_again(lake, tmp_path):
+    store = DataLakeFolderStore(lake, 'lineage', 'partial/run-1')
+    for name in ('ws1.json', 'ws2.json'):
+        store.write(name, b'{}')
+    store.clear()
+    assert not (tmp_path / 'lineage' / 'partial' / 'run-1').exists()
+    store.clear()
+    store.write('ws1.json', b'[]')
+    assert store.read('ws1.json') == b'[]' and store.read('ws2.json') is None
+
+def test_conditional_create_keeps_existing_file(lake):
+    save_data(b'{"count": 3}', lake, 'lineage', 'state', 'budget.json')
+    with pytest.raises(ResourceExistsError):
+        get_directory_client(lake, 'lineage', 'state').create_file('budget.json', if_none_match='*')
+    assert read_file(lake, 'lineage', 'state', 'budget.json').getvalue() == b'{"count": 3}'
+
+def test_lease_store_updates_are_not_lost_when_file_is_created(lake):
+    stores = [DataLakeLeaseStore(lake, 'lineage', 'state', 'budget.json', lease_seconds=15) for _ in range(8)]
+
+    def increment(state):
+        state['count'] = state.get('count', 0) + 1
+
+    threads = [threading.Thread(target=lambda store=store: [store.update(increment) for _ in range(5)]) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stores[0].update(lambda state: state['count']) == 40
@@ -0,0 +1,75 @@
+import base64
+import zlib
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote
+
+from Shared.drawio_xml import sharded_diagrams, shard_graph, SHARED_TYPES, layered_layout, graph_to_drawio
+from Shared.lineage_graph import LineageGraph, PARENT
+from Shared.data_load_transform import build_lineage_graph
+from scripts.benchmark_transform import synthetic_tenant_data
+
+def test_sharded_pages_keep_every_edge():
+    graph = build_lineage_graph(*synthetic_tenant_data(20, 4))
+    pages = list(sharded_diagrams(graph, 'component', max_nodes = 15))
+    assert [page for page, _, _ in pages] == [page for page, _, _ in shard_graph(graph, 'component', 15)]
+
+    drawn = {}
+    for _, _, model in pages:
+        for cell in model.iter('mxCell'):
+            if cell.get('edge') == '1':
+                drawn[cell.get('id')] = drawn.get(cell.get('id'), 0) + 1
+    node_pages = {index: page for page, _, nodes in shard_graph(graph, 'component', 15) for index in nodes}
+    for number, (src, dst, _) in enumerate(graph.edges()):
+        if graph.nodes[src].type is None or graph.nodes[dst].type is None:
+            continue
+        if src in node_pages and dst in node_pages:
+            # edge within a page is drawn once, edge between pages on both of them (ending in link stubs)
+            assert drawn.get(f'e{number}') == (1 if node_pages[src] == node_pages[dst] else 2)
+        elif graph.nodes[src].type in SHARED_TYPES or graph.nodes[dst].type in SHARED_TYPES:
+            assert drawn.get(f'e{number}') == 1
+
+def test_link_stubs_open_other_pages():
+    graph = build_lineage_graph(*synthetic_tenant_data(5, 4))
+    pages = list(sharded_diagrams(graph, 'workspace', max_nodes = 10))
+    page_ids = {page for page, _, _ in pages}
+    links = [stub.get('link') for _, _, model in pages for stub in model.iter('UserObject')]
+    assert links and all(link[len('data:page/id,'):] in page_ids for link in links)
+
+def test_parents_are_laid_out_above_their_children():
+    graph = build_lineage_graph(*synthetic_tenant_data(3, 4))
+    positions = layered_layout(graph)
+    assert set(positions) == {index for index, _ in graph.typed_nodes()}
+    assert len(set(positions.values())) == len(positions)
+    for src, dst, _ in graph.edges(PARENT):
+        if src in positions and dst in positions:
+            assert positions[dst][1] < positions[src][1]
+
+def test_cycle_does_not_stop_layout():
+    graph = LineageGraph()
+    first, second = graph.add_node('a', 'A', 'reports'), graph.add_node('b', 'B', 'reports')
+    graph.add_edge(first, second, PARENT)
+    graph.add_edge(second, first, PARENT)
+    assert set(layered_layout(graph)) == {first, second}
+
+def diagram_models(content: bytes) -> list:
+    models = []
+    for diagram in ET.fromstring(content).iter('diagram'):
+        if diagram.text and diagram.text.strip():
+            xml = unquote(zlib.decompress(base64.b64decode(diagram.text), -15).decode())
+            models.append(ET.fromstring(xml))
+        else:
+            models.append(diagram.find('mxGraphModel'))
+    return models
+
+def test_diagram_has_every_node_and_edge_and_opens_compressed():
+    graph = build_lineage_graph(*synthetic_tenant_data(2, 3))
+    content = graph_to_drawio(graph)
+    [model] = diagram_models(content)
+    cells = list(model.iter('mxCell'))
+    vertices = {cell.get('id') for cell in cells if cell.get('vertex') == '1'}
+    assert vertices == {f'n{index}' for index, _ in graph.typed_nodes()}
+    edges = [cell for cell in cells if cell.get('edge') == '1']
+    assert edges and all(cell.get('source') in vertices and cell.get('target') in vertices for cell in edges)
+
+    [compressed_model] = diagram_models(graph_to_drawio(graph, compressed = True))
+    assert ET.tostring(compressed_model) == ET.tostring(model)
@@ -0,0 +1,21 @@
+import random
+
+from Shared.external_sort import ExternalSorter, external_sort
+
+def test_rows_are_sorted_across_chunks():
+    rows = [(random.Random(item).randrange(1000), item) for item in range(250)]
+    assert list(external_sort(rows, lambda row: row[0], chunk_rows = 16)) == sorted(rows, key = lambda row: row[0])
+
+def test_first_row_of_every_key_is_kept_across_chunks():
+    sorter = ExternalSorter(lambda row: row[0], chunk_rows = 3)
+    # rows of the same key are added in different batches and end in different chunks
+    sorter.add([('b', 1), ('a', 1), ('c', 1)])
+    sorter.add([('a', 2), ('b', 2)])
+    sorter.add([('c', 2), ('a', 3)])
+    assert list(sorter.sorted_rows(unique = True)) == [('a', 1), ('b', 1), ('c', 1)]
+
+def test_sorter_is_empty_after_rows_are_read():
+    sorter = ExternalSorter(lambda row: row, chunk_rows = 2)
+    sorter.add([3, 1, 2])
+    assert list(sorter.sorted_rows()) == [1, 2, 3]
+    assert list(sorter.sorted_rows()) == []
@@ -0,0 +1,73 @@
+import copy
+
+import pytest
+
+from Shared import focused_crawl
+from Shared.pbi_client import PowerBIClient
+from Shared.data_load_transform import list_workspaces, download_content_df
+from Shared.focused_crawl import execute_focused_load_graph, FocusedCrawl
+from scripts.mock_pbi_api import MockPowerBIApi, SAMPLE_TENANT
+
+def test_focused_crawl_selects_categories():
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        graph = execute_focused_load_graph(client, ['rp-budget'], 2)
+        assert {'reports', 'datasets', 'dataflows', 'datasets_datasources'} <= {node.type for _, node in graph.typed_nodes()}
+        requests = api.request_count
+
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        graph = execute_focused_load_graph(client, ['rp-budget'], 2, categories = ['users', 'reports', 'dataflows'])
+        # lineage still goes through the dataset to the dataflow, datasources are not downloaded
+        assert {node.type for _, node in graph.typed_nodes()} == {'workspaces', 'users', 'reports', 'dataflows'}
+        assert api.request_count < requests
+
+def record_urls(monkeypatch) -> list:
+    urls = []
+
+    def download(client, url):
+        urls.append(url)
+        return download_content_df(client, url)
+
+    monkeypatch.setattr(focused_crawl, 'download_content_df', download)
+    return urls
+
+@pytest.mark.parametrize('hops, reached', [
+    (0, {'rp-budget': 0}),
+    (1, {'rp-budget': 0, 'ds-budget': 1}),
+    (2, {'rp-budget': 0, 'ds-budget': 1, 'df-orders': 2}),
+    (4, {'rp-budget': 0, 'ds-budget': 1, 'df-orders': 2, 'ds-sales': 3, 'rp-sales': 4, 'db-sales': 4}),
+])
+def test_crawl_stops_at_hop_limit(hops, reached):
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        crawl = FocusedCrawl(client, list_workspaces(client, []), 4)
+        assert crawl.expand(['ws-finance/rp-budget'], hops) == reached
+        # the other workspace is loaded only when lineage crosses into it
+        assert crawl.loaded == (['ws-finance'] if hops < 2 else ['ws-finance', 'ws-sales'])
+
+def test_links_are_downloaded_only_for_reached_workspaces_and_once(monkeypatch):
+    tenant = copy.deepcopy(SAMPLE_TENANT)
+    # searched for the seed first, but nothing in it is reached
+    tenant['workspaces'].insert(0, {'id': 'ws-hr', 'name': 'HR', 'type': 'Workspace', 'state': 'Active',
+                                    'datasets': [{'id': 'ds-people', 'name': 'People', 'configuredBy': 'carol@contoso.com'}],
+                                    'dashboards': [{'id': 'db-people', 'displayName': 'People',
+                                                    'tiles': [{'id': 'tl-2', 'title': 'Headcount', 'datasetId': 'ds-people'}]}]})
+    urls = record_urls(monkeypatch)
+    with MockPowerBIApi(tenant) as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        crawl = FocusedCrawl(client, list_workspaces(client, []), 4)
+        crawl.expand(['rp-budget'], 4)
+    assert crawl.loaded == ['ws-hr', 'ws-sales', 'ws-finance']
+    assert not [url for url in urls if url.startswith('groups/ws-hr/') and url.count('/') > 2]
+    assert len(urls) == len(set(urls))
+    # 3 workspaces x 4 item lists, upstream dataflows of both reached workspaces and tiles of one dashboard
+    assert len(urls) == 12 + 2 + 1
+
+def test_links_of_every_workspace_are_indexed_once(monkeypatch):
+    indexed = []
+    for kind in ('reports', 'upstream', 'tiles'):
+        index = getattr(FocusedCrawl, f'_link_{kind}')
+        monkeypatch.setattr(FocusedCrawl, f'_link_{kind}',
+                            lambda self, workspace_id, kind = kind, index = index: indexed.append((workspace_id, kind)) or index(self, workspace_id))
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        crawl = FocusedCrawl(client, list_workspaces(client, []), 4)
+        crawl.expand(['ws-finance/rp-budget'], 5)
+    assert sorted(indexed) == sorted(set(indexed))
+    assert set(indexed) == {(workspace_id, kind) for workspace_id in ('ws-finance', 'ws-sales') for kind in ('reports', 'upstream', 'tiles')}
@@ -0,0 +1,89 @@
+import copy
+
+import pandas as pd
+import pytest
+
+from Shared.pbi_client import PowerBIClient
+from Shared.response_cache import ResponseCache
+from Shared.incremental_crawl import execute_incremental_load_graph, FolderStore, serialize_workspace_data, deserialize_workspace_data, \
+    workspace_fingerprint, get_modified_workspaces, crawl_changed_workspaces
+from scripts.mock_pbi_api import MockPowerBIApi, SAMPLE_TENANT
+
+def crawl(api, folder, backend = 'rest') -> dict:
+    with PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        graph = execute_incremental_load_graph(client, [], FolderStore(folder), backend = backend)
+        return {'nodes': len(list(graph.typed_nodes())), **client.metrics.as_dict()['counters']}
+
+def test_unchanged_workspaces_are_not_crawled_again(tmp_path):
+    tenant = copy.deepcopy(SAMPLE_TENANT)
+    # workspace without users is dropped by the fetch plan after its first call
+    tenant['workspaces'].append({'id': 'ws-empty', 'name': 'Empty', 'type': 'Workspace', 'state': 'Active',
+                                 'reports': [{'id': 'rp-usage', 'name': 'Usage Metrics Report', 'datasetId': 'ds-usage'}]})
+    with MockPowerBIApi(tenant) as api:
+        first = crawl(api, str(tmp_path))
+        second = crawl(api, str(tmp_path))
+    assert first['workspaces_crawled'] == 3 and first['workspaces_dropped'] == 1
+    assert second['workspaces_crawled'] == 0 and second['workspaces_reused'] == 3
+    assert second['nodes'] == first['nodes']
+
+def test_changed_workspace_is_crawled_again(tmp_path):
+    tenant = copy.deepcopy(SAMPLE_TENANT)
+    with MockPowerBIApi(tenant) as api:
+        crawl(api, str(tmp_path))
+        tenant['workspaces'][1]['reports'].append({'id': 'rp-forecast', 'name': 'Forecast', 'datasetId': 'ds-budget'})
+        counters = crawl(api, str(tmp_path))
+    assert counters['workspaces_crawled'] == 1 and counters['workspaces_reused'] == 1
+
+def test_categories_are_kept_and_change_of_them_crawls_again(tmp_path):
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        graph = execute_incremental_load_graph(client, [], FolderStore(str(tmp_path)), categories = ['users', 'datasets'])
+        assert {node.type for _, node in graph.typed_nodes()} == {'workspaces', 'users', 'datasets'}
+        graph = execute_incremental_load_graph(client, [], FolderStore(str(tmp_path)))
+        assert 'reports' in {node.type for _, node in graph.typed_nodes()}
+        assert client.metrics.counters['workspaces_crawled'] == 4
+
+def test_incremental_crawl_is_not_replayed(tmp_path):
+    with MockPowerBIApi() as api:
+        client = PowerBIClient(base_url = api.url, access_token = 'mock', cache = ResponseCache(str(tmp_path / 'cache'), replay = True))
+        with client, pytest.raises(ValueError):
+            execute_incremental_load_graph(client, [], FolderStore(str(tmp_path / 'state')))
+        assert api.request_count == 0
+
+def test_stored_workspace_data_is_read_back():
+    data_dict = {'reports': pd.DataFrame({'id': ['rp-sales'], 'name': ['Sales report']}), 'datasets_datasources': pd.DataFrame()}
+    read_dict, missing_cat = deserialize_workspace_data(serialize_workspace_data(data_dict, ['dashboards']))
+    assert missing_cat == ['dashboards'] and set(read_dict) == set(data_dict)
+    pd.testing.assert_frame_equal(read_dict['reports'], data_dict['reports'])
+
+def test_fingerprint_depends_only_on_listed_content():
+    listings = {'reports': pd.DataFrame({'id': ['rp-sales'], 'name': ['Sales report']})}
+    reordered = {'reports': pd.DataFrame({'name': ['Sales report'], 'id': ['rp-sales']}), 'users': pd.DataFrame(),
+                 'reports_datasources': pd.DataFrame({'id': ['src-sql']})}
+    renamed = {'reports': pd.DataFrame({'id': ['rp-sales'], 'name': ['Revenue report']})}
+    assert workspace_fingerprint(listings) == workspace_fingerprint(reordered) != workspace_fingerprint(renamed)
+
+class ModifiedClient:
+    def __init__(self, body):
+        self.body, self.urls = body, []
+
+    def get_json(self, url_extension: str):
+        self.urls.append(url_extension)
+        return self.body
+
+def test_modified_workspaces_are_read_from_admin_api():
+    client = ModifiedClient([{'id': 'ws-sales'}, {'id': 'ws-hr'}])
+    assert get_modified_workspaces(client, '2024-05-01T08:00:00') == {'ws-sales', 'ws-hr'}
+    assert client.urls == ['admin/workspaces/modified?modifiedSince=2024-05-01T08:00:00.0000000Z&excludePersonalWorkspaces=True']
+    # account without admin rights
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        assert get_modified_workspaces(client, '2024-05-01T08:00:00') is None
+
+def test_only_modified_and_missing_workspaces_are_crawled(tmp_path):
+    store = FolderStore(str(tmp_path))
+    store.write('ws-sales.json', serialize_workspace_data({}, []))
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        fresh, cached, _ = crawl_changed_workspaces(client, ['ws-sales', 'ws-finance'], store, {}, modified = set())
+        assert list(fresh) == ['ws-finance'] and cached['ws-sales'] is not None
+        fresh, _, fingerprints = crawl_changed_workspaces(client, ['ws-sales', 'ws-finance'], store, {}, modified = {'ws-sales'})
+    assert list(fresh) == ['ws-sales'] and set(fingerprints) == {'ws-sales', 'ws-finance'}
+    assert 'reports' in deserialize_workspace_data(store.read('ws-sales.json'))[0]
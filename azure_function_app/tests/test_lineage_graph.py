@@ -0,0 +1,48 @@
+from Shared.lineage_graph import LineageGraph, PARENT, RELATIVE, UPSTREAM, OUTPUT_COLUMNS
+
+def test_ids_are_interned_once_and_edge_targets_filled_in_later():
+    graph = LineageGraph()
+    report = graph.add_node('rp-sales', 'Sales report', 'reports', 'ws-sales')
+    # dataset is referenced before it is downloaded
+    dataset = graph.intern('ds-sales')
+    graph.add_edge(report, dataset, PARENT)
+    assert graph.get('ds-sales').type is None and [index for index, _ in graph.typed_nodes()] == [report]
+
+    assert graph.add_node('ds-sales', 'Sales model', 'datasets', 'ws-sales') == dataset
+    # details of the first download are kept
+    graph.add_node('ds-sales', 'Other name', 'datasets', 'ws-finance')
+    assert (graph.get('ds-sales').name, graph.get('ds-sales').workspace) == ('Sales model', 'ws-sales')
+    assert len(graph) == 2
+
+def test_same_id_under_other_key_is_other_node():
+    graph = LineageGraph()
+    flow_source = graph.add_node('src-sql', 'Sql', 'dataflows_datasources', key = 'dataflows_datasources:src-sql')
+    set_source = graph.add_node('src-sql', 'Sql', 'datasets_datasources', key = 'datasets_datasources:src-sql')
+    assert flow_source != set_source
+    assert graph.index_of('src-sql') is None and graph.index_of('src-sql', 'datasets_datasources:src-sql') == set_source
+
+def test_repeated_edges_are_skipped_and_first_label_kept():
+    graph = LineageGraph()
+    workspace = graph.add_node('ws-sales', 'Sales', 'workspaces', 'ws-sales')
+    user = graph.add_node('anna@contoso.com', 'Anna', 'users', 'ws-sales')
+    graph.add_edge(workspace, user, RELATIVE, 'Admin')
+    graph.add_edge(workspace, user, RELATIVE, 'Viewer')
+    graph.add_edge(workspace, user, PARENT)
+    assert list(graph.edges()) == [(workspace, user, RELATIVE), (workspace, user, PARENT)]
+    assert list(graph.edges(PARENT)) == [(workspace, user, PARENT)]
+    assert graph.edge_labels == {0: 'Admin'}
+
+def test_rows_group_edges_of_every_node():
+    graph = LineageGraph()
+    workspace = graph.add_node('ws-sales', 'Sales', 'workspaces', 'ws-sales')
+    dataset = graph.add_node('ds-sales', 'Sales model', 'datasets', 'ws-sales')
+    graph.add_edge(dataset, workspace, PARENT)
+    graph.add_edge(workspace, graph.add_node('anna@contoso.com', 'Anna', 'users', 'ws-sales'), RELATIVE, 'Admin')
+    graph.add_edge(dataset, graph.intern('df-orders'), UPSTREAM)
+    graph.add_edge(dataset, graph.intern('anna@contoso.com'), RELATIVE)
+    assert list(graph.rows()) == [('"ws-sales"', 'Sales', 'workspaces', None, 'anna@contoso.com', 'Admin:anna@contoso.com'),
+                                  ('"ds-sales"', 'Sales model', 'datasets', 'ws-sales', 'df-orders,anna@contoso.com', None),
+                                  ('"anna@contoso.com"', 'Anna', 'users', None, None, None)]
+    frame = graph.to_frame()
+    assert list(frame.columns) == OUTPUT_COLUMNS
+    assert list(frame['type']) == ['datasets', 'users', 'workspaces']
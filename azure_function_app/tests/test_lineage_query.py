@@ -0,0 +1,41 @@
+import pytest
+
+from Shared.lineage_graph import LineageGraph, PARENT, RELATIVE, UPSTREAM
+from Shared.lineage_query import LineageIndex
+
+def sales_graph() -> LineageGraph:
+    graph = LineageGraph()
+    workspace = graph.add_node('ws-sales', 'Sales', 'workspaces', 'ws-sales')
+    user = graph.add_node('anna@contoso.com', 'Anna', 'users', 'ws-sales')
+    graph.add_edge(workspace, user, RELATIVE)
+    dataflow = graph.add_node('df-orders', 'Orders', 'dataflows', 'ws-sales')
+    dataset = graph.add_node('ds-sales', 'Sales model', 'datasets', 'ws-sales')
+    report = graph.add_node('rp-sales', 'Sales report', 'reports', 'ws-sales')
+    source = graph.add_node('sql.contoso.com/sales', 'sales', 'datasets_datasources', 'ws-sales')
+    for node in (dataflow, dataset, report):
+        graph.add_edge(node, workspace, PARENT)
+    graph.add_edge(dataset, dataflow, UPSTREAM)
+    graph.add_edge(report, dataset, PARENT)
+    graph.add_edge(source, dataset, PARENT)
+    # dataset of other workspace and a user are parents without lineage type
+    graph.add_edge(report, graph.intern('ds-not-crawled'), PARENT)
+    graph.add_edge(dataset, user, PARENT)
+    return graph
+
+@pytest.mark.parametrize('build', [LineageIndex.from_graph,
+                                   lambda graph: LineageIndex.from_rows(row[:5] for row in graph.rows())])
+def test_only_lineage_resources_are_dependencies(build):
+    index = build(sales_graph())
+    assert [item['id'] for item in index.query('rp-sales', 'upstream')] == ['ds-sales', 'df-orders', 'sql.contoso.com/sales']
+    assert [item['id'] for item in index.query('df-orders')] == ['ds-sales', 'rp-sales']
+    for resource_id in ('ws-sales', 'anna@contoso.com'):
+        assert index.query(resource_id, 'both') == []
+    with pytest.raises(KeyError):
+        index.resolve('ds-not-crawled')
+
+def test_repeated_dependencies_are_indexed_once():
+    rows = [('ds-sales', 'Sales model', 'datasets', 'ws-sales', ''), ('ws-sales', 'Sales', 'workspaces', '', '')]
+    rows += [(f'rp{item}', f'Report {item}', 'reports', 'ds-sales,ds-sales,ws-sales', '') for item in range(3)]
+    index = LineageIndex.from_rows(rows)
+    assert index.consumers[index.resolve('ds-sales')] == [index.resolve(f'rp{item}') for item in range(3)]
+    assert all(index.providers[index.resolve(f'rp{item}')] == [index.resolve('ds-sales')] for item in range(3))
@@ -0,0 +1,199 @@
+import copy
+import json
+import datetime
+
+import pytest
+
+import ListWorkspaces
+import CrawlWorkspaces
+import MergeDiagram
+from Orchestrator import orchestrator_function
+from Shared.pbi_client import PowerBIClient
+from Shared.function_util import get_orchestration_input, get_partial_store
+from Shared.incremental_crawl import serialize_workspace_data
+from scripts.benchmark_transform import synthetic_tenant_data
+from scripts.mock_pbi_api import MockPowerBIApi, SAMPLE_TENANT
+
+class Task:
+    def __init__(self, name: str, options, data):
+        self.name, self.options, self.data = name, options, data
+        self.result = None
+
+class FakeContext:
+    '''
+    Stand-in of DurableOrchestrationContext recording scheduled activities.
+    '''
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.instance_id = 'instance-1'
+        self.current_utc_datetime = datetime.datetime(2024, 5, 1, 8, 0, tzinfo = datetime.timezone.utc)
+        self.activities = []
+
+    def get_input(self):
+        return self.config
+
+    def call_activity_with_retry(self, name: str, options, data):
+        self.activities.append(Task(name, options, data))
+        return self.activities[-1]
+
+    def task_all(self, tasks: list):
+        return ('all', list(tasks))
+
+    def task_any(self, tasks: list):
+        return ('any', list(tasks))
+
+def run(context: FakeContext, workspaces: list, finish = lambda tasks: tasks[-1], modified: set = None) -> list:
+    # drives the orchestrator generator, giving every yielded task the result the activity would return,
+    # task_any gets the task chosen by finish; returns the result and the most activities running at once
+    generator = orchestrator_function(context)
+    result, finished, most_running = None, set(), 0
+    try:
+        while True:
+            task = generator.send(result)
+            running = [item for item in context.activities if item.name == 'CrawlWorkspaces' and id(item) not in finished]
+            most_running = max(most_running, len(running))
+            if isinstance(task, tuple) and task[0] == 'any':
+                result = finish(task[1])
+                finished.add(id(result))
+            elif isinstance(task, tuple):
+                result = [item.data['workspaces'] for item in task[1]]
+                finished.update(id(item) for item in task[1])
+            elif task.name == 'ListWorkspaces':
+                result = [{'id': workspace_id, 'name': workspace_id} for workspace_id in workspaces]
+                if modified is not None:
+                    for workspace in result:
+                        workspace['modified'] = workspace['id'] in modified
+            else:
+                result = 'OK'
+    except StopIteration as stop:
+        return stop.value, most_running
+
+def test_settings_are_taken_from_input_not_environment(monkeypatch):
+    monkeypatch.setenv('CrawlBatchSize', '5')
+    monkeypatch.setenv('ActivityRetryAttempts', '9')
+    context = FakeContext({'workspaces': [], 'batch_size': 2, 'parallelism': 4, 'retry_interval': 1, 'retry_attempts': 2})
+    assert run(context, [f'ws{item}' for item in range(5)])[0] == ['OK']
+    crawls = [task for task in context.activities if task.name == 'CrawlWorkspaces']
+    assert [task.data['workspaces'] for task in crawls] == [['ws0', 'ws1'], ['ws2', 'ws3'], ['ws4']]
+    assert {task.data['run_id'] for task in crawls} == {'instance-1'}
+    options = context.activities[0].options
+    assert (options.first_retry_interval_in_milliseconds, options.max_number_of_attempts) == (1000, 2)
+
+def test_next_batch_starts_when_any_activity_finishes():
+    context = FakeContext({'workspaces': [], 'batch_size': 1, 'parallelism': 3})
+    finished = []
+
+    def finish(tasks):
+        # the first started batch is the slow one, later batches keep finishing around it
+        assert len(tasks) == 3
+        finished.append(tasks[-1].data['workspaces'][0])
+        return tasks[-1]
+
+    result, most_running = run(context, [f'ws{item}' for item in range(8)], finish)
+    assert result == ['OK'] and most_running == 3
+    assert finished == ['ws2', 'ws3', 'ws4', 'ws5', 'ws6']
+    assert context.activities[-1].name == 'MergeDiagram'
+
+def test_failed_batch_fails_the_run():
+    context = FakeContext({'workspaces': [], 'batch_size': 1, 'parallelism': 2})
+
+    def finish(tasks):
+        tasks[0].result = RuntimeError('batch failed')
+        return tasks[0]
+
+    with pytest.raises(RuntimeError, match = 'batch failed'):
+        run(context, [f'ws{item}' for item in range(4)], finish)
+    assert 'MergeDiagram' not in [task.name for task in context.activities]
+
+def test_changes_found_by_admin_api_are_passed_to_incremental_batches():
+    context = FakeContext({'workspaces': ['Sales'], 'batch_size': 2, 'incremental': True})
+    run(context, ['ws0', 'ws1', 'ws2'], modified = {'ws1'})
+    assert context.activities[0].data == {'workspaces': ['Sales'], 'incremental': True}
+    crawls = [task.data for task in context.activities if task.name == 'CrawlWorkspaces']
+    assert [(data['workspaces'], data['modified'], data['incremental']) for data in crawls] == [(['ws0', 'ws1'], ['ws1'], True),
+                                                                                             (['ws2'], [], True)]
+    assert context.activities[-1].data['run_start'] == '2024-05-01T08:00:00'
+
+def test_orchestration_input_fills_settings_from_environment(monkeypatch):
+    monkeypatch.setenv('CrawlBatchSize', '5')
+    monkeypatch.setenv('IncrementalCrawl', 'True')
+    config = get_orchestration_input({'workspaces': ['Sales'], 'parallelism': 2})
+    assert config == {'workspaces': ['Sales'], 'batch_size': 5, 'parallelism': 2, 'retry_interval': 30, 'retry_attempts': 3,
+                      'incremental': True}
+
+class ActivityContext(FakeContext):
+    '''
+    Context running every activity function as soon as it is scheduled.
+    '''
+
+    def call_activity_with_retry(self, name: str, options, data):
+        task = super().call_activity_with_retry(name, options, data)
+        task.result = ACTIVITIES[name].main(json.loads(json.dumps(data)))
+        return task
+
+    def task_any(self, tasks: list):
+        return tasks[0]
+
+    def task_all(self, tasks: list):
+        return Task('all', None, None)
+
+ACTIVITIES = {'ListWorkspaces': ListWorkspaces, 'CrawlWorkspaces': CrawlWorkspaces, 'MergeDiagram': MergeDiagram}
+
+def run_activities(context: ActivityContext):
+    generator = orchestrator_function(context)
+    result = None
+    try:
+        while True:
+            result = generator.send(result).result
+    except StopIteration as stop:
+        return stop.value
+
+def set_environment(monkeypatch, folder, api):
+    settings = {'DataLakeConnectionString': f'file://{folder}', 'DataLakeContainerName': 'lineage', 'DiagramDataFolder': 'diagrams',
+                'CSVDataFolder': 'snapshots', 'PartialDataFolder': 'partial', 'WorkspaceStateFolder': 'state'}
+    for name, value in settings.items():
+        monkeypatch.setenv(name, value)
+    counters = []
+
+    def get_client(policy, metrics = None):
+        client = PowerBIClient(base_url = api.url, access_token = 'mock', policy = policy, metrics = metrics)
+        counters.append(client.metrics.counters)
+        return client
+
+    for module in ACTIVITIES.values():
+        monkeypatch.setattr(module, 'get_function_client', get_client, raising = False)
+    return counters
+
+def test_incremental_fan_out_reuses_unchanged_workspaces(tmp_path, monkeypatch):
+    tenant = copy.deepcopy(SAMPLE_TENANT)
+    with MockPowerBIApi(tenant) as api:
+        counters = set_environment(monkeypatch, tmp_path, api)
+        config = {'workspaces': [], 'batch_size': 1, 'parallelism': 2, 'incremental': True}
+        assert run_activities(ActivityContext(dict(config))) == ['OK']
+        state = json.loads((tmp_path / 'lineage' / 'state' / 'crawl_state.json').read_bytes())
+        assert (state['last_run'], state['crawled'], state['reused']) == ('2024-05-01T08:00:00', 2, 0)
+
+        tenant['workspaces'][1]['reports'].append({'id': 'rp-forecast', 'name': 'Forecast', 'datasetId': 'ds-budget'})
+        counters.clear()
+        context = ActivityContext(dict(config, run_id = 'run-2'))
+        assert run_activities(context) == ['OK']
+    state = json.loads((tmp_path / 'lineage' / 'state' / 'crawl_state.json').read_bytes())
+    assert (state['crawled'], state['reused']) == (1, 1)
+    assert sum(counter.get('workspaces_crawled', 0) for counter in counters) == 1
+    assert [task.data.get('modified', 'missing') for task in context.activities if task.name == 'CrawlWorkspaces'] == [None, None]
+    assert not (tmp_path / 'lineage' / 'partial' / 'run-2').exists()
+
+def test_merge_saves_diagram_and_deletes_partial_results(tmp_path, monkeypatch):
+    settings = {'DataLakeConnectionString': f'file://{tmp_path}', 'DataLakeContainerName': 'lineage', 'DiagramDataFolder': 'diagrams',
+                'CSVDataFolder': 'snapshots', 'PartialDataFolder': 'partial'}
+    for name, value in settings.items():
+        monkeypatch.setenv(name, value)
+    selected_groups, workspaces_data = synthetic_tenant_data(3, 2)
+    store = get_partial_store('run-1')
+    for workspace_id, (data_dict, missing_cat) in zip(selected_groups['id'], workspaces_data):
+        store.write(f'{workspace_id}.json', serialize_workspace_data(data_dict, missing_cat))
+
+    assert MergeDiagram.main({'run_id': 'run-1', 'workspaces': selected_groups.to_dict('records')}) == 'OK'
+    assert len(list((tmp_path / 'lineage' / 'diagrams').iterdir())) > 0
+    assert not (tmp_path / 'lineage' / 'partial' / 'run-1').exists()
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from Shared.pbi_client import PowerBIClient, TOKEN_REFRESH_MARGIN
+from scripts.mock_pbi_api import MockPowerBIApi
+
+class FakeApp:
+    '''
+    Stand-in of msal.PublicClientApplication giving numbered tokens.
+    '''
+
+    def __init__(self, expires_in: int = 3600, silent: bool = True, error: str = None):
+        self.expires_in, self.silent, self.error = expires_in, silent, error
+        self.calls = []
+
+    def _result(self, kind: str) -> dict:
+        self.calls.append(kind)
+        if self.error:
+            return {'error': 'invalid_grant', 'error_description': self.error}
+        return {'access_token': f'token-{len(self.calls)}', 'expires_in': self.expires_in}
+
+    def get_accounts(self, username = None):
+        return [{'username': username}] if self.silent and self.calls else []
+
+    def acquire_token_silent(self, scopes, account, force_refresh = False):
+        return self._result('silent')
+
+    def acquire_token_by_username_password(self, username, password, scopes):
+        return self._result('password')
+
+def signed_in_client(app: FakeApp) -> PowerBIClient:
+    client = PowerBIClient(username = 'anna@contoso.com', access_token = 'unused')
+    client._app, client._token, client._expires_at = app, None, 0
+    return client
+
+def test_token_is_cached_until_it_is_about_to_expire():
+    app = FakeApp()
+    client = signed_in_client(app)
+    assert client.get_token() == client.get_token() == 'token-1'
+    assert app.calls == ['password']
+
+    client._expires_at = time.time() + TOKEN_REFRESH_MARGIN - 1
+    assert client.get_token() == 'token-2'
+    assert client.get_token(force_refresh = True) == 'token-3'
+    assert app.calls == ['password', 'silent', 'silent']
+
+def test_password_is_used_when_silent_refresh_is_not_possible():
+    app = FakeApp(expires_in = 0, silent = False)
+    client = signed_in_client(app)
+    client.get_token()
+    client.get_token()
+    assert app.calls == ['password', 'password']
+
+def test_failed_sign_in_raises_permission_error():
+    client = signed_in_client(FakeApp(error = 'wrong password'))
+    with pytest.raises(PermissionError, match = 'wrong password'):
+        client.get_token()
+
+def test_calls_share_one_pooled_session():
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock', pool_size = 4) as client:
+        adapter = client.session.get_adapter(api.url)
+        assert adapter._pool_maxsize == 4
+        for _ in range(3):
+            assert client.get_json('groups')['value']
+        # one connection pool per host, kept open between the calls
+        assert len(adapter.poolmanager.pools) == 1
+        assert client.session.headers['Content-Type'] == 'application/json'
@@ -0,0 +1,58 @@
+import pytest
+import requests
+
+from Shared.request_policy import RequestPolicy, retry_after_seconds
+
+def response(status_code: int, retry_after: str = None) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status_code
+    if retry_after is not None:
+        result.headers['Retry-After'] = retry_after
+    return result
+
+def sender(*outcomes):
+    # returns send function giving the outcomes (responses or exceptions to raise) one by one
+    outcomes = list(outcomes)
+    calls = []
+
+    def send(timeout):
+        calls.append(timeout)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return send, calls
+
+def test_retry_after_is_cut_to_max_backoff():
+    assert retry_after_seconds(response(429, '86400'), 0.05) == 0.05
+    assert retry_after_seconds(response(429, 'Fri, 31 Dec 2100 23:59:59 GMT'), 0.05) == 0.05
+    assert retry_after_seconds(response(429, '2'), 60) == 2.0
+    assert retry_after_seconds(response(429, 'nan'), 60) is None
+    assert retry_after_seconds(response(429)) is None
+
+def test_long_retry_after_does_not_stall_retries():
+    policy = RequestPolicy(backoff_max=0.01)
+    send, calls = sender(response(429, '3600'), response(200))
+    assert policy.execute(send).status_code == 200
+    assert len(calls) == 2 and policy.stats.wait_seconds <= 0.01
+
+def test_idempotent_request_is_retried_after_server_error_and_timeout():
+    policy = RequestPolicy(backoff_base=0.001)
+    send, calls = sender(response(500), requests.ReadTimeout(), response(200))
+    assert policy.execute(send).status_code == 200
+    assert len(calls) == 3
+
+@pytest.mark.parametrize('failure', [response(500), response(503), requests.ReadTimeout()])
+def test_non_idempotent_request_is_not_repeated_after_it_may_have_been_processed(failure):
+    policy = RequestPolicy(backoff_base=0.001)
+    send, calls = sender(failure, response(200))
+    with pytest.raises((requests.HTTPError, requests.Timeout)):
+        policy.execute(send, idempotent=False)
+    assert len(calls) == 1
+
+def test_non_idempotent_request_is_retried_after_throttling_and_connection_error():
+    policy = RequestPolicy(backoff_base=0.001, backoff_max=0.01)
+    send, calls = sender(response(429, '1'), requests.ConnectionError(), response(202))
+    assert policy.execute(send, idempotent=False).status_code == 202
+    assert len(calls) == 3
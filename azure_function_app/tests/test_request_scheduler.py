@@ -0,0 +1,125 @@
+import time
+import threading
+
+import requests
+
+from Shared.request_scheduler import RequestScheduler, MemoryBudgetStore, FileBudgetStore, FileLease, IDENTITY, LISTING, ITEM, \
+    BURST_SECONDS, INCREASE
+from Shared.pbi_client import PowerBIClient
+
+class SlowStore(MemoryBudgetStore):
+    # shared store with long round trips
+    def update(self, function):
+        time.sleep(0.3)
+        return super().update(function)
+
+def acquire_all(scheduler, count: int, endpoint_class: str = LISTING) -> float:
+    start = time.monotonic()
+    for _ in range(count):
+        scheduler.acquire(endpoint_class)
+    return time.monotonic() - start
+
+def test_token_bucket_admits_burst_then_rate():
+    scheduler = RequestScheduler('app', {IDENTITY: 20.0, LISTING: 20.0})
+    assert acquire_all(scheduler, int(20 * BURST_SECONDS)) < 0.2
+    # next 10 tokens are refilled at 20 per second
+    assert 0.4 <= acquire_all(scheduler, 10) < 1.5
+
+def test_waiting_listings_go_before_items():
+    scheduler = RequestScheduler('app', {IDENTITY: 10.0})
+    acquire_all(scheduler, int(10 * BURST_SECONDS))
+    order = []
+
+    def request(endpoint_class):
+        scheduler.acquire(endpoint_class)
+        order.append(endpoint_class)
+
+    threads = [threading.Thread(target=request, args=(ITEM,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=request, args=(LISTING,)))
+    threads[-1].start()
+    for thread in threads:
+        thread.join()
+    assert order == [LISTING, ITEM, ITEM, ITEM]
+
+def test_throttling_halves_rates_blocks_and_recovers():
+    scheduler = RequestScheduler('app', {IDENTITY: 20.0, ITEM: 10.0})
+    scheduler.acquire(ITEM)
+    scheduler.observe(ITEM, 429, retry_after=0.3)
+    assert scheduler.as_dict()['rates'] == {IDENTITY: 10.0, ITEM: 5.0}
+    assert acquire_all(scheduler, 1, ITEM) >= 0.25
+    for _ in range(10):
+        scheduler.observe(ITEM, 200)
+    assert scheduler.as_dict()['rates'] == {IDENTITY: 10.0 + 10 * 20.0 * INCREASE, ITEM: 5.0 + 10 * 10.0 * INCREASE}
+    assert scheduler.as_dict()['throttled'] == 1
+
+def test_file_store_shares_budget_between_schedulers(tmp_path):
+    path = str(tmp_path / 'budget.json')
+    schedulers = [RequestScheduler('app', {IDENTITY: 10.0}, FileBudgetStore(path)) for _ in range(2)]
+    times = []
+    threads = [threading.Thread(target=lambda scheduler=scheduler: times.append(acquire_all(scheduler, 15))) for scheduler in schedulers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 30 requests from one budget of burst 20 and 10 per second
+    assert max(times) >= 0.8
+
+    schedulers[0].observe(LISTING, 429, retry_after=0.3)
+    assert schedulers[1].as_dict()['rates'][IDENTITY] == 5.0
+    assert acquire_all(schedulers[1], 1) >= 0.2
+
+def test_file_lease_is_exclusive_and_expires(tmp_path):
+    path = str(tmp_path / 'budget.json')
+    holder = FileLease(path, duration=0.3)
+    assert holder.acquire(timeout=0)
+    assert not FileLease(path, duration=0.3).acquire(timeout=0.05)
+    # lease of a holder that crashed without release is taken over after its duration
+    start = time.monotonic()
+    assert FileLease(path, duration=0.3).acquire(timeout=2)
+    assert time.monotonic() - start >= 0.2
+
+def test_store_round_trip_does_not_block_other_threads():
+    scheduler = RequestScheduler('app', {IDENTITY: 10.0}, SlowStore(), grant_size = 5)
+    thread = threading.Thread(target=scheduler.acquire, args=(LISTING,))
+    thread.start()
+    time.sleep(0.05)
+    # success is counted locally while the grant is being taken from the store
+    start = time.monotonic()
+    scheduler.observe(LISTING, 200)
+    assert time.monotonic() - start < 0.1
+    thread.join()
+    assert acquire_all(scheduler, 4) < 0.1
+
+def test_grant_taken_before_throttling_is_dropped():
+    store = SlowStore()
+    scheduler = RequestScheduler('app', {IDENTITY: 10.0}, store, grant_size = 5)
+    thread = threading.Thread(target=scheduler.acquire, args=(LISTING,))
+    thread.start()
+    time.sleep(0.05)
+    scheduler.observe(LISTING, 429, retry_after = 0.5)
+    thread.join()
+    # the request waited for the block, its tokens came from a grant taken after the throttling
+    assert store.state['app|identity']['blocked_until'] > 0 and scheduler.stats['wait_seconds'] >= 0.5
+
+class RejectingSession:
+    # rejects the first token
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code, response._content = (401, b'') if self.calls == 1 else (200, b'{}')
+        return response
+
+def test_request_repeated_with_new_token_takes_budget():
+    scheduler = RequestScheduler('app', {IDENTITY: 10.0})
+    acquired = []
+    scheduler.acquire = lambda endpoint_class, acquire = scheduler.acquire: acquired.append(endpoint_class) or acquire(endpoint_class)
+    client = PowerBIClient(base_url = 'http://localhost/', access_token = 'mock', scheduler = scheduler)
+    client.session = RejectingSession()
+    assert client.get('groups').status_code == 200
+    assert client.session.calls == 2 and acquired == [LISTING, LISTING]
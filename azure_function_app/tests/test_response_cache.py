@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from Shared.pbi_client import PowerBIClient
+from Shared.response_cache import ResponseCache, CacheMissError
+from Shared.scanner_api import scan_batch, download_scanner_data
+from Shared.data_load_transform import CATEGORIES
+from scripts.mock_pbi_api import MockPowerBIApi, SAMPLE_TENANT
+
+WORKSPACE_IDS = [workspace['id'] for workspace in SAMPLE_TENANT['workspaces']]
+
+def test_cached_get_is_reused(tmp_path):
+    with MockPowerBIApi() as api:
+        for _ in range(2):
+            with PowerBIClient(base_url = api.url, access_token = 'mock', cache = ResponseCache(str(tmp_path))) as client:
+                assert [group['id'] for group in client.get_json('groups')['value']] == WORKSPACE_IDS
+        assert api.request_count == 1
+
+def test_scan_polls_are_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    with MockPowerBIApi(scan_duration = 0.3) as api, PowerBIClient(base_url = api.url, access_token = 'mock', cache = cache) as client:
+        result = scan_batch(client, WORKSPACE_IDS, poll_interval = 0.05, timeout = 5)
+        assert [workspace['id'] for workspace in result['workspaces']] == WORKSPACE_IDS
+        # second crawl with the same cache starts a new scan and downloads its own result
+        scans = len(api.scans)
+        data = download_scanner_data(client, CATEGORIES, WORKSPACE_IDS)
+        assert len(api.scans) == scans + 1
+        assert list(data[0][0]['reports']['id']) == ['rp-sales']
+    assert cache.hits == 0
+
+def test_replay_never_calls_api(tmp_path):
+    with MockPowerBIApi() as api:
+        with PowerBIClient(base_url = api.url, access_token = 'mock', cache = ResponseCache(str(tmp_path))) as client:
+            client.get_json('groups')
+        with PowerBIClient(base_url = api.url, access_token = 'mock', cache = ResponseCache(str(tmp_path), replay = True)) as client:
+            assert len(client.get_json('groups')['value']) == len(WORKSPACE_IDS)
+            with pytest.raises(CacheMissError):
+                client.get_json('groups/ws-sales/users')
+            with pytest.raises(CacheMissError):
+                scan_batch(client, WORKSPACE_IDS, poll_interval = 0.05, timeout = 5)
+        assert api.request_count == 1
+
+def test_entry_evicted_while_read_is_still_returned(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+    cache.put('groups', '', {'value': []})
+
+    def evicted(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, 'utime', evicted)
+    assert cache.get('groups') == {'value': []} and cache.hits == 1
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from Shared.pbi_client import PowerBIClient
+from Shared.run_metrics import RunMetrics, endpoint_name
+from Shared.data_load_transform import execute_load_transform
+from scripts.mock_pbi_api import MockPowerBIApi
+
+def test_ids_and_query_are_removed_from_endpoint_names():
+    assert endpoint_name('groups/ws-sales/datasets/ds-sales/datasources') == 'groups/{id}/datasets/{id}/datasources'
+    assert endpoint_name('admin/groups?$top=5000&$skip=0') == 'admin/groups'
+    assert endpoint_name('admin/workspaces/scanStatus/1234') == 'admin/workspaces/scanStatus/{id}'
+
+def test_repeated_stages_are_summed_and_failed_ones_recorded():
+    metrics = RunMetrics()
+    for _ in range(2):
+        with metrics.stage('users'):
+            pass
+    with pytest.raises(ValueError):
+        with metrics.stage('export'):
+            raise ValueError('failed')
+    stages = metrics.as_dict()['stages']
+    assert stages['users']['count'] == 2 and stages['export']['count'] == 1
+
+def test_requests_are_grouped_by_endpoint_and_workspace():
+    metrics = RunMetrics()
+    metrics.record_request('GET', 'groups/ws-sales/reports', 0.02, True, 100)
+    metrics.record_request('GET', 'groups/ws-finance/reports', 0.3, True, 50)
+    metrics.record_request('GET', 'groups/ws-sales/users', 40, False, 0)
+    metrics.count('saved_calls', 3)
+    result = metrics.as_dict()
+    reports = result['endpoints']['GET groups/{id}/reports']
+    assert (reports['requests'], reports['errors'], reports['response_bytes']) == (2, 0, 150)
+    assert reports['histogram']['le_0.05s'] == 1 and reports['histogram']['le_0.5s'] == 1
+    assert result['endpoints']['GET groups/{id}/users']['histogram']['gt_30s'] == 1
+    assert (result['requests'], result['response_bytes'], result['counters']) == (3, 150, {'saved_calls': 3})
+    assert [workspace['id'] for workspace in result['workspaces']['slowest']] == ['ws-sales', 'ws-finance']
+    assert json.loads(json.dumps(result)) == result
+
+def test_crawl_records_every_request_and_stage():
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        execute_load_transform(client, [])
+        result = client.metrics.as_dict()
+        assert result['requests'] == api.request_count
+    assert result['endpoints']['GET groups/{id}/users']['requests'] == 2
+    assert {'download', 'users', 'reports'} <= set(result['stages'])
+    assert result['workspaces']['count'] == 2
@@ -0,0 +1,66 @@
+import types
+import datetime
+import hashlib
+
+import pyarrow.parquet as pq
+
+from Shared import function_util
+from Shared.data_load_transform import build_lineage_graph
+from Shared.drawio_xml import graph_to_drawio
+from scripts.benchmark_transform import synthetic_tenant_data
+
+def set_environment(monkeypatch, folder):
+    settings = {'DataLakeConnectionString': f'file://{folder}', 'DataLakeContainerName': 'lineage', 'DiagramDataFolder': 'diagrams',
+                'CSVDataFolder': 'snapshots', 'SnapshotFormat': 'both', 'HistoryFolder': 'history', 'CatalogFolder': 'catalog',
+                'DiagramPages': 'workspace', 'MaxPageNodes': '20'}
+    for name, value in settings.items():
+        monkeypatch.setenv(name, value)
+
+def set_clock(monkeypatch, *times):
+    times = iter(times)
+
+    class Clock(datetime.datetime):
+        @classmethod
+        def utcnow(cls):
+            return next(times)
+
+    monkeypatch.setattr(function_util, 'datetime', types.SimpleNamespace(datetime = Clock))
+
+def test_streamed_outputs_match_the_graph(tmp_path, monkeypatch):
+    set_environment(monkeypatch, tmp_path)
+    set_clock(monkeypatch, datetime.datetime(2024, 5, 1, 8, 0), datetime.datetime(2024, 5, 2, 8, 0))
+    graphs = [build_lineage_graph(*synthetic_tenant_data(workspaces, 4)) for workspaces in (6, 7)]
+    for graph in graphs:
+        function_util.save_diagram(graph)
+
+    folder = tmp_path / 'lineage'
+    parquet_file = folder / 'snapshots' / '2024-05-02 08:00.parquet'
+    table = pq.read_table(parquet_file)
+    frame = graphs[1].to_frame()
+    assert table.num_rows == len(frame)
+    assert sorted(table.column('id').to_pylist()) == sorted(frame['id'].str.strip('"'))
+    assert (folder / 'snapshots' / '2024-05-02 08:00.csv').is_file()
+
+    drawio = (folder / 'diagrams' / '2024-05-02 08:00.drawio').read_bytes()
+    assert drawio == graph_to_drawio(graphs[1], shard_by = 'workspace', max_page_nodes = 20)
+
+    entry = function_util.get_snapshot_catalog().latest(1)[0]
+    assert entry['file'] == parquet_file.name and entry['sha256'] == hashlib.sha256(parquet_file.read_bytes()).hexdigest()
+    history = function_util.get_snapshot_history().read_index()
+    assert [entry['kind'] for entry in history] == ['base', 'delta'] and history[1]['changes'] > 0
+
+def test_history_gets_new_base_when_previous_snapshot_was_not_recorded(tmp_path, monkeypatch):
+    set_environment(monkeypatch, tmp_path)
+    set_clock(monkeypatch, *[datetime.datetime(2024, 5, day, 8, 0) for day in (1, 2, 3, 4)])
+    graphs = [build_lineage_graph(*synthetic_tenant_data(workspaces, 4)) for workspaces in (6, 7, 8, 9)]
+    for position, graph in enumerate(graphs):
+        # history is not recorded by the second run
+        if position == 1:
+            monkeypatch.delenv('HistoryFolder')
+        function_util.save_diagram(graph)
+        monkeypatch.setenv('HistoryFolder', 'history')
+
+    history = function_util.get_snapshot_history()
+    assert [entry['kind'] for entry in history.read_index()] == ['base', 'base', 'delta']
+    state = history.state_at('2024-05-03T08:00:00')
+    assert {node_id for _, node_id in state} == set(graphs[2].to_frame()['id'].str.strip('"'))
@@ -0,0 +1,52 @@
+import copy
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from Shared.pbi_client import PowerBIClient
+from Shared import scanner_api
+from Shared.scanner_api import list_admin_workspaces, scan_batch, scan_workspaces
+from Shared.data_load_transform import execute_load_transform
+from scripts.mock_pbi_api import MockPowerBIApi, SAMPLE_TENANT
+
+def test_admin_workspaces_are_paged_and_filtered():
+    tenant = copy.deepcopy(SAMPLE_TENANT)
+    tenant['workspaces'] += [{'id': 'ws-anna', 'name': 'PersonalWorkspace Anna', 'type': 'PersonalGroup', 'state': 'Active'},
+                             {'id': 'ws-old', 'name': 'Old', 'type': 'Workspace', 'state': 'Deleted'},
+                             {'id': 'ws-hr', 'name': 'HR', 'type': 'Workspace', 'state': 'Active'}]
+    with MockPowerBIApi(tenant) as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        group_df = list_admin_workspaces(client, page_size = 2)
+        assert api.request_count == 3
+    assert list(group_df['id']) == ['ws-sales', 'ws-finance', 'ws-hr']
+
+def test_scan_status_is_polled_until_scan_succeeds():
+    with MockPowerBIApi(scan_duration = 0.3) as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        scan_result = scan_batch(client, ['ws-finance'], poll_interval = 0.05)
+        # scan request, status polls and result download
+        assert api.request_count >= 5
+    assert [workspace['id'] for workspace in scan_result['workspaces']] == ['ws-finance']
+    assert [instance['datasourceId'] for instance in scan_result['datasourceInstances']] == ['src-sharepoint']
+
+def test_waiting_for_scan_stops_after_timeout():
+    with MockPowerBIApi(scan_duration = 60) as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        with pytest.raises(TimeoutError):
+            scan_batch(client, ['ws-sales'], poll_interval = 0.05, timeout = 0.2)
+
+def test_batches_are_scanned_separately_and_merged():
+    with MockPowerBIApi(scan_duration = 0.1) as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        scan_result = scan_workspaces(client, ['ws-sales', 'ws-finance'], batch_size = 1, poll_interval = 0.05)
+        assert len(api.scans) == 2
+    assert sorted(workspace['id'] for workspace in scan_result['workspaces']) == ['ws-finance', 'ws-sales']
+    assert sorted(instance['datasourceId'] for instance in scan_result['datasourceInstances']) == ['src-sharepoint', 'src-sql']
+
+def test_scanner_crawl_gives_the_same_diagram_as_rest_crawl(monkeypatch):
+    # scans of the mock finish at once, the crawl does not wait the poll interval
+    monkeypatch.setattr(scanner_api, 'time', SimpleNamespace(sleep = lambda seconds: None, monotonic = time.monotonic))
+    frames = {}
+    for backend in ['rest', 'scanner']:
+        with MockPowerBIApi(scan_duration = 0) as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+            frame = execute_load_transform(client, [], backend = backend)
+        frames[backend] = frame.sort_values(list(frame.columns)).reset_index(drop = True)
+    pd.testing.assert_frame_equal(frames['rest'], frames['scanner'])
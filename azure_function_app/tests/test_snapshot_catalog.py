@@ -0,0 +1,42 @@
+from Shared.data_lake_util import DataLakeFolderStore
+from Shared.snapshot_catalog import SnapshotCatalog, LATEST_ENTRIES, LATEST_FILE
+
+class RecordingStore(DataLakeFolderStore):
+    # remembers names of the files read
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.reads = []
+
+    def read(self, file_name: str) -> bytes:
+        self.reads.append(file_name)
+        return super().read(file_name)
+
+def catalog(tmp_path, timestamps: list) -> SnapshotCatalog:
+    result = SnapshotCatalog(RecordingStore(f'file://{tmp_path}', 'lineage', 'catalog'))
+    for timestamp in timestamps:
+        result.record('snapshots', timestamp[:16] + '.csv', timestamp, timestamp.encode(), {'reports': 1, 'datasets': 2})
+    result.store.reads.clear()
+    return result
+
+def test_range_reads_only_partitions_of_its_months(tmp_path):
+    snapshots = catalog(tmp_path, ['2024-01-31T23:00:00', '2024-02-15T08:00:00', '2023-12-31T08:00:00', '2024-03-01T00:00:00',
+                                   '2024-04-10T08:00:00'])
+    entries = snapshots.between('2024-01-31T00:00:00', '2024-03-01T00:00:00')
+    assert [entry['timestamp'] for entry in entries] == ['2024-01-31T23:00:00', '2024-02-15T08:00:00', '2024-03-01T00:00:00']
+    assert snapshots.store.reads == ['manifest-2024-01.jsonl', 'manifest-2024-02.jsonl', 'manifest-2024-03.jsonl']
+    assert entries[0]['rows'] == 3 and entries[0]['rows_by_type'] == {'reports': 1, 'datasets': 2}
+    # range across the year, month without snapshots is skipped
+    assert [entry['file'] for entry in snapshots.between('2023-12-01T00:00:00', '2024-01-31T23:59:59')] == ['2023-12-31T08:00.csv',
+                                                                                                            '2024-01-31T23:00.csv']
+    assert snapshots.read_partition('2024-05') is None
+
+def test_latest_snapshots_are_read_from_the_index(tmp_path):
+    snapshots = catalog(tmp_path, [f'2024-05-{day:02}T08:00:00' for day in range(1, 4)])
+    assert [entry['timestamp'] for entry in snapshots.latest()] == ['2024-05-03T08:00:00', '2024-05-02T08:00:00']
+    assert snapshots.store.reads == [LATEST_FILE]
+
+def test_older_snapshots_than_the_index_keeps_are_read_from_partitions(tmp_path):
+    timestamps = [f'2024-{month:02}-{day:02}T08:00:00' for month in (4, 5) for day in range(1, 16)]
+    snapshots = catalog(tmp_path, timestamps)
+    assert len(snapshots.read_index()['entries']) == LATEST_ENTRIES
+    assert [entry['timestamp'] for entry in snapshots.latest(25)] == timestamps[::-1][:25]
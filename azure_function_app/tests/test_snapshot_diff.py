@@ -0,0 +1,96 @@
+import io
+
+import pyarrow.parquet as pq
+
+from Shared.lineage_graph import LineageGraph, PARENT
+from Shared.diagram_sink import DiagramSink
+from Shared.data_lake_util import ParquetSnapshotWriter, SNAPSHOT_SCHEMA
+from Shared.snapshot_diff import graph_diff, diff_snapshots, read_snapshot
+
+def report_graph(reports: dict) -> LineageGraph:
+    # reports: report id -> dataset id
+    graph = LineageGraph()
+    workspace = graph.add_node('ws-sales', 'Sales', 'workspaces', 'ws-sales')
+    for dataset_id in sorted(set(reports.values())):
+        graph.add_edge(graph.add_node(dataset_id, dataset_id, 'datasets', 'ws-sales'), workspace, PARENT)
+    for report_id, dataset_id in reports.items():
+        report = graph.add_node(report_id, report_id, 'reports', 'ws-sales')
+        graph.add_edge(report, graph.intern(dataset_id), PARENT)
+        graph.add_edge(report, workspace, PARENT)
+    return graph
+
+def csv_snapshot(graph: LineageGraph) -> bytes:
+    output = io.BytesIO()
+    sink = DiagramSink(output, None)
+    sink.write_rows(graph.rows())
+    sink.close()
+    return output.getvalue()
+
+def parquet_snapshot(graph: LineageGraph) -> bytes:
+    output = io.BytesIO()
+    with ParquetSnapshotWriter(output) as writer:
+        sink = DiagramSink(None, None, row_writers = [writer])
+        sink.write_rows(graph.rows())
+        sink.close()
+    return output.getvalue()
+
+def opener(content: bytes):
+    return lambda: io.BytesIO(content)
+
+def test_added_and_removed_nodes_and_edges_are_grouped_by_type():
+    previous = csv_snapshot(report_graph({'rp-sales': 'ds-sales', 'rp-old': 'ds-sales'}))
+    latest = csv_snapshot(report_graph({'rp-sales': 'ds-budget', 'rp-new': 'ds-sales'}))
+    diff = graph_diff(opener(latest), opener(previous))
+    assert diff['nodes'] == {'added': {'datasets': ['ds-budget'], 'reports': ['rp-new']}, 'removed': {'reports': ['rp-old']}}
+    assert sorted(diff['edges']['added']['parent']['reports']) == [['rp-new', 'ds-sales'], ['rp-new', 'ws-sales'], ['rp-sales', 'ds-budget']]
+    assert diff['edges']['added']['parent']['datasets'] == [['ds-budget', 'ws-sales']]
+    assert sorted(diff['edges']['removed']['parent']['reports']) == [['rp-old', 'ds-sales'], ['rp-old', 'ws-sales'], ['rp-sales', 'ds-sales']]
+    assert diff['summary'] == {'added': {'nodes': 2, 'edges': 4}, 'removed': {'nodes': 1, 'edges': 3}}
+
+def test_lists_are_cut_but_summary_is_complete():
+    previous = csv_snapshot(report_graph({'rp-sales': 'ds-sales'}))
+    latest = csv_snapshot(report_graph({f'rp{item}': 'ds-sales' for item in range(10)}))
+    diff = graph_diff(opener(latest), opener(previous), max_items = 3)
+    assert len(diff['nodes']['added']['reports']) == 3 and len(diff['edges']['added']['parent']['reports']) == 3
+    assert diff['summary']['added'] == {'nodes': 10, 'edges': 20}
+
+def test_same_lineage_has_no_changes():
+    graph = report_graph({'rp-sales': 'ds-sales'})
+    # order of ids in the edge strings doesn't matter
+    reordered = LineageGraph()
+    workspace = reordered.intern('ws-sales')
+    report = reordered.add_node('rp-sales', 'rp-sales', 'reports', 'ws-sales')
+    reordered.add_edge(report, workspace, PARENT)
+    reordered.add_edge(report, reordered.add_node('ds-sales', 'ds-sales', 'datasets', 'ws-sales'), PARENT)
+    reordered.add_edge(reordered.intern('ds-sales'), workspace, PARENT)
+    reordered.add_node('ws-sales', 'Sales', 'workspaces', 'ws-sales')
+    diff = graph_diff(opener(csv_snapshot(reordered)), opener(csv_snapshot(graph)))
+    assert diff['summary'] == {'added': {'nodes': 0, 'edges': 0}, 'removed': {'nodes': 0, 'edges': 0}}
+
+def test_parquet_snapshot_has_fixed_schema_and_ids_without_quotes():
+    content = parquet_snapshot(report_graph({'rp-sales': 'ds-sales'}))
+    assert pq.read_schema(io.BytesIO(content)) == SNAPSHOT_SCHEMA
+    header, rows = read_snapshot(io.BytesIO(content), ['id', 'type'])
+    assert header == ['id', 'type']
+    assert list(rows) == [['ds-sales', 'datasets'], ['rp-sales', 'reports'], ['ws-sales', 'workspaces']]
+    header, rows = read_snapshot(io.BytesIO(content))
+    assert header == SNAPSHOT_SCHEMA.names and ['ws-sales', 'Sales', 'workspaces', '', '', ''] in list(rows)
+
+def test_parquet_and_csv_snapshots_of_the_same_graph_are_equal():
+    graph = report_graph({'rp-sales': 'ds-sales', 'rp-budget': 'ds-budget'})
+    csv_content, parquet_content = csv_snapshot(graph), parquet_snapshot(graph)
+    # CSV snapshot has also fill and image columns of html_spec
+    columns, changes = diff_snapshots(opener(parquet_content), opener(csv_content))
+    assert columns['columns_added'] == [] and list(changes) == []
+    diff = graph_diff(opener(parquet_content), opener(csv_content))
+    assert diff['summary'] == {'added': {'nodes': 0, 'edges': 0}, 'removed': {'nodes': 0, 'edges': 0}}
+
+def test_changes_between_parquet_snapshots():
+    previous = parquet_snapshot(report_graph({'rp-sales': 'ds-sales'}))
+    latest = parquet_snapshot(report_graph({'rp-sales': 'ds-budget'}))
+    _, changes = diff_snapshots(opener(latest), opener(previous))
+    assert list(changes) == [('added', {'id': 'ds-budget', 'name': 'ds-budget', 'type': 'datasets', 'parent': 'ws-sales', 'relatives': '',
+                                        'access': ''}),
+                             ('removed', {'id': 'ds-sales', 'name': 'ds-sales', 'type': 'datasets', 'parent': 'ws-sales', 'relatives': '',
+                                          'access': ''}),
+                             ('changed', {'type': 'reports', 'id': 'rp-sales', 'changes': {'parent': ['ds-sales,ws-sales', 'ds-budget,ws-sales']}})]
@@ -0,0 +1,79 @@
+import io
+
+import pytest
+
+from Shared.snapshot_history import SnapshotHistory, INDEX_FILE, HISTORY_COLUMNS, encode_rows
+
+class MemoryStore:
+    def __init__(self):
+        self.files = {}
+
+    def read(self, file_name: str) -> bytes:
+        return self.files.get(file_name)
+
+    def write(self, file_name: str, data: bytes):
+        self.files[file_name] = data
+
+    def delete(self, file_name: str):
+        self.files.pop(file_name, None)
+
+class InterruptedStore(MemoryStore):
+    # compaction job stopped right before it switched the index
+    def write(self, file_name: str, data: bytes):
+        if file_name == INDEX_FILE:
+            raise RuntimeError('interrupted')
+        super().write(file_name, data)
+
+def snapshot(names: dict) -> bytes:
+    rows = [[node_id, name, 'Report', 'ws1', '', ''] for node_id, name in sorted(names.items())]
+    return encode_rows(HISTORY_COLUMNS, rows, compress = False)[0]
+
+def recorded_history(store) -> tuple:
+    history = SnapshotHistory(MemoryStore())
+    timestamps = [f'2024-05-01T{hour:02}:00:00' for hour in range(8, 12)] + ['2024-05-02T08:00:00']
+    snapshots, previous = [], None
+    for position, timestamp in enumerate(timestamps):
+        names = {f'rp{item}': f'Report {item}' for item in range(20)}
+        names.update({f'rp{item}': f'Renamed {position}' for item in range(position)})
+        content = snapshot(names)
+        history.record(timestamp, lambda content=content: io.BytesIO(content),
+                       (lambda previous=previous: io.BytesIO(previous)) if previous else None)
+        snapshots.append(content)
+        previous = content
+    store.files = dict(history.store.files)
+    return SnapshotHistory(store), timestamps, snapshots
+
+def test_compaction_merges_day_into_new_delta():
+    history, timestamps, snapshots = recorded_history(MemoryStore())
+    before = history.read_index()
+    counts = history.compact('2024-05-03')
+    index = history.read_index()
+    assert [entry['kind'] for entry in index] == ['base', 'delta', 'delta']
+    assert index[1]['file'] not in {entry['file'] for entry in before}
+    assert counts == {'removed': 3, 'written': 1}
+    assert set(history.store.files) == {INDEX_FILE} | {entry['file'] for entry in index}
+    assert history.snapshot_at(timestamps[3]) == snapshots[3]
+    assert history.snapshot_at(timestamps[4]) == snapshots[4]
+
+def test_interrupted_compaction_keeps_history_readable():
+    history, timestamps, snapshots = recorded_history(InterruptedStore())
+    files = dict(history.store.files)
+    with pytest.raises(RuntimeError):
+        history.compact('2024-05-03')
+    # files of the index in effect are untouched, merged delta is written beside them
+    assert {file_name: history.store.files[file_name] for file_name in files} == files
+    assert len(history.store.files) == len(files) + 1
+    for timestamp, content in zip(timestamps, snapshots):
+        assert history.snapshot_at(timestamp) == content
+
+def test_new_base_is_written_when_columns_change():
+    history = SnapshotHistory(MemoryStore())
+    # snapshot saved before the access column existed
+    old_columns = HISTORY_COLUMNS[:-1]
+    previous = encode_rows(old_columns, [['ws1', 'Sales', 'workspaces', '', 'anna@contoso.com']], compress = False)[0]
+    latest = encode_rows(HISTORY_COLUMNS, [['ws1', 'Sales', 'workspaces', '', 'anna@contoso.com', 'Admin:anna@contoso.com']],
+                         compress = False)[0]
+    history.record('2024-05-01T08:00:00', lambda: io.BytesIO(previous))
+    entry = history.record('2024-05-02T08:00:00', lambda: io.BytesIO(latest), lambda: io.BytesIO(previous))
+    assert entry['kind'] == 'base'
+    assert history.snapshot_at('2024-05-02T08:00:00') == latest
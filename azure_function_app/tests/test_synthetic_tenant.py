@@ -0,0 +1,30 @@
+from Shared.pbi_client import PowerBIClient
+from Shared.request_policy import RequestPolicy
+from Shared.data_load_transform import execute_load_transform
+from scripts.synthetic_tenant import synthetic_tenant, expected_counts, tenant_size
+from scripts.benchmark_crawl import frame_rows, type_counts
+from scripts.mock_pbi_api import MockPowerBIApi
+
+def crawl(tenant: dict, **mock_options) -> tuple:
+    with MockPowerBIApi(tenant, **mock_options) as api, \
+         PowerBIClient(base_url = api.url, access_token = 'mock', policy = RequestPolicy(backoff_base = 0.001, backoff_max = 0.01)) as client:
+        rows = frame_rows(execute_load_transform(client, [], 4))
+        return rows, api.throttled_count
+
+def test_same_seed_gives_same_tenant():
+    assert synthetic_tenant(5, seed = 3) == synthetic_tenant(5, seed = 3) != synthetic_tenant(5, seed = 4)
+    size = tenant_size(synthetic_tenant(4, users = 3, dataflows = 1, datasets = 2, reports = 2, dashboards = 1, tiles = 3))
+    assert size == {'workspaces': 4, 'users': 12, 'dataflows': 4, 'datasets': 8, 'reports': 16, 'dashboards': 4, 'tiles': 12,
+                    'datasources': 8}
+
+def test_crawl_of_the_mock_gives_expected_counts():
+    tenant = synthetic_tenant(8, users = 3, datasets = 3, cross_workspace = 0.3, empty_workspaces = 0.25, seed = 1)
+    assert any(not workspace.get('users') for workspace in tenant['workspaces'])
+    rows, _ = crawl(tenant)
+    assert type_counts(rows) == expected_counts(tenant)
+
+def test_throttled_requests_are_retried_to_the_same_output():
+    tenant = synthetic_tenant(4, seed = 2)
+    rows, _ = crawl(tenant)
+    throttled_rows, throttled = crawl(tenant, throttle_rate = 0.2, retry_after = 0.01, seed = 5)
+    assert throttled > 0 and throttled_rows == rows
@@ -0,0 +1,43 @@
+import os
+
+import pandas as pd
+
+from Shared.pbi_client import PowerBIClient
+from Shared.data_load_transform import list_workspaces, download_workspaces, transform_workspaces_data
+from scripts.benchmark_transform import synthetic_tenant_data
+from scripts.benchmark_crawl import GOLDEN_FOLDER, csv_rows, frame_rows
+from scripts.mock_pbi_api import MockPowerBIApi
+
+def test_sample_tenant_is_transformed_into_golden_rows():
+    with MockPowerBIApi() as api, PowerBIClient(base_url = api.url, access_token = 'mock') as client:
+        selected_groups = list_workspaces(client, [])
+        output = transform_workspaces_data(selected_groups, download_workspaces(client, list(selected_groups['id'])))
+    with open(os.path.join(GOLDEN_FOLDER, 'sample.csv'), 'rb') as file:
+        assert frame_rows(output) == csv_rows(file.read())
+
+def test_every_resource_of_every_workspace_has_one_row():
+    selected_groups, workspaces_data = synthetic_tenant_data(3, 4)
+    rows = frame_rows(transform_workspaces_data(selected_groups, workspaces_data))
+    counts = pd.Series([row[2] for row in rows]).value_counts()
+    assert (counts['workspaces'], counts['dataflows'], counts['datasets'], counts['reports'], counts['dashboards']) == (3, 12, 12, 12, 12)
+    assert len({(row[0], row[2]) for row in rows}) == len(rows)
+    # report is a child of its dataset and its workspace
+    expected = {(report_id, ','.join(sorted([dataset_id, workspace_id])))
+                for workspace_id, (data_dict, _) in zip(selected_groups['id'], workspaces_data)
+                for report_id, dataset_id in zip(data_dict['reports']['id'], data_dict['reports']['datasetId'])}
+    assert {(row[0], row[3]) for row in rows if row[2] == 'reports'} == expected
+
+def test_output_does_not_depend_on_workspace_order():
+    selected_groups, workspaces_data = synthetic_tenant_data(4, 3)
+    rows = frame_rows(transform_workspaces_data(selected_groups, workspaces_data))
+    reversed_rows = frame_rows(transform_workspaces_data(selected_groups.iloc[::-1].reset_index(drop = True), workspaces_data[::-1]))
+    # the same user can be listed under other display names in other workspaces, the first one is kept
+    assert [row[:1] + row[2:] for row in rows] == [row[:1] + row[2:] for row in reversed_rows]
+
+def test_workspace_without_users_is_skipped():
+    selected_groups, workspaces_data = synthetic_tenant_data(2, 2)
+    # usage-monitoring content only
+    workspaces_data[1] = ({'reports': workspaces_data[1][0]['reports']}, ['users', 'dataflows', 'datasets', 'dashboards'])
+    rows = frame_rows(transform_workspaces_data(selected_groups, workspaces_data))
+    assert [row[0] for row in rows if row[2] == 'workspaces'] == ['ws0']
+    assert not [row for row in rows if row[0].startswith('ws1')]
@@ -1,54 +1,113 @@
-import msal
-import requests
-import json
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
-def get_app_token(username: str, password: str, client_id: str, tenant_id: str) -> str:
+from Shared.pbi_client import PowerBIClient
+from Shared.request_policy import RequestPolicy
+from Shared.request_scheduler import RequestScheduler
+from Shared.response_cache import ResponseCache
+from Shared.scanner_api import list_admin_workspaces, download_scanner_data
+from Shared.entity_normalization import datasource_entity, canonical_identifier
+from Shared.lineage_graph import LineageGraph, PARENT, RELATIVE, UPSTREAM
+from Shared.run_metrics import RunMetrics
+
+# default number of API calls running at the same time
+MAX_WORKERS = 8
+CATEGORIES = ['users', 'dataflows', 'datasets', 'reports', 'dashboards']
+# declarative plan of the calls below the category lists - (data_dict key, category the call needs items of,
+# url below 'groups/{workspace id}/', fetch category selecting it); '{id}' urls are called for every item of the category
+FETCH_STEPS = [('dataflows_datasources', 'dataflows', 'dataflows/{id}/datasources', 'datasources'),
+               ('datasets_datasources', 'datasets', 'datasets/{id}/datasources', 'datasources'),
+               ('datasets_upstreamdataflows', 'datasets', 'datasets/upstreamdataflows', 'upstreamdataflows'),
+               ('dashboards_datasources', 'dashboards', 'dashboards/{id}/tiles', 'tiles')]
+# categories a run can select, all of them by default
+FETCH_CATEGORIES = CATEGORIES + ['datasources', 'upstreamdataflows', 'tiles']
+
+def get_app_client(username: str, password: str, client_id: str, tenant_id: str, max_workers: int = MAX_WORKERS,
+                   policy: RequestPolicy = None, cache: ResponseCache = None, api_url: str = None,
+                   metrics: RunMetrics = None, scheduler: RequestScheduler = None) -> PowerBIClient:
     '''
-    Retrieve token for the app registered in Azure & PowerBI Service.
+    Create client for the app registered in Azure & PowerBI Service.
     
     Parameters:
         username (str): for Azure & PowerBI account
         password (str): for Azure & PowerBI account
         client_id (str): Azure App Registration (client) ID
         tenant_id (str): Azure App Registration directory (tenant) ID
+        max_workers (int): maximal number of calls running at the same time (size of connection pool)
+        policy (RequestPolicy): timeouts, retries and hedging of the requests
+        cache (ResponseCache): on-disk cache of responses, in replay mode no sign-in happens
+        api_url (str): address of other API than PBI Service (for example local mock of scripts/mock_pbi_api), no sign-in happens
+        metrics (RunMetrics): instrumentation of the run, collects per-endpoint request metrics
+        scheduler (RequestScheduler): rate-limit-aware admission of the requests (token buckets per identity and endpoint class)
     
     Returns:
-        access_token (str): token for accessing PBI Service API
+        client (PowerBIClient): client for accessing PBI Service API
         
     '''
-    authority_url = 'https://login.microsoftonline.com/' + tenant_id
-    scope = ['https://analysis.windows.net/powerbi/api/.default']
+    if api_url is not None:
+        return PowerBIClient(username, pool_size=max_workers, base_url=api_url, policy=policy, access_token='mock', cache=cache,
+                             metrics=metrics, scheduler=scheduler)
+    if cache is not None and cache.replay:
+        return PowerBIClient(username, pool_size=max_workers, policy=policy, access_token='replay', cache=cache, metrics=metrics,
+                             scheduler=scheduler)
+    return PowerBIClient(username, password, client_id, tenant_id, pool_size=max_workers, policy=policy, cache=cache, metrics=metrics,
+                         scheduler=scheduler)
+
+def get_app_token(username: str, password: str, client_id: str, tenant_id: str) -> str:
+    '''
+    Retrieve token for the app registered in Azure & PowerBI Service.
     
+    Parameters:
+        username (str): for Azure & PowerBI account
+        password (str): for Azure & PowerBI account
+        client_id (str): Azure App Registration (client) ID
+        tenant_id (str): Azure App Registration directory (tenant) ID
     
-    app = msal.PublicClientApplication(client_id, authority=authority_url)
-    result = app.acquire_token_by_username_password(username=username,password=password,scopes=scope)
-    access_token = result['access_token']
+    Returns:
+        access_token (str): token for accessing PBI Service API
         
-    return access_token
+    '''
+    return get_app_client(username, password, client_id, tenant_id).get_token()
     
-def download_content_df(access_token: str, url_extension = 'groups') -> pd.DataFrame:
+def download_content_df(client: PowerBIClient, url_extension = 'groups') -> pd.DataFrame:
     '''
     Downloading specific entity data from PBI service.
     
     Parameters:
-        access_token (str): token allowing connection to PBI Service API
+        client (PowerBIClient): client allowing connection to PBI Service API
         url_extension (str): specification which entity download
     
     Returns:
         content_df (pd.DataFrame): downloaded data
     '''
     
-    url_groups = 'https://api.powerbi.com/v1.0/myorg/' + url_extension
-    header = {'Content-Type':'application/json','Authorization': f'Bearer {access_token}'}
-    
-    api_out = requests.get(url=url_groups, headers=header)
-    content_df = pd.DataFrame(api_out.json()['value'])
+    api_out = client.get_json(url_extension)
+    content_df = pd.DataFrame(api_out.get('value', []))
     content_df = content_df.rename(columns = {'objectId': 'id'})
     
     return content_df
 
-def download_specific_content_df(url_base:str, resources_ids: pd.Series, content_type: str, token: str, data_category: str) -> pd.DataFrame:
+def fetch_concurrently(func, args_list: list, max_workers: int = MAX_WORKERS) -> list:
+    '''
+    Call the function for each tuple of arguments using bounded pool of threads.
+    
+    Parameters:
+        func (callable): function to call (for example download_content_df)
+        args_list (list): collection of argument tuples, one tuple per call
+        max_workers (int): maximal number of calls running at the same time
+    
+    Returns:
+        results (list): results of the calls, in the same order as args_list
+    '''
+    if max_workers <= 1 or len(args_list) <= 1:
+        return [func(*args) for args in args_list]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(args_list))) as executor:
+        futures = [executor.submit(func, *args) for args in args_list]
+        return [future.result() for future in futures]
+
+def download_specific_content_df(url_base:str, resources_ids: pd.Series, content_type: str, client: PowerBIClient, data_category: str,
+                                 max_workers: int = MAX_WORKERS) -> pd.DataFrame:
     '''
     Having list of resources of the entity (for example dataflows within workspace), iterate over the resources
     to retrieve each resource specific information (in this case - datasources) and concatenate them into one dataframe.
@@ -57,49 +116,375 @@ def download_specific_content_df(url_base:str, resources_ids: pd.Series, content
         url_base (str): first part of url pointing on the entity
         resources_ids (pd.Series): collection of resources to iterate on (part of url)
         content_type (str): category of entities to iterate on (part of url), it may be tiles or datasources
-        token (str): access token
+        client (PowerBIClient): client allowing connection to PBI Service API
         data_category (str): datasource category (dataflows, datasets, dashboards)
+        max_workers (int): maximal number of calls running at the same time
     
     Returns:
         merged_df (pd.DataFrame): downloaded and merged data
     '''
-    
-    merged_df = pd.DataFrame()
-    for resource_id in resources_ids:
-        url_base_ext = url_base + f'/{resource_id}/{content_type}'
-        content_spec = download_content_df(token, url_base_ext)
+    resources_ids = list(resources_ids)
+    urls = [(client, url_base + f'/{resource_id}/{content_type}') for resource_id in resources_ids]
+    contents = fetch_concurrently(download_content_df, urls, max_workers)
+
+    return merge_specific_content(contents, resources_ids, data_category)
+
+def merge_specific_content(contents: list, resources_ids: list, data_category: str) -> pd.DataFrame:
+    '''
+    Mark each downloaded dataframe with id of its parent resource and concatenate them into one dataframe.
+    '''
+    for content_spec, resource_id in zip(contents, resources_ids):
         content_spec[data_category+'Id'] = resource_id
-        merged_df = merged_df.append(content_spec)
-    
-    return merged_df
 
-def retrieve_data_set_or_flow_sources(data_dict: dict, data_type: str, data_params: tuple) -> pd.DataFrame:
+    if not contents:
+        return pd.DataFrame()
+    return pd.concat(contents)
+
+class FetchPlan:
     '''
-    Extract datasources (flows or sets) dataframe from dictionary and transform into draw.io-digestible format.
-    
+    Plan of REST calls downloading workspaces, made in parallel rounds. The first round lists users of every workspace -
+    it is the cheapest call and workspaces without users are empty (or hold only usage-monitoring content), so they are
+    dropped before anything else is downloaded. The second round lists the other selected categories of the remaining
+    workspaces and the last one makes the calls of FETCH_STEPS, only for selected steps and non-empty lists
+    (no tiles without dashboards, no datasources without dataflows or datasets, ...).
+    Calls the plan did not make, compared with downloading all categories of all workspaces, are counted in saved_calls
+    (children of lists which were not downloaded are not known, so they are not counted).
+
+    Parameters:
+        categories (list): FETCH_CATEGORIES to download, all of them when missing or empty
+    '''
+
+    def __init__(self, categories: list = None):
+        unknown = set(categories or []) - set(FETCH_CATEGORIES)
+        if unknown:
+            raise ValueError(f"Unknown categories {sorted(unknown)}, use some of {FETCH_CATEGORIES}")
+        self.categories = [cat for cat in FETCH_CATEGORIES if not categories or cat in categories]
+        self.calls = 0
+        self.saved_calls = 0
+        self.dropped_workspaces = 0
+
+    def _fetch(self, client: PowerBIClient, urls: list, max_workers: int) -> list:
+        self.calls += len(urls)
+        return fetch_concurrently(download_content_df, [(client, url) for url in urls], max_workers)
+
+    def execute(self, client: PowerBIClient, workspace_ids: list, max_workers: int = MAX_WORKERS) -> list:
+        '''
+        Download the workspaces following the plan.
+
+        Returns:
+            results (list): (data_dict, missing_cat) pair for each workspace, in the same order as workspace_ids
+        '''
+        results = {workspace_id: ({}, []) for workspace_id in workspace_ids}
+        listed = [cat for cat in CATEGORIES if cat != 'users']
+
+        # first round - users of every workspace, empty workspaces are dropped
+        valid = []
+        for workspace_id, users in zip(workspace_ids, self._fetch(client, [f'groups/{workspace_id}/users' for workspace_id in workspace_ids],
+                                                                  max_workers)):
+            data_dict, missing_cat = results[workspace_id]
+            if users.empty:
+                missing_cat.append('users')
+            else:
+                data_dict['users'] = users
+            if 'identifier' in users.columns:
+                valid.append(workspace_id)
+                self.saved_calls += len([cat for cat in listed if cat not in self.categories])
+            else:
+                missing_cat += listed
+                self.saved_calls += len(listed)
+                self.dropped_workspaces += 1
+
+        # second round - other selected category lists of the remaining workspaces
+        cat_jobs = [(workspace_id, cat) for workspace_id in valid for cat in listed if cat in self.categories]
+        contents = self._fetch(client, [f'groups/{workspace_id}/{cat}' for workspace_id, cat in cat_jobs], max_workers)
+        for workspace_id in valid:
+            results[workspace_id][1].extend(cat for cat in listed if cat not in self.categories)
+
+        # child jobs are tuples of (workspace id, category, data_dict key, urls, resources ids - None for one call per workspace)
+        child_jobs = []
+        for (workspace_id, cat), content in zip(cat_jobs, contents):
+            data_dict, missing_cat = results[workspace_id]
+            # if category is missing, note it and continue to next
+            if content.empty:
+                missing_cat.append(cat)
+                continue
+            data_dict[cat] = content
+
+            # some entities have child entities, which has to be extracted too
+            for key, parent_cat, url, step_cat in FETCH_STEPS:
+                if parent_cat != cat:
+                    continue
+                resources_ids = list(content['id']) if '{id}' in url else None
+                if step_cat not in self.categories:
+                    self.saved_calls += 1 if resources_ids is None else len(resources_ids)
+                elif resources_ids is None:
+                    child_jobs.append((workspace_id, cat, key, [f'groups/{workspace_id}/{url}'], None))
+                else:
+                    child_jobs.append((workspace_id, cat, key, [f'groups/{workspace_id}/' + url.format(id = resource_id)
+                                                                for resource_id in resources_ids], resources_ids))
+
+        # last round - child entities of all workspaces
+        child_contents = iter(self._fetch(client, [url for _, _, _, urls, _ in child_jobs for url in urls], max_workers))
+        for workspace_id, cat, key, urls, resources_ids in child_jobs:
+            data_dict = results[workspace_id][0]
+            if resources_ids is None:
+                data_dict[key] = next(child_contents)
+            else:
+                data_dict[key] = merge_specific_content([next(child_contents) for _ in resources_ids], resources_ids, cat)
+
+        return [results[workspace_id] for workspace_id in workspace_ids]
+
+    def as_dict(self) -> dict:
+        return {'categories': self.categories, 'calls': self.calls, 'saved_calls': self.saved_calls,
+                'dropped_workspaces': self.dropped_workspaces}
+
+def download_workspaces_data(client: PowerBIClient, categories: list, workspace_ids: list, max_workers: int = MAX_WORKERS) -> list:
+    '''
+    Download selected entity categories of many workspaces following FetchPlan. Calls, saved calls and dropped empty
+    workspaces are counted in metrics of the client.
     
     Parameters:
-        data_dict (dict): dictionary with key-dataframe pairs
-        datatype (str): type of entity (dataflows or datasets)
-        data_params (tuple): collection of workspace id and name.
+        client (PowerBIClient): client allowing connection to PBI Service API
+        categories (list): FETCH_CATEGORIES to download (all of them when empty)
+        workspace_ids (list): collection of workspace ids
+        max_workers (int): maximal number of calls running at the same time
     
     Returns:
-        df (pd.DataFrame): transformed datasources dataframe.
+        results (list): (data_dict, missing_cat) pair for each workspace, in the same order as workspace_ids
     '''
-    
-    df = data_dict[data_type + '_datasources']
-    
-    if not df.empty:
-        df = df.loc[:,['datasourceType', data_type + 'Id','connectionDetails']] #
-        df['connectionDetails'] = df['connectionDetails'].astype(str)
-        df = df.rename(columns = {'connectionDetails': 'id',
-                                  'datasourceType': 'name', 
-                                  data_type + 'Id': 'parent'}) 
-        df = df.groupby(['id','name'])['parent'].apply(join_strings).reset_index()
-        df['type'] = data_type + '_datasources'
-        return df
+    plan = FetchPlan(categories)
+    results = plan.execute(client, workspace_ids, max_workers)
+    client.metrics.count('planned_calls', plan.calls)
+    client.metrics.count('saved_calls', plan.saved_calls)
+    client.metrics.count('workspaces_dropped', plan.dropped_workspaces)
+    return results
+
+def download_all_data(client: PowerBIClient, categories:list, workspace_id: str, max_workers: int = MAX_WORKERS) -> dict:
+    '''
+    Iterating over all entity categories and saving the result into one dictionary (key:dataframe).
+    '''
+    return download_workspaces_data(client, categories, [workspace_id], max_workers)[0]
+
+def list_workspaces(client: PowerBIClient, ws_names: list, backend: str = 'rest') -> pd.DataFrame:
+    '''
+    Download list of workspaces and select the ones defined by name (all workspaces when the list is empty).
+    Backend 'scanner' lists all workspaces of the tenant with admin API.
+    '''
+    if backend == 'scanner':
+        return select_groups(list_admin_workspaces(client), ws_names)
+    elif backend == 'rest':
+        return select_groups(download_content_df(client, 'groups'), ws_names)
+    else:
+        raise ValueError(f"Unknown backend '{backend}', use 'rest' or 'scanner'")
+
+def download_workspaces(client: PowerBIClient, workspace_ids: list, max_workers: int = MAX_WORKERS, backend: str = 'rest',
+                        categories: list = None) -> list:
+    '''
+    Download entity categories (FETCH_CATEGORIES, all when missing) of the workspaces either workspace by workspace
+    with standard API (backend 'rest'), or in bulk with admin workspace scans (backend 'scanner', requires PBI Service admin rights).
+    '''
+    categories = categories or FETCH_CATEGORIES
+    if backend == 'scanner':
+        return download_scanner_data(client, [cat for cat in CATEGORIES if cat in categories or cat == 'users'], workspace_ids, max_workers)
+    elif backend == 'rest':
+        return download_workspaces_data(client, categories, workspace_ids, max_workers)
     else:
-        return None
+        raise ValueError(f"Unknown backend '{backend}', use 'rest' or 'scanner'")
+
+def execute_load_graph(client: PowerBIClient, ws_names: list, max_workers: int = MAX_WORKERS, backend: str = 'rest',
+                       categories: list = None) -> LineageGraph:
+    '''
+    Download data of the workspaces and build lineage graph of them (with selected FETCH_CATEGORIES only, all when missing).
+    Stages are timed in metrics of the client.
+    '''
+    with client.metrics.stage('download'):
+        selected_groups = list_workspaces(client, ws_names, backend)
+        workspaces_data = download_workspaces(client, list(selected_groups['id']), max_workers, backend, categories)
+
+    return build_lineage_graph(selected_groups, workspaces_data, client.metrics, categories)
+
+def execute_load_transform(client: PowerBIClient, ws_names: list, max_workers: int = MAX_WORKERS, backend: str = 'rest',
+                           categories: list = None) -> pd.DataFrame:
+    '''
+    Main function for creating CSV digestible for draw.io. 
+    It performs data download, transformation and utilizes many previously defined functions.
+    '''
+    return execute_load_graph(client, ws_names, max_workers, backend, categories).to_frame()
+
+def concat_workspaces_data(workspace_ids: list, workspaces_data: list) -> dict:
+    '''
+    Build one dataframe per data_dict key for all workspaces at once, each row marked with its workspace id.
+
+    Parameters:
+        workspace_ids (list): collection of workspace ids
+        workspaces_data (list): (data_dict, missing_cat) pair for each workspace, in the same order as workspace_ids
+
+    Returns:
+        tenant_dict (dict): dictionary with key-dataframe pairs, dataframes have additional 'workspace' column
+    '''
+    frames = {}
+    for workspace_id, (data_dict, _) in zip(workspace_ids, workspaces_data):
+        for key, df in data_dict.items():
+            if df is not None and not df.empty:
+                frames.setdefault(key, []).append(df.assign(workspace = workspace_id))
+
+    return {key: pd.concat(dfs, ignore_index = True, sort = False) for key, dfs in frames.items()}
+
+def build_lineage_graph(selected_groups: pd.DataFrame, workspaces_data: list, metrics: RunMetrics = None,
+                        categories: list = None) -> LineageGraph:
+    '''
+    Build lineage graph of the downloaded workspaces. Every category is read once for all workspaces together.
+
+    Parameters:
+        selected_groups (pd.DataFrame): workspaces with id and name columns
+        workspaces_data (list): (data_dict, missing_cat) pair for each workspace, in the same order as selected_groups
+        metrics (RunMetrics): instrumentation of the run, every part of the build is timed as a stage
+        categories (list): FETCH_CATEGORIES put into the graph, all when missing
+
+    Returns:
+        graph (LineageGraph): graph with workspaces, users, dataflows, datasets, reports, dashboards and datasources
+    '''
+    graph = LineageGraph()
+    metrics = metrics or RunMetrics()
+
+    # if workspace is empty (has only usage-monitoring datasets and reports), skip it
+    valid = [('identifier' in data_dict.get('users', pd.DataFrame()).columns) for data_dict, _ in workspaces_data]
+    groups = selected_groups[valid]
+    if groups.empty:
+        return graph
+    with metrics.stage('prepare'):
+        tenant_dict = concat_workspaces_data(list(groups['id']), [data for data, is_valid in zip(workspaces_data, valid) if is_valid])
+        # users are downloaded always to recognize empty workspaces, but like other categories they are put into the graph only when selected
+        selected = set(categories or FETCH_CATEGORIES)
+        step_categories = {key: step_cat for key, _, _, step_cat in FETCH_STEPS}
+        tenant_dict = {key: df for key, df in tenant_dict.items() if step_categories.get(key, key) in selected}
+    empty = pd.DataFrame()
+
+    with metrics.stage('users'):
+        ''' WORKSPACES '''
+        for workspace_id, workspace_name in zip(groups['id'], groups['name']):
+            graph.add_node(workspace_id, workspace_name, 'workspaces', workspace_id)
+
+        ''' USERS '''
+        # workspace is connected with all its users, every user is one node of the tenant and the access right
+        # (Admin, Member, Contributor, Viewer) is the label of the edge
+        users = tenant_dict.get('users', empty)
+        for workspace_id, access_right, identifier, name in zip(get_column(users, 'workspace'), get_column(users, 'groupUserAccessRight'),
+                                                                get_column(users, 'identifier'), get_column(users, 'displayName')):
+            if not (is_id(access_right) and is_id(identifier)) or '@' not in identifier:
+                continue
+            user = graph.add_node(canonical_identifier(identifier), name, 'users', workspace_id)
+            graph.add_edge(graph.intern(workspace_id), user, RELATIVE, access_right)
+
+    with metrics.stage('dataflows'):
+        ''' DATAFLOWS '''
+        dataflows = tenant_dict.get('dataflows', empty)
+        for workspace_id, dataflow_id, name in zip(get_column(dataflows, 'workspace'), get_column(dataflows, 'id'), get_column(dataflows, 'name')):
+            graph.add_edge(graph.add_node(dataflow_id, name, 'dataflows', workspace_id), graph.intern(workspace_id), PARENT)
+
+    with metrics.stage('datasets'):
+        ''' DATASETS '''
+        # datasets loaded from dataflows are placed in the dataflows' workspaces
+        upstream = {}
+        datasets_upstream = tenant_dict.get('datasets_upstreamdataflows', empty)
+        for workspace_id, dataset_id, dataflow_id, dataflow_workspace in zip(get_column(datasets_upstream, 'workspace'),
+                                                                             get_column(datasets_upstream, 'datasetObjectId'),
+                                                                             get_column(datasets_upstream, 'dataflowObjectId'),
+                                                                             get_column(datasets_upstream, 'workspaceObjectId')):
+            upstream.setdefault((workspace_id, dataset_id), []).append((dataflow_id, dataflow_workspace))
+
+        datasets = tenant_dict.get('datasets', empty)
+        for workspace_id, dataset_id, name, configured_by in zip(get_column(datasets, 'workspace'), get_column(datasets, 'id'),
+                                                                 get_column(datasets, 'name'), get_column(datasets, 'configuredBy')):
+            dataset = graph.add_node(dataset_id, name, 'datasets', workspace_id)
+            links = upstream.get((workspace_id, dataset_id), [])
+            for parent_id in [dataflow_workspace for _, dataflow_workspace in links if is_id(dataflow_workspace)] or [workspace_id]:
+                graph.add_edge(dataset, graph.intern(parent_id), PARENT)
+            if is_id(configured_by):
+                graph.add_edge(dataset, graph.intern(canonical_identifier(configured_by)), RELATIVE)
+            for dataflow_id, _ in links:
+                if is_id(dataflow_id):
+                    graph.add_edge(dataset, graph.intern(dataflow_id), UPSTREAM)
+
+    with metrics.stage('datasources'):
+        ''' DATAFLOWS & DATASETS DATASOURCES '''
+        for data_type in ['dataflows', 'datasets']:
+            add_datasources(graph, tenant_dict.get(data_type + '_datasources', empty), data_type)
+
+    with metrics.stage('reports'):
+        ''' REPORTS '''
+        reports = tenant_dict.get('reports', empty)
+        for workspace_id, report_id, name, dataset_id in zip(get_column(reports, 'workspace'), get_column(reports, 'id'),
+                                                             get_column(reports, 'name'), get_column(reports, 'datasetId')):
+            report = graph.add_node(report_id, name, 'reports', workspace_id)
+            graph.add_edge(report, graph.intern(workspace_id), PARENT)
+            if is_id(dataset_id):
+                graph.add_edge(report, graph.intern(dataset_id), PARENT)
+
+    with metrics.stage('dashboards'):
+        ''' DASHBOARDS '''
+        # dashboards are connected with reports and datasets of their tiles, or with the workspace when they have no tiles
+        tiles = {}
+        dashboards_tiles = tenant_dict.get('dashboards_datasources', empty)
+        for workspace_id, dashboard_id, report_id, dataset_id in zip(get_column(dashboards_tiles, 'workspace'),
+                                                                     get_column(dashboards_tiles, 'dashboardsId'),
+                                                                     get_column(dashboards_tiles, 'reportId'),
+                                                                     get_column(dashboards_tiles, 'datasetId')):
+            reports_ids, datasets_ids = tiles.setdefault((workspace_id, dashboard_id), ([], []))
+            if is_id(report_id):
+                reports_ids.append(report_id)
+            if is_id(dataset_id):
+                datasets_ids.append(dataset_id)
+
+        dashboards = tenant_dict.get('dashboards', empty)
+        for workspace_id, dashboard_id, name in zip(get_column(dashboards, 'workspace'), get_column(dashboards, 'id'),
+                                                    get_column(dashboards, 'displayName')):
+            dashboard = graph.add_node(dashboard_id, name, 'dashboards', workspace_id)
+            reports_ids, datasets_ids = tiles.get((workspace_id, dashboard_id), ([], []))
+            for parent_id in reports_ids + datasets_ids or [workspace_id]:
+                graph.add_edge(dashboard, graph.intern(parent_id), PARENT)
+
+    return graph
+
+def add_datasources(graph: LineageGraph, df: pd.DataFrame, data_type: str):
+    '''
+    Add datasources (flows or sets) to the graph, connected with dataflows or datasets using them.
+    Datasources are identified by hash of their canonical connection details (datasource_entity), so every source
+    is one node of the tenant. The same datasource used by dataflows and by datasets becomes two nodes, one of each type.
+    '''
+    node_type = data_type + '_datasources'
+    for workspace_id, datasource_type, resource_id, details in zip(get_column(df, 'workspace'), get_column(df, 'datasourceType'),
+                                                                   get_column(df, data_type + 'Id'), get_column(df, 'connectionDetails')):
+        if details is None or isinstance(details, float):
+            continue
+        source_id, name = datasource_entity(datasource_type, details)
+        source = graph.add_node(source_id, name, node_type, workspace_id, key = node_type + ':' + source_id)
+        graph.add_edge(source, graph.intern(resource_id), PARENT)
+
+def transform_workspaces_data(selected_groups: pd.DataFrame, workspaces_data: list) -> pd.DataFrame:
+    '''
+    Transform downloaded data of the workspaces into CSV digestible for draw.io.
+
+    Parameters:
+        selected_groups (pd.DataFrame): workspaces with id and name columns
+        workspaces_data (list): (data_dict, missing_cat) pair for each workspace, in the same order as selected_groups
+
+    Returns:
+        output_all (pd.DataFrame): draw.io input with one row per resource
+    '''
+    return build_lineage_graph(selected_groups, workspaces_data).to_frame()
+
+def get_column(df: pd.DataFrame, column: str):
+    '''
+    Return values of the column, or None values when the dataframe doesn't have such column.
+    '''
+    return df[column].values if column in df.columns else [None] * len(df)
+
+def is_id(value) -> bool:
+    '''
+    Check if the value is non-empty id (missing values come from pandas as NaN floats).
+    '''
+    return isinstance(value, str) and value != ''
         
 def select_groups(df, groups: list) -> pd.DataFrame:
     '''
@@ -111,9 +496,3 @@ def select_groups(df, groups: list) -> pd.DataFrame:
         df = df[df['name'].isin(groups)][['name', 'id']]
     
     return df
-    
-def join_strings(collection):
-    '''
-    Create string sequence of unique objects from collection.
-    '''
-    return ','.join(set(collection))
\ No newline at end of file
@@ -0,0 +1,81 @@
+import ast
+import json
+import hashlib
+from functools import lru_cache
+
+# connection details compared case-insensitively (host, database, account names, urls and file paths)
+CASE_INSENSITIVE_KEYS = {'server', 'database', 'domain', 'account', 'url', 'path', 'sharepointsiteurl'}
+# connection details listed first in datasource names, the rest follows in key order
+NAME_KEYS = ['server', 'database', 'url', 'path']
+# length of datasource ids (hex digits of SHA-256 of the canonical connection)
+DATASOURCE_ID_LENGTH = 16
+
+def canonical_server(server: str) -> str:
+    '''
+    SQL server name without protocol prefix and default port, so "tcp:Sql1.contoso.com,1433" and "sql1.contoso.com" match.
+    '''
+    server = server.strip().lower()
+    if server.startswith('tcp:'):
+        server = server[4:]
+    for suffix in (',1433', ':1433'):
+        if server.endswith(suffix):
+            server = server[:-len(suffix)]
+    return server.rstrip('.')
+
+def canonical_connection(details) -> dict:
+    '''
+    Connection details (dictionary, its JSON or Python repr) with lowercase keys sorted, values stripped,
+    case-insensitive values lowercased and empty values dropped.
+    '''
+    if isinstance(details, str):
+        try:
+            details = json.loads(details)
+        except ValueError:
+            try:
+                details = ast.literal_eval(details)
+            except (ValueError, SyntaxError):
+                details = {'value': details}
+    if not isinstance(details, dict):
+        details = {'value': str(details)}
+
+    canonical = {}
+    for key, value in details.items():
+        if value is None or value == '':
+            continue
+        key = str(key).lower()
+        value = str(value).strip() if not isinstance(value, (dict, list)) else json.dumps(value, sort_keys=True)
+        if key == 'server':
+            value = canonical_server(value)
+        elif key in CASE_INSENSITIVE_KEYS:
+            value = value.lower().rstrip('/')
+        canonical[key] = value
+    return dict(sorted(canonical.items()))
+
+# interned entities of distinct connections (per process)
+@lru_cache(maxsize=2 ** 16)
+def _datasource_entity(datasource_type: str, connection: str) -> tuple:
+    digest = hashlib.sha256(f'{datasource_type.lower()}|{connection}'.encode('utf-8')).hexdigest()
+    details = json.loads(connection)
+    values = [details[key] for key in NAME_KEYS if key in details] + [value for key, value in details.items() if key not in NAME_KEYS]
+    name = '/'.join(values)
+    if datasource_type:
+        name = f'{datasource_type}: {name}' if name else datasource_type
+    return digest[:DATASOURCE_ID_LENGTH], name
+
+def datasource_entity(datasource_type, details) -> tuple:
+    '''
+    Stable short id and readable name of a datasource. The id is a hash of the datasource type and canonical connection details,
+    so the same source gets the same id in every workspace and run, whatever the order or spelling of its details.
+
+    Returns:
+        id (str): DATASOURCE_ID_LENGTH hex digits
+        name (str): type and connection details, for example 'Sql: sql1.contoso.com/sales'
+    '''
+    datasource_type = datasource_type if isinstance(datasource_type, str) else ''
+    return _datasource_entity(datasource_type, json.dumps(canonical_connection(details)))
+
+def canonical_identifier(identifier: str) -> str:
+    '''
+    User identity shared by all workspaces - identifier (email or principal id) stripped and lowercased.
+    '''
+    return identifier.strip().lower()
@@ -0,0 +1,202 @@
+import os
+import json
+import hashlib
+import datetime
+import pandas as pd
+import requests
+
+from Shared.pbi_client import PowerBIClient
+from Shared.data_load_transform import CATEGORIES, FETCH_CATEGORIES, MAX_WORKERS, list_workspaces, download_workspaces, \
+                                       download_content_df, fetch_concurrently, build_lineage_graph
+from Shared.lineage_graph import LineageGraph
+
+STATE_FILE = 'crawl_state.json'
+
+class FolderStore:
+    '''
+    Local folder keeping crawl state and per-workspace results. Any object with the same read/write methods
+    (for example DataLakeFolderStore) can be used instead.
+    '''
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def read(self, file_name: str) -> bytes:
+        '''
+        Return file content or None when the file does not exist.
+        '''
+        try:
+            with open(os.path.join(self.folder, file_name), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, file_name: str, data: bytes):
+        with open(os.path.join(self.folder, file_name), 'wb') as file:
+            file.write(data)
+
+def serialize_workspace_data(data_dict: dict, missing_cat: list) -> bytes:
+    '''
+    Convert (data_dict, missing_cat) pair of one workspace into JSON bytes.
+    '''
+    data = {key: json.loads(df.to_json(orient = 'split', index = False)) for key, df in data_dict.items()}
+    return json.dumps({'missing_cat': missing_cat, 'data': data}).encode()
+
+def deserialize_workspace_data(content: bytes) -> tuple:
+    '''
+    Convert JSON bytes created by serialize_workspace_data back into (data_dict, missing_cat) pair.
+    '''
+    content = json.loads(content)
+    data_dict = {key: pd.DataFrame(df['data'], columns = df['columns']) for key, df in content['data'].items()}
+    return data_dict, content['missing_cat']
+
+def workspace_fingerprint(listings: dict) -> str:
+    '''
+    Hash of top-level category lists of the workspace (category:dataframe dictionary).
+    '''
+    digest = hashlib.sha256()
+    for cat in CATEGORIES:
+        df = listings.get(cat)
+        if df is not None and not df.empty:
+            digest.update(cat.encode())
+            digest.update(df.sort_index(axis = 1).to_json(orient = 'records').encode())
+    return digest.hexdigest()
+
+def get_modified_workspaces(client: PowerBIClient, modified_since: str) -> set:
+    '''
+    Ask admin API which workspaces changed since given time (ISO format, UTC).
+    Returns None, when the API is not available (for example account without admin rights).
+    '''
+    since = datetime.datetime.fromisoformat(modified_since).strftime('%Y-%m-%dT%H:%M:%S.0000000Z')
+    try:
+        modified = client.get_json(f'admin/workspaces/modified?modifiedSince={since}&excludePersonalWorkspaces=True')
+    except requests.HTTPError:
+        return None
+    if isinstance(modified, dict):
+        modified = modified.get('value', [])
+    return {workspace['id'] for workspace in modified}
+
+def download_listings_fingerprints(client: PowerBIClient, workspace_ids: list, max_workers: int = MAX_WORKERS) -> dict:
+    '''
+    Download top-level category lists of the workspaces (no child entities) and return workspace_id:fingerprint dictionary.
+    '''
+    jobs = [(workspace_id, cat) for workspace_id in workspace_ids for cat in CATEGORIES]
+    contents = fetch_concurrently(download_content_df, [(client, f'groups/{workspace_id}/{cat}') for workspace_id, cat in jobs],
+                                  max_workers)
+    listings = {workspace_id: {} for workspace_id in workspace_ids}
+    for (workspace_id, cat), content in zip(jobs, contents):
+        listings[workspace_id][cat] = content
+    return {workspace_id: workspace_fingerprint(listing) for workspace_id, listing in listings.items()}
+
+def read_crawl_state(store, categories: list = None) -> tuple:
+    '''
+    Crawl state saved in the store by the previous run and FETCH_CATEGORIES selected by this one.
+    Results stored with other categories selected are not reused, so their state is dropped
+    (runs made before the selection existed stored all of them).
+
+    Returns:
+        state (dict): {"last_run", "fingerprints", "categories", "crawled", "reused"}, empty when there is nothing to reuse
+        selected (list): categories selected by this run
+    '''
+    state = json.loads(store.read(STATE_FILE) or b'{}')
+    selected = [cat for cat in FETCH_CATEGORIES if not categories or cat in categories]
+    if state.get('categories', FETCH_CATEGORIES) != selected:
+        state = {}
+    return state, selected
+
+def write_crawl_state(store, run_start: str, fingerprints: dict, selected: list, crawled: int, reused: int):
+    '''
+    Save crawl state read by the next run (see read_crawl_state).
+    '''
+    store.write(STATE_FILE, json.dumps({'last_run': run_start, 'fingerprints': fingerprints, 'categories': selected,
+                                        'crawled': crawled, 'reused': reused}).encode())
+
+def crawl_changed_workspaces(client: PowerBIClient, workspace_ids: list, store, state: dict, modified: set = None,
+                             max_workers: int = MAX_WORKERS, backend: str = 'rest', categories: list = None) -> tuple:
+    '''
+    Download workspaces changed since the run which saved the state (or missing in the store) and save their results
+    in the store, the other workspaces are reused from the store.
+
+    Parameters:
+        client (PowerBIClient): client allowing connection to PBI Service API
+        workspace_ids (list): ids of the workspaces
+        store (FolderStore or DataLakeFolderStore): place to keep per-workspace results
+        state (dict): crawl state from read_crawl_state
+        modified (set): ids of workspaces changed since the previous run (get_modified_workspaces), when None
+                        fingerprints of top-level category lists are compared instead
+        max_workers (int): maximal number of calls running at the same time
+        backend (str): 'rest' or 'scanner', see execute_load_transform
+        categories (list): FETCH_CATEGORIES to download, all when missing
+
+    Returns:
+        fresh (dict): workspace_id:(data_dict, missing_cat) of downloaded workspaces
+        cached (dict): workspace_id:stored results (bytes, None when missing) of all the workspaces
+        fingerprints (dict): workspace_id:fingerprint of all the workspaces
+    '''
+    previous = state.get('fingerprints', {})
+    cached = {workspace_id: store.read(f'{workspace_id}.json') for workspace_id in workspace_ids}
+    current = {}
+    if modified is not None:
+        to_crawl = [workspace_id for workspace_id in workspace_ids if cached[workspace_id] is None or workspace_id in modified]
+    else:
+        current = download_listings_fingerprints(client, workspace_ids, max_workers)
+        to_crawl = [workspace_id for workspace_id in workspace_ids
+                    if cached[workspace_id] is None or previous.get(workspace_id) != current[workspace_id]]
+
+    fresh = dict(zip(to_crawl, download_workspaces(client, to_crawl, max_workers, backend, categories)))
+    fingerprints = {workspace_id: previous.get(workspace_id) for workspace_id in workspace_ids}
+    for workspace_id, (data_dict, missing_cat) in fresh.items():
+        store.write(f'{workspace_id}.json', serialize_workspace_data(data_dict, missing_cat))
+        # fingerprint of the listings compared above - crawled data may not hold all of them (empty workspaces are dropped
+        # after listing users, scanner results have other columns), so its own fingerprint would never match the next run
+        fingerprints[workspace_id] = current.get(workspace_id) or workspace_fingerprint(data_dict)
+    return fresh, cached, fingerprints
+
+def execute_incremental_load_transform(client: PowerBIClient, ws_names: list, store, max_workers: int = MAX_WORKERS,
+                                       backend: str = 'rest', categories: list = None) -> pd.DataFrame:
+    '''
+    Incremental version of execute_load_transform, see execute_incremental_load_graph.
+    '''
+    return execute_incremental_load_graph(client, ws_names, store, max_workers, backend, categories).to_frame()
+
+def execute_incremental_load_graph(client: PowerBIClient, ws_names: list, store, max_workers: int = MAX_WORKERS,
+                                   backend: str = 'rest', categories: list = None) -> LineageGraph:
+    '''
+    Incremental version of execute_load_graph. Results of every workspace are kept in the store and only workspaces
+    changed since the previous run are downloaded again. Changes are detected with admin 'workspaces/modified' API,
+    when it is not available, fingerprints of top-level category lists are compared instead.
+    Stored results hold only the categories selected by the run which saved them, so all workspaces are downloaded again
+    when the selection changes.
+
+    Parameters:
+        client (PowerBIClient): client allowing connection to PBI Service API
+        ws_names (list): collection of workspace names (all workspaces when the list is empty)
+        store (FolderStore or DataLakeFolderStore): place to keep crawl state and per-workspace results
+        max_workers (int): maximal number of calls running at the same time
+        backend (str): 'rest' or 'scanner', see execute_load_transform
+        categories (list): FETCH_CATEGORIES to download and put into the graph, all when missing
+
+    Returns:
+        graph (LineageGraph): lineage graph built from fresh and stored workspace results
+    '''
+    # replayed responses are not changes since the previous run, crawl state saved with the replay time would hide them
+    if client.cache is not None and client.cache.replay:
+        raise ValueError('Incremental crawl cannot be replayed from cached responses')
+    run_start = datetime.datetime.utcnow().isoformat()
+    with client.metrics.stage('download'):
+        state, selected = read_crawl_state(store, categories)
+        selected_groups = list_workspaces(client, ws_names, backend)
+        workspace_ids = list(selected_groups['id'])
+        modified = get_modified_workspaces(client, state['last_run']) if 'last_run' in state else None
+        fresh, cached, fingerprints = crawl_changed_workspaces(client, workspace_ids, store, state, modified, max_workers, backend,
+                                                               categories)
+
+        write_crawl_state(store, run_start, {**state.get('fingerprints', {}), **fingerprints}, selected, len(fresh),
+                          len(workspace_ids) - len(fresh))
+        client.metrics.count('workspaces_crawled', len(fresh))
+        client.metrics.count('workspaces_reused', len(workspace_ids) - len(fresh))
+
+    workspaces_data = [fresh[workspace_id] if workspace_id in fresh else deserialize_workspace_data(cached[workspace_id])
+                       for workspace_id in workspace_ids]
+    return build_lineage_graph(selected_groups, workspaces_data, client.metrics, categories)
@@ -0,0 +1,141 @@
+from array import array
+import pandas as pd
+
+# edge types - parent (resource -> its container or source), relative (resource -> related user or owner),
+# upstream (dataset -> dataflow it is loaded from)
+PARENT = 0
+RELATIVE = 1
+UPSTREAM = 2
+EDGE_TYPES = ('parent', 'relative', 'upstream')
+
+# access column lists labelled relatives (access rights of workspace users) as "label:id", in the order of relatives
+OUTPUT_COLUMNS = ['id', 'name', 'type', 'parent', 'relatives', 'access']
+
+class Node:
+    '''
+    Resource of the graph (workspace, user, dataflow, dataset, report, dashboard or datasource).
+    Nodes referenced by edges, but not downloaded (for example dataset from other workspace) have type None.
+    '''
+    __slots__ = ('id', 'name', 'type', 'workspace')
+
+    def __init__(self, id: str, name: str = None, type: str = None, workspace: str = None):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.workspace = workspace
+
+    def __repr__(self):
+        return f'Node({self.id!r}, {self.name!r}, {self.type!r})'
+
+class LineageGraph:
+    '''
+    Compact lineage graph. Node ids are interned - every id gets an integer index and edges are kept
+    in three arrays (source index, target index, edge type), in the order they were added.
+    Few edges have a label (access right of a workspace user), labels are kept by edge position in edge_labels.
+    '''
+
+    def __init__(self):
+        self.nodes = []
+        self._index = {}
+        self.edge_src = array('l')
+        self.edge_dst = array('l')
+        self.edge_type = array('b')
+        self.edge_labels = {}
+        self._edge_keys = set()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def intern(self, id: str, key: str = None) -> int:
+        '''
+        Return index of the node, adding node without type when it is unknown.
+        Key differs from id only when one id means different nodes (for example the same datasource used by dataflows and datasets).
+        '''
+        key = id if key is None else key
+        index = self._index.get(key)
+        if index is None:
+            index = len(self.nodes)
+            self._index[key] = index
+            self.nodes.append(Node(id))
+        return index
+
+    def add_node(self, id: str, name: str, type: str, workspace: str = None, key: str = None) -> int:
+        '''
+        Add node (or fill in details of node added earlier as edge target) and return its index.
+        '''
+        index = self.intern(id, key)
+        node = self.nodes[index]
+        if node.type is None:
+            node.name, node.type, node.workspace = name, type, workspace
+        return index
+
+    def add_edge(self, src: int, dst: int, edge_type: int, label: str = None):
+        '''
+        Add edge between nodes of given indexes, repeated edges are skipped (the label of the first one is kept).
+        '''
+        edge_key = (src << 33) | (dst << 2) | edge_type
+        if edge_key not in self._edge_keys:
+            self._edge_keys.add(edge_key)
+            if label is not None:
+                self.edge_labels[len(self.edge_src)] = label
+            self.edge_src.append(src)
+            self.edge_dst.append(dst)
+            self.edge_type.append(edge_type)
+
+    def get(self, id: str, key: str = None) -> Node:
+        index = self._index.get(id if key is None else key)
+        return None if index is None else self.nodes[index]
+
+    def index_of(self, id: str, key: str = None) -> int:
+        return self._index.get(id if key is None else key)
+
+    def edges(self, edge_type: int = None):
+        '''
+        Iterate over (source index, target index, edge type) tuples, optionally only of given type.
+        '''
+        for src, dst, kind in zip(self.edge_src, self.edge_dst, self.edge_type):
+            if edge_type is None or kind == edge_type:
+                yield src, dst, kind
+
+    def typed_nodes(self):
+        '''
+        Iterate over (index, node) pairs of downloaded nodes (skipping edge targets without type).
+        '''
+        for index, node in enumerate(self.nodes):
+            if node.type is not None:
+                yield index, node
+
+    def rows(self):
+        '''
+        Iterate over draw.io CSV rows (OUTPUT_COLUMNS tuples) of downloaded nodes, in the order the nodes were added.
+        Edges are grouped by their source through sorted array of edge positions, so no lists of ids are built per node.
+        '''
+        order = array('l', sorted(range(len(self.edge_src)), key = self.edge_src.__getitem__))
+        position = 0
+        for index, node in enumerate(self.nodes):
+            parent, relative, access = [], [], []
+            while position < len(order) and self.edge_src[order[position]] == index:
+                edge = order[position]
+                target = self.nodes[self.edge_dst[edge]].id
+                (parent if self.edge_type[edge] == PARENT else relative).append(target)
+                if edge in self.edge_labels:
+                    access.append(self.edge_labels[edge] + ':' + target)
+                position += 1
+            if node.type is None:
+                continue
+            # in case drawio has problems with reading special characters, take ids between quotation marks
+            yield ('"' + node.id + '"', node.name, node.type, ','.join(parent) if parent else None,
+                   ','.join(relative) if relative else None, ','.join(access) if access else None)
+
+    def to_frame(self) -> pd.DataFrame:
+        '''
+        Render the graph as draw.io CSV input - one row per node, edges joined into comma-separated parent and relatives columns.
+        '''
+        rows = sorted(self.rows(), key = row_key)
+        return pd.DataFrame(rows, columns = OUTPUT_COLUMNS)
+
+def row_key(row: tuple) -> tuple:
+    '''
+    Order of the output rows - by type, then by id.
+    '''
+    return row[2], row[0]
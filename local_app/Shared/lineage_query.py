@@ -0,0 +1,183 @@
+import io
+import csv
+from collections import deque
+
+from Shared.lineage_graph import LineageGraph, PARENT, UPSTREAM
+
+UPSTREAM_DIRECTION = 'upstream'
+DOWNSTREAM_DIRECTION = 'downstream'
+BOTH_DIRECTIONS = 'both'
+# resources taking part in the lineage, next to the datasources (types ending with "_datasources")
+LINEAGE_TYPES = ('dataflows', 'datasets', 'reports', 'dashboards')
+
+def is_lineage_type(type: str) -> bool:
+    return type in LINEAGE_TYPES or (type or '').endswith('_datasources')
+
+class LineageIndex:
+    '''
+    Impact-analysis index of the lineage. Only dependencies are indexed - report/dashboard on dataset or report,
+    dataset on dataflow, dataflow/dataset on its datasources; workspace membership and users are left out.
+    Forward (provider -> consumers) and reverse (consumer -> providers) adjacency lists are precomputed,
+    so upstream, downstream and k-hop queries are breadth-first searches over small lists.
+
+    Build it with from_graph (after a crawl) or from_rows / from_csv (from a saved snapshot).
+    '''
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self.types = []
+        self._index = {}
+        self.consumers = []
+        self.providers = []
+        # (consumer, provider) pairs indexed so far, adjacency lists stay lists for fast iteration
+        self._dependencies = set()
+        self._closure = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _intern(self, id: str, name: str = None, type: str = None) -> int:
+        index = self._index.get(id)
+        if index is None:
+            index = len(self.ids)
+            self._index[id] = index
+            self.ids.append(id)
+            self.names.append(name)
+            self.types.append(type)
+            self.consumers.append([])
+            self.providers.append([])
+        elif type is not None and self.types[index] is None:
+            self.names[index], self.types[index] = name, type
+        return index
+
+    def _add_dependency(self, consumer: int, provider: int):
+        if consumer != provider and (consumer, provider) not in self._dependencies:
+            self._dependencies.add((consumer, provider))
+            self.providers[consumer].append(provider)
+            self.consumers[provider].append(consumer)
+
+    @classmethod
+    def from_rows(cls, rows) -> 'LineageIndex':
+        '''
+        Build index from snapshot rows - (id, name, type, parent, relatives) tuples with comma-separated parent and relatives.
+        '''
+        index = cls()
+        rows = [(id.strip('"'), name, type, parent, relatives) for id, name, type, parent, relatives in rows]
+        for id, name, type, _, _ in rows:
+            index._intern(id, name, type)
+        for id, _, type, parent, relatives in rows:
+            node = index._index[id]
+            for target in (parent.split(',') if parent else []):
+                # workspaces and parents missing in the snapshot (type unknown) are not dependencies
+                target_index = index._index.get(target)
+                if target_index is None or not is_lineage_type(index.types[target_index]):
+                    continue
+                # datasources point at resources using them, other resources at the resources they are built on
+                if type.endswith('_datasources'):
+                    index._add_dependency(target_index, node)
+                else:
+                    index._add_dependency(node, target_index)
+            # upstream dataflows of datasets are saved among relatives, next to users
+            for target in (relatives.split(',') if relatives else []):
+                target_index = index._index.get(target)
+                if target_index is not None and index.types[target_index] == 'dataflows':
+                    index._add_dependency(node, target_index)
+        return index
+
+    @classmethod
+    def from_csv(cls, file) -> 'LineageIndex':
+        '''
+        Build index from CSV snapshot (binary file object, CP1250 encoded, like drawio_relationships.csv).
+        '''
+        reader = csv.DictReader(io.TextIOWrapper(file, encoding = 'CP1250', newline = ''))
+        return cls.from_rows((row['id'], row['name'], row['type'], row['parent'], row['relatives']) for row in reader)
+
+    @classmethod
+    def from_graph(cls, graph: LineageGraph) -> 'LineageIndex':
+        '''
+        Build index straight from the crawled graph.
+        '''
+        index = cls()
+        for _, node in graph.typed_nodes():
+            index._intern(node.id, node.name, node.type)
+        for src, dst, kind in graph.edges():
+            if kind == PARENT or kind == UPSTREAM:
+                source, target = graph.nodes[src], graph.nodes[dst]
+                # workspaces and nodes only referenced by id (type None, for example not crawled resources) are skipped
+                if not is_lineage_type(target.type):
+                    continue
+                consumer, provider = (target, source) if (source.type or '').endswith('_datasources') else (source, target)
+                index._add_dependency(index._intern(consumer.id), index._intern(provider.id))
+        return index
+
+    def resolve(self, id: str) -> int:
+        '''
+        Index of the resource with given id, KeyError when it is unknown.
+        '''
+        index = self._index.get(id.strip('"'))
+        if index is None:
+            raise KeyError(f'Unknown resource id: {id}')
+        return index
+
+    def find(self, text: str, limit: int = 20) -> list:
+        '''
+        Resources whose name or id contains the text (case insensitive).
+        '''
+        text = text.lower()
+        found = [self.describe(index) for index in range(len(self.ids))
+                 if text in self.ids[index].lower() or (isinstance(self.names[index], str) and text in self.names[index].lower())]
+        return found[:limit]
+
+    def describe(self, index: int, distance: int = None) -> dict:
+        result = {'id': self.ids[index], 'name': self.names[index], 'type': self.types[index]}
+        if distance is not None:
+            result['distance'] = distance
+        return result
+
+    def _neighbours(self, direction: str):
+        if direction == UPSTREAM_DIRECTION:
+            return lambda index: self.providers[index]
+        if direction == DOWNSTREAM_DIRECTION:
+            return lambda index: self.consumers[index]
+        if direction == BOTH_DIRECTIONS:
+            return lambda index: self.providers[index] + self.consumers[index]
+        raise ValueError(f'Unknown direction: {direction}')
+
+    def query(self, id: str, direction: str = DOWNSTREAM_DIRECTION, depth: int = None) -> list:
+        '''
+        Resources reachable from the resource - 'downstream' (what breaks when it changes), 'upstream' (what it depends on)
+        or 'both' (k-hop neighbourhood), up to depth hops (unlimited when None).
+
+        Returns:
+            resources (list): {"id", "name", "type", "distance"} dictionaries, the nearest first
+        '''
+        start = self.resolve(id)
+        if depth is None and direction != BOTH_DIRECTIONS and self._closure is not None:
+            reached = self._closure[direction][start]
+        else:
+            reached = self._reach(start, self._neighbours(direction), depth)
+        return [self.describe(index, distance) for index, distance in reached]
+
+    def _reach(self, start: int, neighbours, depth: int = None) -> list:
+        # breadth-first search, returns (index, distance) pairs sorted by distance
+        distances = {start: 0}
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            if depth is not None and distances[index] >= depth:
+                continue
+            for neighbour in neighbours(index):
+                if neighbour not in distances:
+                    distances[neighbour] = distances[index] + 1
+                    queue.append(neighbour)
+        del distances[start]
+        return sorted(distances.items(), key = lambda item: (item[1], item[0]))
+
+    def precompute_closure(self):
+        '''
+        Cache full upstream and downstream results of every resource, so unlimited-depth queries become list lookups.
+        Memory grows with the number of reachable pairs, use it for small and medium tenants.
+        '''
+        self._closure = {direction: [self._reach(index, self._neighbours(direction)) for index in range(len(self.ids))]
+                         for direction in (UPSTREAM_DIRECTION, DOWNSTREAM_DIRECTION)}
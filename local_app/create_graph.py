@@ -1,187 +1,180 @@
 import os
+import sys
+import json
+import pstats
+import cProfile
 import pandas as pd
 import argparse
 from getpass import getpass
-from Shared.data_load_transform import get_app_token, download_content_df, download_specific_content_df, \
-                                       retrieve_data_set_or_flow_sources, select_groups, join_strings
-from Shared.drawio_spec import html_spec, drawio_spec
+from Shared.data_load_transform import get_app_client, execute_load_graph, MAX_WORKERS, FETCH_CATEGORIES
+from Shared.diagram_sink import DiagramSink
+from Shared.request_policy import RequestPolicy
+from Shared.request_scheduler import RequestScheduler, FileBudgetStore, IDENTITY
+from Shared.incremental_crawl import execute_incremental_load_graph, FolderStore
+from Shared.focused_crawl import execute_focused_load_graph, DEFAULT_HOPS
+from Shared.drawio_xml import write_graph_drawio, MAX_PAGE_NODES
+from Shared.response_cache import ResponseCache
+from Shared.lineage_query import LineageIndex, DOWNSTREAM_DIRECTION, UPSTREAM_DIRECTION, BOTH_DIRECTIONS
+from Shared.run_metrics import RunMetrics
 
 wd = os.getcwd()
 
-def main(user, pwd, client, tenant, ws_names):
+def main(user, pwd, client, tenant, ws_names, max_workers = MAX_WORKERS, policy = None, backend = 'rest', state_folder = None, cache = None,
+         compressed = False, pages = None, max_page_nodes = MAX_PAGE_NODES, api_url = None, profile = False, scheduler = None,
+         focus = None, hops = DEFAULT_HOPS, categories = None):
     '''
     Download data from PBI Service API and prepare relationships dataframe as input for draw.io.
 
     Parameters:
         user, pwd, client, tenant (str): information for using PBI Service API.
         ws_names (list): collection of workspaces we want to create graph on (if list is empty, all available workspaces will be used)
+        max_workers (int): maximal number of PBI Service API calls running at the same time
+        policy (RequestPolicy): timeouts, retries and hedging of PBI Service API calls
+        backend (str): 'rest' to call API for every workspace, 'scanner' to use admin workspace scans
+        state_folder (str): folder for incremental crawl state, when given only workspaces changed since previous run are downloaded
+        cache (ResponseCache): on-disk cache of API responses, in replay mode graph is built from cached responses only
+        compressed (bool): save pages of the .drawio file deflate-compressed
+        pages (str): split .drawio diagram into pages, one per 'workspace' or per connected 'component'
+        max_page_nodes (int): maximal number of resources on one page
+        api_url (str): address of other API than PBI Service (for example local mock), no sign-in happens
+        profile (bool): print metrics of the run - stage timings, per-endpoint latency histograms, request and byte counts,
+                        API time of the slowest workspaces and peak memory - as JSON
+        scheduler (RequestScheduler): rate-limit-aware admission of PBI Service API calls (token buckets per identity and endpoint class)
+        focus (list): seed item ids ("<workspace id>/<item id>" or item id), when given only items within hops from them are downloaded
+        hops (int): how far from the focus items lineage is followed
+        categories (list): categories to download and put into the graph (FETCH_CATEGORIES, all when empty)
 
     Returns:
         drawio_input.csv (file): text file with specification ready to copy-paste into draw.io CSV reader.
         drawio_relationships.csv (file): csv file with raw dataframe of relationships.
+        drawio_graph.drawio (file): laid out diagram, which can be opened in draw.io directly.
+        run_metrics (dict): metrics of the run
     '''
 
-    token = get_app_token(username=user, password=pwd, client_id=client, tenant_id=tenant)
-    group_df = download_content_df(token, 'groups')
-    selected_groups = select_groups(group_df, ws_names)
-    output_all = pd.DataFrame()
-
-    # iterate over selected workspaces
-    for row in selected_groups.itertuples():
-        print(row.name)
-        
-        # placeholders
-        output = pd.DataFrame()
-        data_dict = {}
-        missing_cat = []
-        
-        # loop for data download
-        for cat in ['users', 'dataflows', 'datasets', 'reports', 'dashboards']:
-            url_base = f'groups/{row.id}/{cat}'
-            content = download_content_df(token, url_base)
-            
-            # if category is missing, note it and continue to next
-            if content.empty:
-                missing_cat.append(cat)
-                continue
-            else:
-                data_dict[cat] = content
-            
-            if cat in ['dataflows', 'datasets']:
-                content_ext = download_specific_content_df(url_base, content['id'], 'datasources', token, cat) 
-                data_dict[cat+'_datasources'] = content_ext
-            
-            if cat in ['datasets']:
-                # get links from dataset to dataflows
-                url_base_ext = url_base + f'/upstreamdataflows'
-                content_ext = download_content_df(token, url_base_ext)
-                data_dict[cat+'_upstreamdataflows'] = content_ext
-                
-            if cat in ['dashboards']:
-                content_ext = download_specific_content_df(url_base, content['id'], 'tiles', token, cat) 
-                data_dict[cat+'_datasources'] = content_ext
-        
-        # if workspace is empty (has only usage-monitoring datasets and reports), continue to the next workspace
-        if 'identifier' not in data_dict['users'].columns:
-            continue
-        
-        ''' USERS '''
-        
-        if 'users' not in missing_cat:
-            users = data_dict['users']
-            users['id'] = users['groupUserAccessRight'] + ':' + users['identifier']
-            users = users.loc[:,['id', 'displayName']]
-            users = users[users['id'].str.contains('@')]
-            users['type'] = 'users'
-            users = users.rename(columns = {'displayName': 'name'})
-            
-            output = pd.concat([output, users])
-            
-        ''' DATAFLOWS '''
-        
-        if 'dataflows' not in missing_cat:
-            dataflows = data_dict['dataflows']
-            dataflows = dataflows.loc[:,['id', 'name']]
-            dataflows['type'] = 'dataflows'
-            dataflows['parent'] = row.id
-
-            ''' DATAFLOWS DATASOURCES '''
-
-            dataflows_datasources = retrieve_data_set_or_flow_sources(data_dict, 'dataflows', row)
-            
-            output = pd.concat([output, dataflows, dataflows_datasources])
-        
-        ''' DATASETS '''
-        
-        if 'datasets' not in missing_cat:
-            datasets = data_dict['datasets']
-            datasets = datasets.loc[:,['id', 'name', 'configuredBy']]
-            datasets['type'] = 'datasets'
-            datasets = datasets.rename(columns = {'configuredBy': 'relatives'})
-
-            datasets_upstream = data_dict['datasets_upstreamdataflows']
-    #         shared_workspaces = list(datasets_upstream['workspaceObjectId'].unique())
-    #         shared_workspaces.remove(row.id)
-            
-            # upstream is empty, when there are no original datasets (only shared datasets), but other resources exist
-            if not datasets_upstream.empty:
-                datasets_upstream = datasets_upstream.groupby('datasetObjectId').agg({'dataflowObjectId': join_strings,
-                                                            'workspaceObjectId': join_strings}).reset_index()
-                datasets_upstream = datasets_upstream.rename(columns = {'datasetObjectId': 'id', 'dataflowObjectId': 'relatives',
-                                                                        'workspaceObjectId': 'parent'})
-                datasets = pd.merge(datasets, datasets_upstream, on = 'id', how = 'left')
-                datasets['parent'] = datasets['parent'].fillna(row.id)
-                datasets['relatives'] = (datasets['relatives_x'] + ',' + datasets['relatives_y'].fillna(',')).replace(r',,', '', regex=True)
-                datasets = datasets.drop(columns = ['relatives_x', 'relatives_y'])
-            else:
-                datasets['parent'] = row.id
-
-            ''' DATASETS DATASOURCES '''
-
-            datasets_datasources = retrieve_data_set_or_flow_sources(data_dict, 'datasets', row)
-            
-            output = pd.concat([output, datasets, datasets_datasources])     
-        
-        ''' REPORTS '''
-        
-        if 'reports' not in missing_cat:
-            reports = data_dict['reports']
-            reports = reports.loc[:,['id', 'name', 'datasetId']]
-            reports['type'] = 'reports'
-            reports = reports.rename(columns = {'datasetId': 'parent'})
-            reports['parent'] = row.id + ',' + reports['parent']
-            
-            output = pd.concat([output, reports])
-            
-        ''' DASHBOARDS '''
-        
-        if 'dashboards' not in missing_cat:
-            dashboards = data_dict['dashboards']
-            dashboards = dashboards.loc[:,['id', 'displayName']]
-            dashboards['type'] = 'dashboards'
-            dashboards = dashboards.rename(columns = {'displayName': 'name'})
-
-            dashboards_datasources = data_dict['dashboards_datasources'].fillna(',')
-            dashboards_datasources = dashboards_datasources.groupby('dashboardsId').agg({'reportId': join_strings,
-                                                                'datasetId': join_strings}).reset_index().replace(r',,', '', regex=True)
-            dashboards_datasources['parent'] = dashboards_datasources['reportId'] + ',' + dashboards_datasources['datasetId']
-            dashboards_datasources = dashboards_datasources.drop(columns = ['reportId', 'datasetId'])
-            dashboards_datasources = dashboards_datasources.rename(columns = {'dashboardsId': 'id'})
-            
-            dashboards = pd.merge(dashboards, dashboards_datasources, on ='id', how = 'left')
-            dashboards['parent'] = dashboards['parent'].fillna(row.id) 
-            
-            output = pd.concat([output, dashboards])
-        
-        ''' WORKSPACE & OUTPUT '''
-        
-        # add workspace row to the dataframe
-        output = output.append({'id': row.id, 'name':row.name, 'type': 'workspaces', 'relatives': join_strings(users['id'].unique())},
-                            ignore_index=True)
-        # in case drawio has problems with reading special characters, take ids between quotation marks
-        output['id'] = '"' + output['id'] + '"'
-        output = pd.merge(output, html_spec, on = 'type', how = 'left')
-        
-        output_all = pd.concat([output_all, output])
-
-    # avoid duplicates and sort df for easier version controll
-    output_all = output_all.drop_duplicates().sort_values(by = ['type', 'id'])
+    policy = policy or RequestPolicy()
+    metrics = RunMetrics()
+
+    # download data of the selected workspaces and transform it into draw.io format
+    with get_app_client(username=user, password=pwd, client_id=client, tenant_id=tenant, max_workers=max_workers,
+                        policy=policy, cache=cache, api_url=api_url, metrics=metrics, scheduler=scheduler) as pbi_client:
+        if focus:
+            graph = execute_focused_load_graph(pbi_client, focus, hops, ws_names, max_workers, categories)
+        elif state_folder:
+            graph = execute_incremental_load_graph(pbi_client, ws_names, FolderStore(state_folder), max_workers, backend, categories)
+        else:
+            graph = execute_load_graph(pbi_client, ws_names, max_workers, backend, categories)
+    print('Request stats:', policy.stats.as_dict())
+    if scheduler is not None:
+        print('Scheduler stats:', scheduler.as_dict())
+    if cache is not None:
+        print('Cache stats:', cache.stats())
+    with metrics.stage('export'):
+        # stream sorted rows with html variables into relationships csv and txt input file for draw.io
+        with open(wd + '/output/drawio_relationships.csv', 'wb') as csv_file, open(wd + '/output/drawio_input.txt', 'wb') as txt_file:
+            sink = DiagramSink(csv_file, txt_file)
+            sink.write_rows(graph.rows())
+            sink.close()
+        with open(wd + '/output/drawio_graph.drawio', 'wb') as file:
+            write_graph_drawio(file, graph, compressed, shard_by = pages, max_page_nodes = max_page_nodes)
+
+    run_metrics = metrics.as_dict()
+    run_metrics['request_policy'] = policy.stats.as_dict()
+    if scheduler is not None:
+        run_metrics['request_scheduler'] = scheduler.as_dict()
+    if profile:
+        print('Run metrics:', json.dumps(run_metrics, indent = 2))
+    return run_metrics
+
+def query(snapshot, resource_id = None, direction = DOWNSTREAM_DIRECTION, depth = None, search = None):
+    '''
+    Answer lineage question from saved relationships csv, without crawling or opening the diagram.
 
-    # saave df as csv and create txt input file for draw.io
-    output_all.to_csv(wd + '/output/drawio_relationships.csv', index = False, sep = ',', encoding = 'CP1250')
-    with open(wd + '/output/drawio_input.txt', 'w') as file:
-        file.write(drawio_spec)
-        file.write(output_all.to_csv(index = False, sep = ',', encoding = 'CP1250').replace('\n','').replace('"""', '"'))
+    Parameters:
+        snapshot (str): path of drawio_relationships.csv
+        resource_id (str): id of the resource to start from
+        direction (str): 'downstream' (what breaks when the resource changes), 'upstream' (what it depends on) or 'both'
+        depth (int): maximal number of hops, unlimited when None
+        search (str): instead of a query, list resources with the text in name or id
+    '''
+    with open(snapshot, 'rb') as file:
+        index = LineageIndex.from_csv(file)
+    resources = index.find(search) if search else index.query(resource_id, direction, depth)
+    print(pd.DataFrame(resources, columns = ['id', 'name', 'type'] + ([] if search else ['distance'])).to_string(index = False))
 
 if __name__ == "__main__":
 
-    parser = argparse.ArgumentParser(description='Create a Power BI resource graph')
-    parser.add_argument('--user', required=True)
-    parser.add_argument('--client', required=True, help='client id')
-    parser.add_argument('--tenant', required=True, help='tenant id')
+    # without a command the tenant is crawled, query command answers lineage questions from the saved graph
+    parser = argparse.ArgumentParser(description='Create a Power BI resource graph',
+                                     epilog='Run "create_graph.py query -h" for options of the query command.')
+    parser.add_argument('--user')
+    parser.add_argument('--client', help='client id')
+    parser.add_argument('--tenant', help='tenant id')
     parser.add_argument('--ws_names', nargs="*", help='list of workspaces')
-    
-    args = parser.parse_args()
-    pwd = getpass("User password:")
+    parser.add_argument('--max_workers', type=int, default=MAX_WORKERS, help='number of API calls running at the same time')
+    parser.add_argument('--timeout', type=float, default=120, help='timeout of single API call in seconds')
+    parser.add_argument('--max_retries', type=int, default=5, help='how many times failed or throttled API call is repeated')
+    parser.add_argument('--backoff_max', type=float, default=60, help='maximal seconds between retries, longer Retry-After is cut to it')
+    parser.add_argument('--backend', choices=['rest', 'scanner'], default='rest', help='scanner uses admin workspace scans')
+    parser.add_argument('--incremental', metavar='STATE_FOLDER', help='keep workspace data in the folder and download only changed workspaces')
+    parser.add_argument('--cache_dir', help='keep API responses in the folder and reuse them in next runs')
+    parser.add_argument('--cache_ttl', type=float, default=24, help='hours after which cached response expires')
+    parser.add_argument('--cache_max_mb', type=int, default=500, help='maximal size of the cache in MB')
+    parser.add_argument('--replay', action='store_true', help='build graph only from cached responses, without calling API')
+    parser.add_argument('--compress', action='store_true', help='save .drawio file compressed')
+    parser.add_argument('--pages', choices=['workspace', 'component'], help='split .drawio diagram into linked pages')
+    parser.add_argument('--max_page_nodes', type=int, default=MAX_PAGE_NODES, help='maximal number of resources on one page')
+    parser.add_argument('--hedge_percentile', type=float, help='send duplicate of API call slower than this latency percentile (0-1)')
+    parser.add_argument('--categories', nargs='+', choices=FETCH_CATEGORIES, help='download and diagram only these categories')
+    parser.add_argument('--focus', nargs='+', metavar='ID', help='diagram only items within --hops of these items (ids or workspace_id/item_id)')
+    parser.add_argument('--hops', type=int, default=DEFAULT_HOPS, help='how far from --focus items lineage is followed')
+    parser.add_argument('--rate_limit', type=float, help='maximal API calls per second of the user, lowered after throttling')
+    parser.add_argument('--rate_state', metavar='FILE', help='share --rate_limit budget with other runs through the state file')
+    parser.add_argument('--api_url', help='call other API than PBI Service without signing in, for example local mock of the API')
+    parser.add_argument('--profile', action='store_true', help='print stage timings, request metrics and peak memory of the run as JSON')
+    parser.add_argument('--cprofile', metavar='FILE', help='also profile the run with cProfile and save the stats into the file')
+    commands = parser.add_subparsers(dest='command', title='commands')
+    query_parser = commands.add_parser('query', help='query lineage of the saved graph', description='Query lineage of the saved graph')
+    query_parser.add_argument('--id', help='id of the resource (dataflow, dataset, datasource, ...)')
+    query_parser.add_argument('--search', help='find resources by name or id instead')
+    query_parser.add_argument('--direction', choices=[DOWNSTREAM_DIRECTION, UPSTREAM_DIRECTION, BOTH_DIRECTIONS], default=DOWNSTREAM_DIRECTION)
+    query_parser.add_argument('--depth', type=int, help='maximal number of hops (k-hop query)')
+    query_parser.add_argument('--snapshot', default=os.path.join(wd, 'output', 'drawio_relationships.csv'), help='relationships csv file')
 
-    main(args.user, pwd, args.client, args.tenant, args.ws_names)
\ No newline at end of file
+    args = parser.parse_args()
+    if args.command == 'query':
+        if not (args.id or args.search):
+            query_parser.error('--id or --search is required')
+        query(args.snapshot, args.id, args.direction, args.depth, args.search)
+        sys.exit()
+    missing = [option for option in ('user', 'client', 'tenant') if getattr(args, option) is None]
+    if missing:
+        parser.error('the following arguments are required: ' + ', '.join('--' + option for option in missing))
+    if args.replay and not args.cache_dir:
+        parser.error('--replay requires --cache_dir')
+    if args.replay and args.backend == 'scanner':
+        parser.error('--replay does not work with --backend scanner, workspace scans are never cached')
+    if args.replay and args.incremental:
+        parser.error('--replay does not work with --incremental, changes since the previous run are not cached')
+    pwd = None if args.replay or args.api_url else getpass("User password:")
+    cache = None
+    if args.cache_dir:
+        cache = ResponseCache(args.cache_dir, ttl=args.cache_ttl * 3600, max_bytes=args.cache_max_mb * 1024 ** 2, replay=args.replay)
+
+    policy = RequestPolicy(timeout=args.timeout, max_retries=args.max_retries, backoff_max=args.backoff_max,
+                           hedge_percentile=args.hedge_percentile)
+    scheduler = None
+    if args.rate_limit or args.rate_state:
+        rates = {IDENTITY: args.rate_limit} if args.rate_limit else None
+        scheduler = RequestScheduler(args.user, rates, FileBudgetStore(args.rate_state) if args.rate_state else None)
+
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler is not None:
+        profiler.enable()
+    main(args.user, pwd, args.client, args.tenant, args.ws_names, args.max_workers, policy, args.backend, args.incremental, cache,
+         args.compress, args.pages, args.max_page_nodes, args.api_url, args.profile or profiler is not None, scheduler, args.focus, args.hops,
+         args.categories)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+        # functions taking the most time, the whole stats can be browsed with snakeviz or pstats
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
\ No newline at end of file